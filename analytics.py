@@ -0,0 +1,149 @@
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from database import Database, LRUCache
+from money import DEFAULT_CURRENCY, UnknownCurrencyError
+
+FRAME_COLUMNS = ['date', 'type', 'category', 'amount', 'currency', 'description', 'user_id']
+
+
+class AnalyticsEngine:
+    """Векторизованная аналитика по транзакциям с кэшем DataFrame на пользователя/семью"""
+
+    def __init__(self, db: Database, max_frames: int = None, ttl: float = None):
+        self.db = db
+        self.frames = LRUCache(
+            max_size=max_frames or int(os.getenv('ANALYTICS_CACHE_SIZE', 64)),
+            ttl=ttl or float(os.getenv('ANALYTICS_CACHE_TTL', 300))
+        )
+        # Сброс кэша при записи в этом процессе; изменения из других процессов ограничены TTL
+        db.add_listener(self.invalidate)
+
+    def invalidate(self, change: Dict):
+        """Слушатель Database: сброс кадров затронутого пользователя и семьи"""
+        self.frames.invalidate(('user', change['user_id']))
+        if change.get('family_id'):
+            self.frames.invalidate(('family', change['family_id']))
+
+    def frame(self, user_id: int = None, family_id: int = None) -> pd.DataFrame:
+        """Транзакции пользователя или семьи в виде DataFrame (загружаются один раз)"""
+        key = ('family', family_id) if family_id is not None else ('user', user_id)
+        frame = self.frames.get(key)
+        if frame is None:
+            rows = self.db.iter_transactions(user_id=user_id, family_id=family_id)
+            frame = pd.DataFrame.from_records(rows, columns=FRAME_COLUMNS)
+            frame['date'] = pd.to_datetime(frame['date'], format='mixed')
+            frame['amount'] = self._to_base_currency(frame['amount'].astype('float64'), frame['currency'])
+            frame['type'] = frame['type'].astype('category')
+            frame['category'] = frame['category'].astype('category')
+            frame['description'] = frame['description'].fillna('').str.strip()
+            self.frames.set(key, frame)
+        return frame
+
+    def _to_base_currency(self, amounts: pd.Series, currencies: pd.Series) -> pd.Series:
+        """Векторный пересчет сумм в DEFAULT_CURRENCY по курсам из currency_rates"""
+        present = set(currencies.unique())
+        if present <= {DEFAULT_CURRENCY}:
+            return amounts
+        rates = self.db.get_currency_rates()
+        missing = present - set(rates)
+        if missing or DEFAULT_CURRENCY not in rates:
+            raise UnknownCurrencyError(f'No rate for {", ".join(sorted(missing or {DEFAULT_CURRENCY}))}')
+        factors = currencies.map({currency: rates[currency] / rates[DEFAULT_CURRENCY] for currency in present})
+        return amounts * factors.to_numpy(dtype='float64')
+
+    def trends(self, user_id: int = None, family_id: int = None, months: int = 12,
+               window: int = 3) -> Dict:
+        """Помесячные итоги, изменение к прошлому месяцу и скользящее среднее"""
+        return monthly_trends(self.frame(user_id, family_id), months, window)
+
+    def category_percentiles(self, user_id: int = None, family_id: int = None,
+                             percentiles: Sequence[int] = (50, 75, 90, 95)) -> List[Dict]:
+        return category_percentiles(self.frame(user_id, family_id), percentiles)
+
+    def top_merchants(self, user_id: int = None, family_id: int = None, limit: int = 10) -> List[Dict]:
+        return top_merchants(self.frame(user_id, family_id), limit)
+
+
+def _clean(value):
+    """NaN/inf -> None для JSON"""
+    return None if value is None or not np.isfinite(value) else round(float(value), 2)
+
+
+def monthly_trends(frame: pd.DataFrame, months: int = 12, window: int = 3) -> Dict:
+    """Помесячные доходы/расходы, MoM-изменение в % и скользящее среднее расходов"""
+    if frame.empty:
+        return {'months': []}
+
+    monthly = (
+        frame.assign(month=frame['date'].dt.to_period('M'))
+        .pivot_table(index='month', columns='type', values='amount', aggfunc='sum',
+                     fill_value=0.0, observed=True)
+        .reindex(columns=['income', 'expense'], fill_value=0.0)
+    )
+    # Месяцы без операций тоже нужны, иначе сдвиг и окно считаются неверно
+    monthly = monthly.reindex(pd.period_range(monthly.index.min(), monthly.index.max(), freq='M'),
+                              fill_value=0.0)
+
+    monthly['balance'] = monthly['income'] - monthly['expense']
+    previous = monthly[['income', 'expense']].shift(1).replace(0.0, np.nan)
+    monthly['income_change_pct'] = (monthly['income'] / previous['income'] - 1) * 100
+    monthly['expense_change_pct'] = (monthly['expense'] / previous['expense'] - 1) * 100
+    monthly['expense_rolling_avg'] = monthly['expense'].rolling(window, min_periods=1).mean()
+
+    monthly = monthly.tail(months)
+    return {
+        'window': window,
+        'months': [
+            {'month': str(month), **{column: _clean(value) for column, value in row.items()}}
+            for month, row in monthly.iterrows()
+        ]
+    }
+
+
+def category_percentiles(frame: pd.DataFrame, percentiles: Sequence[int] = (50, 75, 90, 95)) -> List[Dict]:
+    """Перцентили суммы одной операции по категориям расходов"""
+    expenses = frame[frame['type'] == 'expense']
+    if expenses.empty:
+        return []
+
+    grouped = expenses.groupby('category', observed=True)['amount']
+    quantiles = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    summary = grouped.agg(['sum', 'count', 'mean']).join(quantiles)
+    summary = summary.sort_values('sum', ascending=False)
+
+    return [
+        {
+            'category': category,
+            'total': _clean(row['sum']),
+            'count': int(row['count']),
+            'mean': _clean(row['mean']),
+            'percentiles': {f'p{p}': _clean(row[p / 100]) for p in percentiles}
+        }
+        for category, row in summary.iterrows()
+    ]
+
+
+def top_merchants(frame: pd.DataFrame, limit: int = 10) -> List[Dict]:
+    """Крупнейшие получатели расходов (по описанию операции)"""
+    expenses = frame[(frame['type'] == 'expense') & (frame['description'] != '')]
+    if expenses.empty:
+        return []
+
+    merchants = expenses['description'].str.lower()
+    summary = expenses.groupby(merchants)['amount'].agg(['sum', 'count'])
+    total = expenses['amount'].sum()
+    summary = summary.nlargest(limit, 'sum')
+
+    return [
+        {
+            'merchant': merchant,
+            'total': _clean(row['sum']),
+            'count': int(row['count']),
+            'share_pct': _clean(row['sum'] / total * 100)
+        }
+        for merchant, row in summary.iterrows()
+    ]
@@ -1,15 +1,92 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from flask_cors import CORS
-from database import Database
+import startup
+
+with startup.step('import flask'):
+    from flask import (Flask, Response, render_template, request, jsonify, send_file, send_from_directory,
+                       stream_with_context)
+    from flask_cors import CORS
+with startup.step('import app modules'):
+    from charts import CHART_FORMATS, ChartCache, ChartsUnavailable
+    from database import Database, IdempotencyKeyConflict, PoolTimeoutError, decode_cursor, parse_month
+    from events import EventBroker, TooManySubscribers, sse_stream
+    from exporter import EXPORT_FORMATS
+    from importer import iter_import_rows
+    from metrics import RequestMetrics, flatten_gauges
+    from money import UnknownCurrencyError, normalize_currency
+    from webhook_queue import DUPLICATE, FULL, INVALID, UpdateQueue, WebhookDispatcher
+import csv
+import hashlib
+import logging
 import os
+import sqlite3
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)
-db = Database()
+with startup.step('database'):
+    db = Database()
 
 # Конфигурация
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 200))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+# Меняется вместе с форматом ответов API, чтобы клиенты не получили 304 на старое тело
+ETAG_VERSION = '1'
+
+# Push-уведомления: каждый SSE-поток занимает поток waitress на SSE_MAX_DURATION, поэтому число подключений
+# ограничено. Лимит должен оставлять потоки под обычные запросы: не больше половины --threads (render.yaml)
+broker = EventBroker(max_subscribers=int(os.getenv('SSE_MAX_CONNECTIONS', 2)))
+db.add_listener(broker.publish_change)
+
+
+def _create_analytics():
+    from analytics import AnalyticsEngine
+    return AnalyticsEngine(db)
+
+
+# pandas/numpy грузятся при первом аналитическом запросе, а не при холодном старте
+analytics = startup.Lazy('analytics', _create_analytics)
+if os.getenv('ANALYTICS_PRELOAD', '0') == '1':
+    analytics.preload()
+
+# Графики отчетов: matplotlib импортируется при первом рендере, файлы кэшируются по хэшу агрегатов
+charts = ChartCache()
+
+# Задержка по маршрутам, запросы к БД на запрос и выборочный cProfile медленных запросов
+metrics = RequestMetrics(app, db)
+
+# Входящие обновления Telegram: быстрый ответ, обработка в фоновом пуле
+webhook_updates = UpdateQueue(
+    max_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)),
+    db=db if os.getenv('WEBHOOK_SPOOL') == '1' else None
+)
+
+
+webhook_bot = None
+
+
+def _create_webhook_dispatcher():
+    global webhook_bot
+    from bot import FamilyFinanceBot
+
+    webhook_bot = FamilyFinanceBot(os.getenv('TELEGRAM_BOT_TOKEN'), db=db, analytics=analytics, charts=charts)
+    dispatcher = WebhookDispatcher(
+        webhook_updates,
+        webhook_bot.build_application,
+        workers=int(os.getenv('WEBHOOK_WORKERS', 4))
+    )
+    dispatcher.start()
+    return dispatcher
+
+
+# Обработчики бота в этом процессе, если задан токен. python-telegram-bot грузится при первом
+# обновлении, а не при холодном старте; Lazy не даст двум первым запросам запустить два диспетчера
+webhook_dispatcher = None
+if os.getenv('TELEGRAM_BOT_TOKEN'):
+    webhook_dispatcher = startup.Lazy('webhook dispatcher', _create_webhook_dispatcher)
+
+startup.ready()
 
 
 @app.route('/')
@@ -18,16 +95,109 @@ def index():
     return render_template('index.html')
 
 
+@app.errorhandler(UnknownCurrencyError)
+def unknown_currency(error):
+    """Нет курса для пересчета (аналитика по операциям в нескольких валютах)"""
+    return jsonify({'error': str(error)}), 400
+
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_error(error):
+    """Блокировка SQLite под нагрузкой: клиент может повторить запрос"""
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        logger.warning(f"{request.method} {request.path}: {message}")
+        return jsonify({'error': 'database is locked'}), 503, {'Retry-After': '1'}
+    logger.exception(f"{request.method} {request.path}: database error")
+    return jsonify({'error': 'Database error'}), 500
+
+
+@app.errorhandler(PoolTimeoutError)
+def pool_timeout(error):
+    """Все подключения пула заняты дольше DB_POOL_TIMEOUT"""
+    logger.warning(f"{request.method} {request.path}: {error}")
+    return jsonify({'error': 'connection pool exhausted'}), 503, {'Retry-After': '1'}
+
+
+def bot_stats():
+    """Очередь пула потоков БД бота (ожидание, занятость) и планировщик исходящих; None до запуска бота"""
+    if webhook_bot is None:
+        return None
+    return {'db_executor': webhook_bot.db.stats(), 'outbox': webhook_bot.outbox.stats()}
+
+
+def webhook_dispatcher_stats():
+    """Состояние диспетчера бота; None, если он не настроен или еще не запускался"""
+    if webhook_dispatcher is None or not webhook_dispatcher.loaded:
+        return None
+    return webhook_dispatcher.get().stats()
+
+
 @app.route('/health')
 def health():
     """Health check для Render"""
+    dispatcher = webhook_dispatcher_stats()
+    healthy = db.pool.health_check() and (dispatcher is None or dispatcher['alive'])
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if healthy else 'degraded',
         'service': 'Family Finance Bot',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'database': db.pool_stats(),
+        'user_cache': db.user_cache.stats(),
+        'events': broker.stats(),
+        'webhook': webhook_updates.stats(),
+        'webhook_dispatcher': dispatcher,
+        'bot': bot_stats(),
+        'group_commit': db.writer.stats() if db.writer is not None else None,
+        'charts': charts.stats(),
+        'routes': metrics.summary(),
+        'startup': startup.report()
     })
 
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Метрики в формате Prometheus"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    gauges = {}
+    gauges.update(flatten_gauges('db_pool', db.pool_stats()))
+    gauges.update(flatten_gauges('user_cache', db.user_cache.stats()))
+    gauges.update(flatten_gauges('events', broker.stats()))
+    gauges.update(flatten_gauges('webhook', webhook_updates.stats()))
+    dispatcher = webhook_dispatcher_stats()
+    if dispatcher is not None:
+        gauges.update(flatten_gauges('webhook_dispatcher', dispatcher))
+        gauges['webhook_dispatcher_alive'] = int(dispatcher['alive'])
+    gauges.update(flatten_gauges('bot', bot_stats()))
+    if db.writer is not None:
+        gauges.update(flatten_gauges('group_commit', db.writer.stats()))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+def data_etag(user: dict, *parts) -> str:
+    """Слабый ETag: версия данных пользователя, параметры запроса и все, от чего еще зависит ответ"""
+    version = db.get_data_version(user_id=user['id'])
+    key = ':'.join(str(part) for part in (ETAG_VERSION, user['id'], version, request.query_string, *parts))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+def not_modified(etag: str):
+    """Ответ 304, если клиент уже видел эту версию (If-None-Match)"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(Response(status=304), etag)
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.set_etag(etag, weak=True)
+    # Браузер обязан перепроверять ответ: данные меняются при записи из бота и других устройств
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 # API для фронтенда
 @app.route('/api/init', methods=['POST'])
 def init_app():
@@ -63,8 +233,39 @@ def transactions():
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        transactions_list = db.get_user_transactions(user['id'])
-        return jsonify(transactions_list)
+        # Курсор и дата проверяются до ETag: на некорректный запрос — 400, а не 304
+        try:
+            if request.args.get('cursor'):
+                decode_cursor(request.args['cursor'])
+            if request.args.get('date') and request.args.get('date') != 'all':
+                datetime.strptime(request.args['date'], '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor or date'}), 400
+
+        # Пока данные пользователя не менялись, страница та же: ответ 304 без выборки
+        etag = data_etag(user)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        limit = min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE)
+        filters = {
+            key: request.args.get(key)
+            for key in ('type', 'category', 'date', 'search')
+            if request.args.get(key) and request.args.get(key) != 'all'
+        }
+
+        try:
+            page = db.get_transactions_page(
+                user['id'],
+                limit=max(limit, 1),
+                cursor=request.args.get('cursor'),
+                **filters
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor or date'}), 400
+
+        return with_etag(jsonify(page), etag)
 
     elif request.method == 'POST':
         data = request.json
@@ -77,14 +278,26 @@ def transactions():
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        transaction_id = db.add_transaction(
-            user_id=user['id'],
-            amount=data['amount'],
-            category=data['category'],
-            type=data['type'],
-            description=data.get('description', ''),
-            family_id=user.get('family_id')
-        )
+        # Повтор запроса с тем же ключом (таймаут, повторная отправка формы) не создает дубль
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key and len(idempotency_key) > 255:
+            return jsonify({'error': 'Idempotency key too long'}), 400
+
+        try:
+            transaction_id = db.add_transaction(
+                user_id=user['id'],
+                amount=data['amount'],
+                category=data['category'],
+                type=data['type'],
+                description=data.get('description', ''),
+                family_id=user.get('family_id'),
+                idempotency_key=idempotency_key,
+                currency=data.get('currency')
+            )
+        except IdempotencyKeyConflict:
+            return jsonify({'error': 'Idempotency key reused with different payload'}), 422
+        except ValueError:
+            return jsonify({'error': 'Invalid amount or currency'}), 400
 
         return jsonify({
             'success': True,
@@ -92,6 +305,146 @@ def transactions():
         })
 
 
+@app.route('/api/transactions/import', methods=['POST'])
+def import_transactions():
+    """Массовый импорт транзакций из JSON-массива, NDJSON или CSV"""
+    telegram_id = request.args.get('telegram_id', type=int) or request.form.get('telegram_id', type=int)
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Файл из формы Werkzeug держит на диске; сырое тело читаем напрямую из потока
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        content_type = upload.mimetype or ''
+        if upload.filename and upload.filename.lower().endswith('.csv'):
+            content_type = 'text/csv'
+    else:
+        stream = request.stream
+        content_type = request.mimetype or ''
+
+    try:
+        stats = db.add_transactions_bulk(
+            user['id'],
+            (row for _, row in iter_import_rows(stream, content_type)),
+            family_id=user.get('family_id')
+        )
+    except (ValueError, UnicodeDecodeError, csv.Error) as error:
+        return jsonify({'error': f'Malformed import file: {error}'}), 400
+
+    return jsonify({
+        'success': True,
+        **stats
+    })
+
+
+@app.route('/api/transactions/<int:transaction_id>', methods=['PUT', 'DELETE'])
+def transaction_detail(transaction_id):
+    """Изменение и удаление транзакции"""
+    data = request.get_json(silent=True) or {}
+    telegram_id = data.get('telegram_id') or request.args.get('telegram_id', type=int)
+
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    if request.method == 'DELETE':
+        success = db.delete_transaction(user['id'], transaction_id)
+    else:
+        try:
+            success = db.update_transaction(user['id'], transaction_id, **data)
+        except ValueError as error:
+            return jsonify({'error': str(error) or 'Invalid amount or currency'}), 400
+
+    if not success:
+        return jsonify({'error': 'Transaction not found'}), 404
+
+    return jsonify({'success': True, 'transaction_id': transaction_id})
+
+
+@app.route('/api/sync', methods=['POST'])
+def sync():
+    """Дельта-синхронизация по курсору журнала изменений"""
+    data = request.json
+    telegram_id = data.get('telegram_id')
+
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    since = data.get('cursor')
+    try:
+        limit = int(data.get('limit') or SYNC_PAGE_SIZE)
+        if since is not None:
+            since = int(since)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    if since is not None and since < 0:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    # Отрицательный limit в SQL снимает ограничение, а has_more при этом зациклил бы клиента
+    limit = max(1, min(limit, SYNC_PAGE_SIZE))
+
+    if since is None:
+        # Первый запуск: клиент загружает данные целиком, отдаем только текущую позицию
+        updates = {'transactions': [], 'deleted': [], 'count': 0,
+                   'cursor': db.get_sync_cursor(), 'has_more': False}
+    else:
+        updates = db.get_updates_since(user['id'], since, limit, user.get('family_id'))
+
+    return jsonify({
+        'success': True,
+        'updates': updates,
+        'cursor': updates['cursor'],
+        'has_more': updates['has_more'],
+        'server_time': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/events')
+def events():
+    """SSE-поток уведомлений об изменениях транзакций пользователя и его семьи"""
+    telegram_id = request.args.get('telegram_id', type=int)
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    keys = [f"user:{user['id']}"]
+    if user.get('family_id'):
+        keys.append(f"family:{user['family_id']}")
+
+    try:
+        subscription = broker.subscribe(keys)
+    except TooManySubscribers:
+        # Клиент переключается на периодический опрос /api/sync
+        return jsonify({'error': 'Too many event streams'}), 503, {'Retry-After': '60'}
+
+    response = Response(
+        stream_with_context(sse_stream(
+            subscription,
+            heartbeat=float(os.getenv('SSE_HEARTBEAT', 15)),
+            max_duration=float(os.getenv('SSE_MAX_DURATION', 300))
+        )),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Генератор не запускается на HEAD и при обрыве до первой записи: слот освобождается при закрытии ответа
+    response.call_on_close(subscription.close)
+    return response
+
+
 @app.route('/api/reports/monthly')
 def monthly_report():
     """API для месячного отчета"""
@@ -103,10 +456,210 @@ def monthly_report():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    report = db.get_monthly_report(user['id'])
+    month = request.args.get('month')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    try:
+        currency = normalize_currency(request.args.get('currency'))
+    except ValueError:
+        return jsonify({'error': 'Invalid currency'}), 400
+
+    # Параметры проверяются до ETag: на некорректный запрос — 400, а не 304 по If-None-Match
+    year = month_number = None
+    if month and not (start_date and end_date):
+        try:
+            year, month_number = parse_month(month)
+        except ValueError:
+            return jsonify({'error': 'month must be in YYYY-MM format'}), 400
+
+    # Отчет без месяца — за текущий; суммы в других валютах пересчитываются по курсам
+    etag = data_etag(user, datetime.utcnow().strftime('%Y-%m'), sorted(db.get_currency_rates().items()))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    try:
+        if start_date and end_date:
+            report = db.get_period_report(user['id'], start_date, end_date, currency=currency)
+        else:
+            report = db.get_monthly_report(user['id'], year, month_number, currency=currency)
+    except UnknownCurrencyError as error:
+        return jsonify({'error': str(error)}), 400
+
+    return with_etag(jsonify(report), etag)
+
+
+@app.route('/api/reports/family')
+def family_report():
+    """Семейный отчет: итоги, участники и категории"""
+    telegram_id = request.args.get('telegram_id', type=int)
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    if not user.get('family_id'):
+        return jsonify({'error': 'User is not in a family'}), 400
+
+    month = request.args.get('month')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    try:
+        currency = normalize_currency(request.args.get('currency'))
+    except ValueError:
+        return jsonify({'error': 'Invalid currency'}), 400
+
+    try:
+        if start_date and end_date:
+            report = db.get_family_period_report(user['family_id'], start_date, end_date, currency=currency)
+        elif month:
+            year, month_number = parse_month(month)
+            report = db.get_family_report(user['family_id'], year, month_number, currency=currency)
+        else:
+            report = db.get_family_report(user['family_id'], currency=currency)
+    except UnknownCurrencyError as error:
+        return jsonify({'error': str(error)}), 400
+    except ValueError:
+        return jsonify({'error': 'month must be in YYYY-MM format'}), 400
+
     return jsonify(report)
 
 
+def _analytics_scope():
+    """Пользователь и область (user/family) для аналитических отчетов"""
+    telegram_id = request.args.get('telegram_id', type=int)
+    if not telegram_id:
+        return None, (jsonify({'error': 'telegram_id required'}), 400)
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return None, (jsonify({'error': 'User not found'}), 404)
+
+    if request.args.get('scope') == 'family':
+        if not user.get('family_id'):
+            return None, (jsonify({'error': 'User is not in a family'}), 400)
+        return {'family_id': user['family_id']}, None
+    return {'user_id': user['id']}, None
+
+
+@app.route('/api/reports/trends')
+def trends_report():
+    """Помесячная динамика доходов и расходов"""
+    scope, error = _analytics_scope()
+    if error:
+        return error
+
+    months = min(request.args.get('months', 12, type=int), 120)
+    window = min(request.args.get('window', 3, type=int), 24)
+    return jsonify(analytics.trends(months=max(months, 1), window=max(window, 1), **scope))
+
+
+@app.route('/api/reports/percentiles')
+def percentiles_report():
+    """Перцентили сумм расходов по категориям"""
+    scope, error = _analytics_scope()
+    if error:
+        return error
+
+    return jsonify({'categories': analytics.category_percentiles(**scope)})
+
+
+@app.route('/api/reports/merchants')
+def merchants_report():
+    """Крупнейшие получатели расходов"""
+    scope, error = _analytics_scope()
+    if error:
+        return error
+
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify({'merchants': analytics.top_merchants(limit=max(limit, 1), **scope)})
+
+
+@app.route('/api/charts/<kind>')
+def chart(kind):
+    """PNG/SVG график отчета: категории расходов за месяц (categories) или динамика по месяцам (trend)"""
+    if kind not in ('categories', 'trend'):
+        return jsonify({'error': 'Unknown chart'}), 404
+
+    scope, error = _analytics_scope()
+    if error:
+        return error
+
+    chart_format = request.args.get('format', 'png')
+    if chart_format not in CHART_FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(CHART_FORMATS)}'}), 400
+
+    try:
+        currency = normalize_currency(request.args.get('currency'))
+        year, month_number = parse_month(request.args['month']) if request.args.get('month') else (None, None)
+    except ValueError:
+        return jsonify({'error': 'Invalid currency or month'}), 400
+
+    try:
+        if kind == 'categories':
+            if 'family_id' in scope:
+                report = db.get_family_report(scope['family_id'], year, month_number, currency=currency)
+            else:
+                report = db.get_monthly_report(scope['user_id'], year, month_number, currency=currency)
+            path = charts.category_donut(report['categories'], currency, fmt=chart_format)
+        else:
+            months = min(max(request.args.get('months', 12, type=int), 1), 36)
+            totals = db.get_monthly_totals(months=months, year=year, month=month_number, currency=currency, **scope)
+            path = charts.monthly_trend(totals, currency, fmt=chart_format)
+    except ChartsUnavailable as error:
+        return jsonify({'error': str(error)}), 503
+
+    # URL не меняется вместе с данными, поэтому браузер перепроверяет график при каждом показе.
+    # Имя файла — хэш содержимого, он же ETag (mtime меняется при попаданиях в кэш): без изменений ответ 304 без тела
+    etag = os.path.splitext(os.path.basename(path))[0]
+    response = send_file(path, mimetype=CHART_FORMATS[chart_format], conditional=True, etag=etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/api/export')
+def export_transactions():
+    """Потоковая выгрузка истории в CSV или NDJSON"""
+    telegram_id = request.args.get('telegram_id', type=int)
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+
+    user = db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(EXPORT_FORMATS)}'}), 400
+
+    scope = request.args.get('scope', 'user')
+    if scope not in ('user', 'family'):
+        # Значение попадает в имя файла в Content-Disposition
+        return jsonify({'error': 'scope must be one of: user, family'}), 400
+    if scope == 'family' and not user.get('family_id'):
+        return jsonify({'error': 'User is not in a family'}), 400
+
+    rows = db.iter_transactions(
+        user_id=user['id'],
+        family_id=user['family_id'] if scope == 'family' else None,
+        start=request.args.get('start_date'),
+        end=request.args.get('end_date')
+    )
+    chunks, mimetype = EXPORT_FORMATS[export_format]
+    filename = f"transactions_{scope}_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+
+    # Генератор отдает блоки по мере чтения курсора, тело ответа не собирается в памяти
+    return Response(
+        stream_with_context(chunks(rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 @app.route('/api/family/create', methods=['POST'])
 def create_family():
     """Создание семьи"""
@@ -164,14 +717,25 @@ def serve_static(path):
 # Webhook для Telegram бота
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Webhook для Telegram бота"""
-    data = request.json
-    print(f"Webhook received: {data}")
+    """Webhook для Telegram бота: подтверждение сразу, обработка в фоне"""
+    secret = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+    if secret and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+        return jsonify({'error': 'Forbidden'}), 403
+
+    if webhook_dispatcher is not None and not webhook_dispatcher.get().alive:
+        # Бот не инициализировался (сеть, токен): пусть Telegram повторит доставку позже,
+        # а не копит обновления в очереди, которую некому разбирать
+        return jsonify({'status': 'unavailable'}), 503, {'Retry-After': '30'}
+
+    status = webhook_updates.put(request.get_json(silent=True))
 
-    # Здесь будет логика обработки сообщений от Telegram
-    # Пока просто отвечаем OK
+    if status == INVALID:
+        return jsonify({'error': 'update_id required'}), 400
+    if status == FULL:
+        # Telegram повторит доставку, повтор отсечется по update_id
+        return jsonify({'status': 'busy'}), 503, {'Retry-After': '5'}
 
-    return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'duplicate': status == DUPLICATE})
 
 
 if __name__ == '__main__':
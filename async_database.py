@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from database import Database
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database: вызовы выполняются в ограниченном пуле потоков"""
+
+    def __init__(self, db: Database = None, max_workers: int = None):
+        self.db = db or Database()
+        self.max_workers = max_workers or int(os.getenv('BOT_DB_WORKERS', 4))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='db')
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'errors': 0,
+            'pending': 0,
+            'max_pending': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'run_time': 0.0,
+        }
+
+    def _run(self, method, submitted: float, *args, **kwargs):
+        started = time.monotonic()
+        waited = started - submitted
+        with self._lock:
+            self._stats['wait_time'] += waited
+            self._stats['max_wait_time'] = max(self._stats['max_wait_time'], waited)
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats['run_time'] += time.monotonic() - started
+                self._stats['pending'] -= 1
+
+    async def call(self, name: str, *args, **kwargs):
+        """Выполнение метода Database в пуле потоков без блокировки event loop"""
+        return await self.run(getattr(self.db, name), *args, **kwargs)
+
+    async def run(self, method, *args, **kwargs):
+        """Выполнение произвольной синхронной функции в пуле потоков БД"""
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['pending'] += 1
+            self._stats['max_pending'] = max(self._stats['max_pending'], self._stats['pending'])
+
+        loop = asyncio.get_running_loop()
+        task = functools.partial(self._run, method, time.monotonic(), *args, **kwargs)
+        return await loop.run_in_executor(self._executor, task)
+
+    async def add_transaction(self, user_id: int, amount: float, category: str, type: str,
+                              description: str = '', family_id: int = None,
+                              idempotency_key: str = None, currency: str = None) -> int:
+        """При групповом коммите ожидаем Future писателя, не занимая поток пула"""
+        fields = dict(user_id=user_id, amount=amount, category=category, type=type,
+                      description=description, family_id=family_id, idempotency_key=idempotency_key,
+                      currency=currency)
+        if self.db.writer is not None:
+            return await asyncio.wrap_future(self.db.writer.submit(**fields))
+        return await self.call('add_transaction', **fields)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def wrapper(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = attr.__doc__
+        return wrapper
+
+    def stats(self) -> Dict:
+        """Метрики очереди запросов к БД"""
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats['calls'] or 1
+        stats['max_workers'] = self.max_workers
+        stats['avg_wait_ms'] = round(stats['wait_time'] / calls * 1000, 3)
+        stats['avg_run_ms'] = round(stats['run_time'] / calls * 1000, 3)
+        stats['max_wait_ms'] = round(stats.pop('max_wait_time') * 1000, 3)
+        stats['wait_time'] = round(stats['wait_time'], 6)
+        stats['run_time'] = round(stats['run_time'], 6)
+        return stats
+
+    def close(self):
+        """Остановка пула потоков и закрытие подключений"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,157 @@
+import argparse
+import itertools
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import harness
+from benchmarks.synthetic import generate
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class Context:
+    """Общее состояние бенчмарков: база, сгенерированные данные и тестовый клиент Flask"""
+
+    def __init__(self, db, dataset, app_module=None):
+        self.db = db
+        self.dataset = dataset
+        self.app_module = app_module
+        self.client = app_module.app.test_client() if app_module is not None else None
+        self.families = itertools.cycle(dataset.families or [None])
+        # Кэш графиков бенчмарков создается при первом использовании (benchmarks/chart_benchmarks.py)
+        self.chart_cache = None
+        self.chart_directory = None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Воспроизводимые бенчмарки Database и HTTP API')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--family-size', type=int, default=4)
+    parser.add_argument('--transactions', type=int, default=100_000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель числа итераций')
+    parser.add_argument('--only', action='append', help='подстрока имени бенчмарка (можно повторять)')
+    parser.add_argument('--skip-api', action='store_true', help='только методы Database')
+    parser.add_argument('--db', help='файл базы (по умолчанию временный)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='базовая линия для сравнения (benchmarks/baseline.json; записывается --save-baseline '
+                             'на том же наборе данных и той же машине)')
+    parser.add_argument('--save-baseline', action='store_true', help='записать результаты как новую базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимый рост p95 (0.25 = 25%%)')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    return parser.parse_args(argv)
+
+
+def _load_app(log):
+    """Импорт app.py на подготовленной базе; бот и фоновые обработчики не запускаются"""
+    os.environ.pop('TELEGRAM_BOT_TOKEN', None)
+    os.environ.pop('TELEGRAM_WEBHOOK_SECRET', None)
+    os.environ.pop('METRICS_TOKEN', None)
+    try:
+        import app as app_module
+    except ImportError as error:
+        log(f'HTTP benchmarks skipped: {error}')
+        return None
+    return app_module
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    log = print
+
+    workdir = None
+    if args.db:
+        db_path = args.db
+        if os.path.exists(db_path):
+            log(f'{db_path} already exists, refusing to overwrite')
+            return 2
+    else:
+        workdir = tempfile.TemporaryDirectory(prefix='family-finance-bench-')
+        db_path = os.path.join(workdir.name, 'bench.db')
+    # app.py создает Database() при импорте: путь передается через окружение
+    os.environ['DATABASE_PATH'] = db_path
+    # Файлы графиков API — рядом с базой, а не в chart_cache текущего каталога
+    os.environ['CHART_CACHE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'chart_cache')
+
+    app_module = None if args.skip_api else _load_app(log)
+    if app_module is not None:
+        db = app_module.db
+    else:
+        from database import Database
+        db = Database(db_path)
+
+    log(f'Generating {args.transactions} transactions for {args.users} users (seed {args.seed})...')
+    started = time.perf_counter()
+    dataset = generate(db, users=args.users, family_size=args.family_size, transactions=args.transactions,
+                       years=args.years, seed=args.seed)
+    log(f'  done in {time.perf_counter() - started:.1f}s')
+
+    # Регистрация бенчмарков при импорте модулей
+    from benchmarks import database_benchmarks  # noqa: F401
+    from benchmarks import chart_benchmarks  # noqa: F401
+    if app_module is not None:
+        from benchmarks import api_benchmarks  # noqa: F401
+
+    context = Context(db, dataset, app_module)
+    try:
+        results = harness.run(context, names=args.only, scale=args.scale, log=log)
+    finally:
+        db.close()
+        if context.chart_directory is not None:
+            context.chart_directory.cleanup()
+        if workdir is not None:
+            workdir.cleanup()
+
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'dataset': dataset.describe(),
+        'scale': args.scale,
+    }
+    if args.output:
+        harness.save_results(args.output, results, meta)
+
+    baseline = harness.load_baseline(args.baseline)
+    regressions = []
+    if baseline is None and not args.save_baseline:
+        # Без базовой линии регрессии не проверяются: это должно быть видно, а не тихо пропускаться
+        log('')
+        log(f'No baseline at {args.baseline}: regressions were NOT checked. '
+            f'Record one with: python -m benchmarks --save-baseline')
+    if baseline:
+        if baseline.get('meta', {}).get('dataset') != meta['dataset']:
+            log('Warning: baseline was recorded on a different dataset, comparison is approximate')
+        rows = harness.compare(results, baseline.get('results', {}), tolerance=args.tolerance)
+        log('')
+        log(f"{'benchmark':<44} {'baseline p95':>13} {'current p95':>12} {'change':>8}")
+        for row in rows:
+            baseline_value = f"{row['baseline']:.3f}" if row['baseline'] is not None else '-'
+            change = f"{row['change']:+.0%}" if row['change'] is not None else 'new'
+            marker = '  REGRESSION' if row['regression'] else ''
+            log(f"{row['name']:<44} {baseline_value:>13} {row['current']:>12.3f} {change:>8}{marker}")
+        regressions = [row['name'] for row in rows if row['regression']]
+
+    if args.save_baseline:
+        harness.save_results(args.baseline, results, meta)
+        log(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if regressions:
+        log(f'{len(regressions)} regression(s) over {args.tolerance:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
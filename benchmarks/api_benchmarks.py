@@ -0,0 +1,250 @@
+import io
+import itertools
+import json
+
+from benchmarks.harness import benchmark
+from benchmarks.synthetic import TELEGRAM_ID_BASE
+
+
+def _cycle(items):
+    return itertools.cycle(list(items)).__next__
+
+
+def _get(context, url, **params):
+    response = context.client.get(url, query_string=params)
+    response.get_data()
+    if response.status_code >= 400:
+        raise RuntimeError(f'{url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def _post(context, url, payload=None, **kwargs):
+    response = context.client.post(url, json=payload, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+# Чтение
+
+@benchmark('api.GET /', iterations=300)
+def index(context):
+    return lambda: _get(context, '/')
+
+
+@benchmark('api.GET /health', iterations=300)
+def health(context):
+    return lambda: _get(context, '/health')
+
+
+@benchmark('api.GET /metrics', iterations=100)
+def prometheus_metrics(context):
+    return lambda: _get(context, '/metrics')
+
+
+@benchmark('api.GET /static/js/api.js', iterations=300)
+def static_file(context):
+    return lambda: _get(context, '/static/js/api.js')
+
+
+@benchmark('api.POST /api/init', iterations=500)
+def init(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _post(context, '/api/init', {'telegram_id': next_user()['telegram_id']})
+
+
+@benchmark('api.GET /api/transactions', iterations=300)
+def transactions_page(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _get(context, '/api/transactions', telegram_id=next_user()['telegram_id'])
+
+
+@benchmark('api.GET /api/transactions[cursor]', iterations=300)
+def transactions_page_cursor(context):
+    pages = []
+    for user in context.dataset.users[:20]:
+        first = _get(context, '/api/transactions', telegram_id=user['telegram_id']).get_json()
+        pages.append((user['telegram_id'], first['next_cursor']))
+    next_page = _cycle(pages)
+
+    def operation():
+        telegram_id, cursor = next_page()
+        _get(context, '/api/transactions', telegram_id=telegram_id, cursor=cursor)
+    return operation
+
+
+@benchmark('api.GET /api/reports/monthly', iterations=500)
+def monthly_report(context):
+    pairs = _cycle(itertools.product(context.dataset.users[:20], context.dataset.months[-12:]))
+
+    def operation():
+        user, month = pairs()
+        _get(context, '/api/reports/monthly', telegram_id=user['telegram_id'], month=month)
+    return operation
+
+
+@benchmark('api.GET /api/reports/monthly[304]', iterations=500)
+def monthly_report_not_modified(context):
+    requests = []
+    for user in context.dataset.users[:20]:
+        params = {'telegram_id': user['telegram_id'], 'month': context.dataset.months[-1]}
+        etag = _get(context, '/api/reports/monthly', **params).headers['ETag']
+        requests.append((params, etag))
+    next_request = _cycle(requests)
+
+    def operation():
+        params, etag = next_request()
+        response = context.client.get('/api/reports/monthly', query_string=params, headers={'If-None-Match': etag})
+        if response.status_code != 304:
+            raise RuntimeError(f'expected 304, got {response.status_code}')
+    return operation
+
+
+@benchmark('api.GET /api/reports/monthly[period]', iterations=100)
+def period_report(context):
+    next_user = _cycle(context.dataset.users)
+    start = f'{context.dataset.months[-12]}-01'
+    return lambda: _get(context, '/api/reports/monthly', telegram_id=next_user()['telegram_id'],
+                        start_date=start, end_date=context.dataset.end)
+
+
+@benchmark('api.GET /api/reports/family', iterations=300)
+def family_report(context):
+    members = [user for user in context.dataset.users if user.get('family_id')]
+    if not members:
+        return None
+    pairs = _cycle(itertools.product(members[:20], context.dataset.months[-12:]))
+
+    def operation():
+        user, month = pairs()
+        _get(context, '/api/reports/family', telegram_id=user['telegram_id'], month=month)
+    return operation
+
+
+@benchmark('api.GET /api/reports/trends', iterations=30, warmup=2)
+def trends_report(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _get(context, '/api/reports/trends', telegram_id=next_user()['telegram_id'])
+
+
+@benchmark('api.GET /api/reports/percentiles', iterations=30, warmup=2)
+def percentiles_report(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _get(context, '/api/reports/percentiles', telegram_id=next_user()['telegram_id'])
+
+
+@benchmark('api.GET /api/reports/merchants', iterations=30, warmup=2)
+def merchants_report(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _get(context, '/api/reports/merchants', telegram_id=next_user()['telegram_id'])
+
+
+@benchmark('api.GET /api/export', iterations=20, warmup=1)
+def export(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: _get(context, '/api/export', telegram_id=next_user()['telegram_id'], format='csv')
+
+
+@benchmark('api.POST /api/sync', iterations=200)
+def sync(context):
+    next_user = _cycle(context.dataset.users)
+    middle = context.db.get_sync_cursor() // 2
+    return lambda: _post(context, '/api/sync', {'telegram_id': next_user()['telegram_id'], 'cursor': middle})
+
+
+# Запись
+
+@benchmark('api.POST /api/transactions', iterations=300)
+def add_transaction(context):
+    next_user = _cycle(context.dataset.users)
+    keys = itertools.count()
+
+    def operation():
+        _post(context, '/api/transactions', {
+            'telegram_id': next_user()['telegram_id'], 'amount': 420.5, 'category': 'Еда',
+            'type': 'expense', 'description': 'benchmark'
+        }, headers={'Idempotency-Key': f'api-bench-{next(keys)}'})
+    return operation
+
+
+@benchmark('api.POST /api/transactions/import[200]', iterations=10, warmup=1)
+def import_transactions(context):
+    user = context.dataset.users[4]
+    batches = itertools.count()
+
+    def operation():
+        batch = next(batches)
+        body = 'date,amount,category,type,description\n' + ''.join(
+            f'2031-02-{index % 28 + 1:02d} 10:{batch % 60:02d}:{index % 60:02d},{50 + index}.25,Импорт,expense,'
+            f'csv {batch} {index}\n'
+            for index in range(200)
+        )
+        response = context.client.post('/api/transactions/import', query_string={'telegram_id': user['telegram_id']},
+                                       data=io.BytesIO(body.encode()), content_type='text/csv')
+        if response.status_code >= 400:
+            raise RuntimeError(response.get_data(as_text=True)[:200])
+    return operation
+
+
+@benchmark('api.PUT /api/transactions/<id>', iterations=300)
+def update_transaction(context):
+    user = context.dataset.users[5]
+    ids = [row['id'] for row in context.db.get_transactions_page(user['id'], limit=100)['transactions']]
+    next_id = _cycle(ids)
+    amounts = itertools.count()
+
+    def operation():
+        response = context.client.put(f'/api/transactions/{next_id()}',
+                                      json={'telegram_id': user['telegram_id'], 'amount': 10 + next(amounts) % 500})
+        if response.status_code >= 400:
+            raise RuntimeError(response.get_data(as_text=True)[:200])
+    return operation
+
+
+@benchmark('api.DELETE /api/transactions/<id>', iterations=300)
+def delete_transaction(context):
+    user = context.dataset.users[6]
+    ids = iter([
+        context.db.add_transaction(user['id'], 10, 'Удаление', 'expense', family_id=user.get('family_id'))
+        for _ in range(310)
+    ])
+
+    def operation():
+        response = context.client.delete(f'/api/transactions/{next(ids)}',
+                                         query_string={'telegram_id': user['telegram_id']})
+        if response.status_code >= 400:
+            raise RuntimeError(response.get_data(as_text=True)[:200])
+    return operation
+
+
+@benchmark('api.POST /api/family/create', iterations=200)
+def create_family(context):
+    telegram_ids = itertools.count(TELEGRAM_ID_BASE * 5)
+
+    def operation():
+        telegram_id = next(telegram_ids)
+        _post(context, '/api/init', {'telegram_id': telegram_id})
+        _post(context, '/api/family/create', {'telegram_id': telegram_id, 'family_name': 'Семья'})
+    return operation
+
+
+@benchmark('api.POST /api/family/invite', iterations=300)
+def create_invite(context):
+    user = context.dataset.users[0]
+    return lambda: _post(context, '/api/family/invite', {'telegram_id': user['telegram_id']})
+
+
+@benchmark('api.POST /webhook', iterations=1000)
+def webhook(context):
+    updates = context.app_module.webhook_updates
+    update_ids = itertools.count(TELEGRAM_ID_BASE)
+
+    def operation():
+        update_id = next(update_ids)
+        payload = json.dumps({'update_id': update_id, 'message': {'message_id': 1, 'text': '/start'}})
+        _post(context, '/webhook', data=payload, content_type='application/json')
+        # Диспетчер в бенчмарке не запущен: разбираем очередь сами, чтобы она не переполнилась
+        item = updates.get(timeout=0)
+        if item is not None:
+            updates.done(item[0])
+    return operation
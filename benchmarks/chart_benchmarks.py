@@ -0,0 +1,123 @@
+import itertools
+import tempfile
+
+from benchmarks.harness import benchmark
+from charts import ChartCache, ChartsUnavailable
+
+
+def _cycle(items):
+    return itertools.cycle(list(items)).__next__
+
+
+def _chart_cache(context):
+    """Отдельный кэш во временном каталоге: замеры не зависят от файлов прошлых запусков"""
+    if context.chart_cache is None:
+        context.chart_directory = tempfile.TemporaryDirectory(prefix='family-finance-charts-')
+        context.chart_cache = ChartCache(context.chart_directory.name, max_files=100_000)
+    return context.chart_cache
+
+
+def _categories(context):
+    user = context.dataset.users[0]
+    month = context.dataset.months[-1]
+    report = context.db.get_monthly_report(user['id'], int(month[:4]), int(month[5:]))
+    return report['categories']
+
+
+def _available(cache, categories) -> bool:
+    try:
+        cache.category_donut(categories, 'RUB', fmt='svg')
+    except ChartsUnavailable:
+        return False
+    return True
+
+
+# Отрисовка: стоимость промаха кэша и попадания
+
+@benchmark('charts.category_donut[render png]', iterations=30, warmup=2)
+def donut_render_png(context):
+    cache, categories = _chart_cache(context), _categories(context)
+    if not _available(cache, categories):
+        return None
+    # Уникальный заголовок дает новый ключ: каждая итерация — полный рендер
+    titles = itertools.count()
+    return lambda: cache.category_donut(categories, 'RUB', title=f'png {next(titles)}', fmt='png')
+
+
+@benchmark('charts.category_donut[render svg]', iterations=30, warmup=2)
+def donut_render_svg(context):
+    cache, categories = _chart_cache(context), _categories(context)
+    if not _available(cache, categories):
+        return None
+    titles = itertools.count()
+    return lambda: cache.category_donut(categories, 'RUB', title=f'svg {next(titles)}', fmt='svg')
+
+
+@benchmark('charts.monthly_trend[render svg]', iterations=30, warmup=2)
+def trend_render_svg(context):
+    cache = _chart_cache(context)
+    if not _available(cache, _categories(context)):
+        return None
+    user = context.dataset.users[0]
+    totals = context.db.get_monthly_totals(months=12, user_id=user['id'])
+    titles = itertools.count()
+    return lambda: cache.monthly_trend(totals, 'RUB', title=f'trend {next(titles)}', fmt='svg')
+
+
+@benchmark('charts.category_donut[cached]', iterations=2000)
+def donut_cached(context):
+    cache, categories = _chart_cache(context), _categories(context)
+    if not _available(cache, categories):
+        return None
+    return lambda: cache.category_donut(categories, 'RUB', fmt='svg')
+
+
+# HTTP: полный ответ с файлом из кэша и перепроверка по ETag
+
+def _chart_requests(context):
+    requests = []
+    for user in context.dataset.users[:20]:
+        params = {'telegram_id': user['telegram_id'], 'format': 'svg'}
+        response = context.client.get('/api/charts/categories', query_string=params)
+        response.get_data()
+        if response.status_code == 503:
+            return None
+        if response.status_code >= 400:
+            raise RuntimeError(f'/api/charts/categories -> {response.status_code}')
+        requests.append((params, response.headers['ETag']))
+    return requests
+
+
+@benchmark('api.GET /api/charts/categories', iterations=300)
+def chart_response(context):
+    if context.client is None:
+        return None
+    requests = _chart_requests(context)
+    if requests is None:
+        return None
+    next_request = _cycle(requests)
+
+    def operation():
+        params, _ = next_request()
+        response = context.client.get('/api/charts/categories', query_string=params)
+        response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f'expected 200, got {response.status_code}')
+    return operation
+
+
+@benchmark('api.GET /api/charts/categories[304]', iterations=300)
+def chart_not_modified(context):
+    if context.client is None:
+        return None
+    requests = _chart_requests(context)
+    if requests is None:
+        return None
+    next_request = _cycle(requests)
+
+    def operation():
+        params, etag = next_request()
+        response = context.client.get('/api/charts/categories', query_string=params, headers={'If-None-Match': etag})
+        if response.status_code != 304:
+            raise RuntimeError(f'expected 304, got {response.status_code}')
+    return operation
@@ -0,0 +1,289 @@
+import itertools
+
+from benchmarks.harness import benchmark
+from benchmarks.synthetic import TELEGRAM_ID_BASE
+
+
+def _cycle(items):
+    return itertools.cycle(list(items)).__next__
+
+
+def _months(context, count: int = 12):
+    return context.dataset.months[-count:]
+
+
+# Чтение: выполняется первым, пока данные совпадают со сгенерированными
+
+@benchmark('db.get_user_by_telegram_id', iterations=2000)
+def get_user_by_telegram_id(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.get_user_by_telegram_id(next_user()['telegram_id'])
+
+
+@benchmark('db.get_user_by_telegram_id[uncached]', iterations=1000)
+def get_user_by_telegram_id_uncached(context):
+    next_user = _cycle(context.dataset.users)
+
+    def operation():
+        context.db.user_cache.clear()
+        context.db.get_user_by_telegram_id(next_user()['telegram_id'])
+    return operation
+
+
+@benchmark('db.user_exists', iterations=2000)
+def user_exists(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.user_exists(next_user()['telegram_id'])
+
+
+@benchmark('db.get_user_transactions', iterations=300)
+def get_user_transactions(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.get_user_transactions(next_user()['id'])
+
+
+@benchmark('db.get_transactions_page', iterations=300)
+def get_transactions_page(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.get_transactions_page(next_user()['id'], limit=50)
+
+
+@benchmark('db.get_transactions_page[cursor]', iterations=300)
+def get_transactions_page_cursor(context):
+    pages = []
+    for user in context.dataset.users[:20]:
+        first = context.db.get_transactions_page(user['id'], limit=50)
+        pages.append((user['id'], first['next_cursor']))
+    next_page = _cycle(pages)
+
+    def operation():
+        user_id, cursor = next_page()
+        context.db.get_transactions_page(user_id, limit=50, cursor=cursor)
+    return operation
+
+
+@benchmark('db.get_transactions_page[filters]', iterations=300)
+def get_transactions_page_filters(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.get_transactions_page(next_user()['id'], limit=50, type='expense',
+                                                    category='Еда', search='Кофейня')
+
+
+@benchmark('db.iter_transactions', iterations=20, warmup=1)
+def iter_transactions(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: sum(1 for _ in context.db.iter_transactions(user_id=next_user()['id']))
+
+
+@benchmark('db.get_monthly_report', iterations=1000)
+def get_monthly_report(context):
+    pairs = _cycle(itertools.product(context.dataset.users[:20], _months(context)))
+
+    def operation():
+        user, month = pairs()
+        context.db.get_monthly_report(user['id'], int(month[:4]), int(month[5:]))
+    return operation
+
+
+@benchmark('db.get_monthly_report[USD]', iterations=1000)
+def get_monthly_report_converted(context):
+    pairs = _cycle(itertools.product(context.dataset.users[:20], _months(context)))
+
+    def operation():
+        user, month = pairs()
+        context.db.get_monthly_report(user['id'], int(month[:4]), int(month[5:]), currency='USD')
+    return operation
+
+
+@benchmark('db.get_family_report', iterations=500)
+def get_family_report(context):
+    if not context.dataset.families:
+        return None
+    pairs = _cycle(itertools.product(context.dataset.families, _months(context)))
+
+    def operation():
+        family_id, month = pairs()
+        context.db.get_family_report(family_id, int(month[:4]), int(month[5:]))
+    return operation
+
+
+@benchmark('db.get_family_period_report', iterations=50)
+def get_family_period_report(context):
+    if not context.dataset.families:
+        return None
+    next_family = _cycle(context.dataset.families)
+    start = f'{_months(context)[0]}-01'
+    return lambda: context.db.get_family_period_report(next_family(), start, context.dataset.end)
+
+
+@benchmark('db.get_period_report', iterations=100)
+def get_period_report(context):
+    next_user = _cycle(context.dataset.users)
+    start = f'{_months(context)[0]}-01'
+    return lambda: context.db.get_period_report(next_user()['id'], start, context.dataset.end)
+
+
+@benchmark('db.get_category_report', iterations=100)
+def get_category_report(context):
+    next_user = _cycle(context.dataset.users)
+    start = f'{_months(context)[0]}-01'
+    return lambda: context.db.get_category_report(next_user()['id'], start, context.dataset.end)
+
+
+@benchmark('db.get_sync_cursor', iterations=1000)
+def get_sync_cursor(context):
+    return context.db.get_sync_cursor
+
+
+@benchmark('db.get_data_version', iterations=2000)
+def get_data_version(context):
+    next_user = _cycle(context.dataset.users)
+    return lambda: context.db.get_data_version(user_id=next_user()['id'])
+
+
+@benchmark('db.get_updates_since', iterations=200)
+def get_updates_since(context):
+    next_user = _cycle(context.dataset.users)
+    middle = context.db.get_sync_cursor() // 2
+
+    def operation():
+        user = next_user()
+        context.db.get_updates_since(user['id'], middle, 200, user.get('family_id'))
+    return operation
+
+
+@benchmark('db.get_family_members', iterations=1000)
+def get_family_members(context):
+    if not context.dataset.families:
+        return None
+    return lambda: context.db.get_family_members(next(context.families))
+
+
+@benchmark('db.get_currency_rates', iterations=2000)
+def get_currency_rates(context):
+    return context.db.get_currency_rates
+
+
+# Запись
+
+@benchmark('db.add_transaction', iterations=500)
+def add_transaction(context):
+    next_user = _cycle(context.dataset.users)
+
+    def operation():
+        user = next_user()
+        context.db.add_transaction(user['id'], 350.5, 'Еда', 'expense', 'benchmark',
+                                   family_id=user.get('family_id'))
+    return operation
+
+
+@benchmark('db.add_transaction[idempotent]', iterations=500)
+def add_transaction_idempotent(context):
+    user = context.dataset.users[0]
+    keys = itertools.count()
+
+    def operation():
+        key = f'bench-{next(keys) % 50}'
+        context.db.add_transaction(user['id'], 99, 'Кафе', 'expense', key, family_id=user.get('family_id'),
+                                   idempotency_key=key)
+    return operation
+
+
+@benchmark('db.add_transactions_bulk[500]', iterations=10, warmup=1)
+def add_transactions_bulk(context):
+    user = context.dataset.users[1]
+    batches = itertools.count()
+
+    def operation():
+        batch = next(batches)
+        rows = [
+            {'date': f'2030-01-{index % 28 + 1:02d} 12:{batch % 60:02d}:{index % 60:02d}',
+             'amount': f'{100 + index}.{batch % 100:02d}', 'category': 'Импорт', 'type': 'expense',
+             'description': f'bulk {batch} {index}'}
+            for index in range(500)
+        ]
+        context.db.add_transactions_bulk(user['id'], rows, family_id=user.get('family_id'))
+    return operation
+
+
+@benchmark('db.update_transaction', iterations=300)
+def update_transaction(context):
+    user = context.dataset.users[2]
+    ids = [row['id'] for row in context.db.get_transactions_page(user['id'], limit=100)['transactions']]
+    next_id = _cycle(ids)
+    amounts = itertools.count()
+    return lambda: context.db.update_transaction(user['id'], next_id(), amount=100 + next(amounts) % 1000)
+
+
+@benchmark('db.delete_transaction', iterations=300)
+def delete_transaction(context):
+    user = context.dataset.users[3]
+    ids = iter([
+        context.db.add_transaction(user['id'], 10, 'Удаление', 'expense', family_id=user.get('family_id'))
+        for _ in range(310)
+    ])
+    return lambda: context.db.delete_transaction(user['id'], next(ids))
+
+
+@benchmark('db.add_user', iterations=500)
+def add_user(context):
+    telegram_ids = itertools.count(TELEGRAM_ID_BASE * 2)
+    return lambda: context.db.add_user(next(telegram_ids), 'bench_new', 'Новый')
+
+
+@benchmark('db.create_family', iterations=200)
+def create_family(context):
+    telegram_ids = itertools.count(TELEGRAM_ID_BASE * 3)
+
+    def setup_user():
+        telegram_id = next(telegram_ids)
+        context.db.add_user(telegram_id, 'bench_family', 'Глава')
+        return context.db.get_user_by_telegram_id(telegram_id)['id']
+
+    users = iter([setup_user() for _ in range(205)])
+    return lambda: context.db.create_family(next(users), 'Семья')
+
+
+@benchmark('db.join_family', iterations=200)
+def join_family(context):
+    if not context.dataset.families:
+        return None
+    telegram_ids = itertools.count(TELEGRAM_ID_BASE * 4)
+    for _ in range(205):
+        context.db.add_user(next(telegram_ids), 'bench_join', 'Участник')
+    users = iter(range(TELEGRAM_ID_BASE * 4, TELEGRAM_ID_BASE * 4 + 205))
+
+    def operation():
+        user = context.db.get_user_by_telegram_id(next(users))
+        context.db.join_family(user['id'], next(context.families))
+    return operation
+
+
+@benchmark('db.create_invite', iterations=300)
+def create_invite(context):
+    codes = itertools.count()
+    user = context.dataset.users[0]
+    return lambda: context.db.create_invite(user['id'], f'bench{next(codes):08d}')
+
+
+@benchmark('db.set_currency_rate', iterations=300)
+def set_currency_rate(context):
+    rates = itertools.count()
+    return lambda: context.db.set_currency_rate('USD', 90 + next(rates) % 10)
+
+
+@benchmark('db.purge_idempotency_keys', iterations=100)
+def purge_idempotency_keys(context):
+    return context.db.purge_idempotency_keys
+
+
+# Обслуживание
+
+@benchmark('db.init_db[schema current]', iterations=20, warmup=1)
+def init_db(context):
+    return context.db.init_db
+
+
+@benchmark('db.rebuild_rollups', iterations=3, warmup=1)
+def rebuild_rollups(context):
+    return context.db.rebuild_rollups
@@ -0,0 +1,106 @@
+import gc
+import json
+import math
+import time
+from typing import Callable, Dict, List, Optional
+
+# Реестр бенчмарков: имя -> (функция от контекста, число итераций)
+BENCHMARKS: Dict[str, Dict] = {}
+
+
+def benchmark(name: str, iterations: int = 200, warmup: int = 5):
+    """Регистрация бенчмарка; функция получает контекст и возвращает вызываемый объект одной итерации"""
+    def decorator(factory: Callable):
+        BENCHMARKS[name] = {'factory': factory, 'iterations': iterations, 'warmup': warmup}
+        return factory
+    return decorator
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга (samples отсортированы)"""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def measure(operation: Callable, iterations: int, warmup: int = 5) -> Dict:
+    """Замер одной операции: пропускная способность и перцентили задержки"""
+    for _ in range(warmup):
+        operation()
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            begin = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - begin)
+        total = time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / total, 1) if total > 0 else None,
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 4),
+        'p50_ms': round(percentile(samples, 50) * 1000, 4),
+        'p95_ms': round(percentile(samples, 95) * 1000, 4),
+        'p99_ms': round(percentile(samples, 99) * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+
+def run(context, names: List[str] = None, scale: float = 1.0, log: Callable = print) -> Dict[str, Dict]:
+    """Запуск выбранных бенчмарков (по умолчанию всех) в порядке регистрации"""
+    results = {}
+    for name, spec in BENCHMARKS.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        operation = spec['factory'](context)
+        if operation is None:
+            log(f'  skip {name}')
+            continue
+        iterations = max(1, int(spec['iterations'] * scale))
+        results[name] = measure(operation, iterations, spec['warmup'])
+        log(f"  {name:<44} {results[name]['p50_ms']:>9.3f} ms p50  {results[name]['p99_ms']:>9.3f} ms p99")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 0.25,
+            metric: str = 'p95_ms') -> List[Dict]:
+    """Сравнение с базовой линией: изменение metric в долях, regression при росте больше tolerance"""
+    rows = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get(metric):
+            rows.append({'name': name, 'baseline': None, 'current': result[metric], 'change': None,
+                         'regression': False})
+            continue
+        change = result[metric] / previous[metric] - 1
+        rows.append({
+            'name': name,
+            'baseline': previous[metric],
+            'current': result[metric],
+            'change': round(change, 3),
+            'regression': change > tolerance,
+        })
+    return rows
+
+
+def load_baseline(path: str) -> Optional[Dict]:
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path: str, results: Dict[str, Dict], meta: Dict):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'meta': meta, 'results': results}, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
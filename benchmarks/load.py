@@ -0,0 +1,376 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.harness import percentile, save_results
+
+# Доля операций по умолчанию: мини-приложение в основном читает, бот пишет через webhook
+DEFAULT_MIX = {'init': 1, 'list': 4, 'add': 2, 'report': 3, 'webhook': 2}
+
+# id пользователей Telegram положительные, поэтому нагрузочные берутся отрицательными и не совпадут с реальными;
+# prepare все равно пишет пользователей и операции в базу экземпляра — запускать только на одноразовом
+TELEGRAM_ID_BASE = -900_000_000
+
+LOCKED_MARKER = 'database is locked'
+POOL_MARKER = 'connection pool exhausted'
+
+CATEGORIES = ['Еда', 'Транспорт', 'Кафе', 'Покупки', 'Развлечения']
+BOT_COMMANDS = ['/balance', '/report', '/add 250 Еда обед', '/help']
+
+
+class Recorder:
+    """Потокобезопасный сбор результатов по операциям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Counter] = {}
+        self.errors = Counter()
+        self.locked = Counter()
+        self.pool_exhausted = Counter()
+        self.transport_errors: Dict[str, Counter] = {}
+
+    def record(self, action: str, seconds: float, status: int, body: bytes):
+        with self._lock:
+            self.samples.setdefault(action, []).append(seconds)
+            self.statuses.setdefault(action, Counter())[status] += 1
+            if status >= 400:
+                self.errors[action] += 1
+                text = body.decode('utf-8', 'replace')
+                if LOCKED_MARKER in text:
+                    self.locked[action] += 1
+                elif POOL_MARKER in text:
+                    self.pool_exhausted[action] += 1
+
+    def record_failure(self, action: str, seconds: float, error: Exception):
+        with self._lock:
+            self.samples.setdefault(action, []).append(seconds)
+            self.errors[action] += 1
+            self.transport_errors.setdefault(action, Counter())[type(error).__name__] += 1
+
+    def report(self, elapsed: float) -> Dict:
+        with self._lock:
+            actions = {}
+            for action, samples in sorted(self.samples.items()):
+                samples = sorted(samples)
+                actions[action] = {
+                    'requests': len(samples),
+                    'rps': round(len(samples) / elapsed, 1) if elapsed else None,
+                    'errors': self.errors[action],
+                    'error_rate': round(self.errors[action] / len(samples), 4),
+                    'database_locked': self.locked[action],
+                    'pool_exhausted': self.pool_exhausted[action],
+                    'statuses': {str(status): count for status, count in sorted(self.statuses.get(action, {}).items())},
+                    'transport_errors': dict(self.transport_errors.get(action, {})),
+                    'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                    'p90_ms': round(percentile(samples, 90) * 1000, 2),
+                    'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                    'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                    'max_ms': round(samples[-1] * 1000, 2),
+                }
+            everything = sorted(sample for samples in self.samples.values() for sample in samples)
+            total = len(everything)
+            errors = sum(self.errors.values())
+            return {
+                'elapsed': round(elapsed, 2),
+                'requests': total,
+                'rps': round(total / elapsed, 1) if elapsed else None,
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else 0,
+                'database_locked': sum(self.locked.values()),
+                'pool_exhausted': sum(self.pool_exhausted.values()),
+                'p50_ms': round(percentile(everything, 50) * 1000, 2),
+                'p95_ms': round(percentile(everything, 95) * 1000, 2),
+                'p99_ms': round(percentile(everything, 99) * 1000, 2),
+                'actions': actions,
+            }
+
+
+class Client:
+    """Keep-alive подключение одного виртуального пользователя, как у браузера"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.connection = None
+
+    def _connect(self):
+        factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self.connection = factory(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, params: Dict = None, payload=None, headers: Dict = None,
+                body: bytes = None):
+        url = self.prefix + path + (f'?{urlencode(params)}' if params else '')
+        headers = dict(headers or {})
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.connection is None:
+            self._connect()
+        try:
+            self.connection.request(method, url, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except Exception:
+            # Сервер закрыл подключение или таймаут: следующий запрос откроет новое
+            self.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, data
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class LoadTest:
+    """Замкнутый цикл: concurrency потоков, каждый шлет запросы по смеси операций"""
+
+    def __init__(self, base_url: str, users: int = 50, concurrency: int = 8, mix: Dict[str, float] = None,
+                 duration: float = 30.0, requests: int = None, think_ms: float = 0.0, ramp: float = 0.0,
+                 timeout: float = 30.0, seed: int = 42, webhook_secret: str = None, months: List[str] = None):
+        self.base_url = base_url
+        self.telegram_ids = [TELEGRAM_ID_BASE - index for index in range(users)]
+        self.concurrency = concurrency
+        self.mix = mix or DEFAULT_MIX
+        self.duration = duration
+        self.requests = requests
+        self.think_ms = think_ms
+        self.ramp = ramp
+        self.timeout = timeout
+        self.seed = seed
+        self.webhook_secret = webhook_secret
+        self.months = months or _recent_months(6)
+        self.recorder = Recorder()
+        self._issued = 0
+        self._issued_lock = threading.Lock()
+        # update_id должны быть уникальны между запусками, иначе очередь отбросит их как дубли
+        self._update_ids = iter(range(int(time.time() * 1000) % 10 ** 12, 10 ** 13))
+        self._stop = threading.Event()
+
+    def prepare(self, transactions_per_user: int = 20):
+        """Регистрация пользователей и начальные данные (не входит в замер)"""
+        client = Client(self.base_url, self.timeout)
+        rng = random.Random(self.seed)
+        try:
+            for telegram_id in self.telegram_ids:
+                status, body = client.request('POST', '/api/init', payload={'telegram_id': telegram_id})
+                if status != 200:
+                    raise RuntimeError(f'/api/init failed with {status}: {body[:200]!r}')
+                if not transactions_per_user:
+                    continue
+                lines = ['date,amount,category,type,description']
+                for index in range(transactions_per_user):
+                    month = rng.choice(self.months)
+                    lines.append(f'{month}-{rng.randint(1, 28):02d} 12:00:{index % 60:02d},'
+                                 f'{rng.uniform(100, 5000):.2f},{rng.choice(CATEGORIES)},expense,load seed')
+                status, body = client.request('POST', '/api/transactions/import',
+                                              params={'telegram_id': telegram_id},
+                                              body='\n'.join(lines).encode(),
+                                              headers={'Content-Type': 'text/csv'})
+                if status != 200:
+                    raise RuntimeError(f'import failed with {status}: {body[:200]!r}')
+        finally:
+            client.close()
+
+    def _next_ticket(self) -> bool:
+        if self._stop.is_set():
+            return False
+        if self.requests is None:
+            return True
+        with self._issued_lock:
+            if self._issued >= self.requests:
+                return False
+            self._issued += 1
+            return True
+
+    def _worker(self, index: int, deadline: float):
+        rng = random.Random(self.seed * 1000 + index)
+        client = Client(self.base_url, self.timeout)
+        actions = list(self.mix)
+        weights = [self.mix[action] for action in actions]
+        cursors = {}
+        try:
+            while time.monotonic() < deadline and self._next_ticket():
+                action = rng.choices(actions, weights)[0]
+                telegram_id = rng.choice(self.telegram_ids)
+                method, path, params, payload, headers = self._build(action, telegram_id, rng, cursors)
+                started = time.perf_counter()
+                try:
+                    status, body = client.request(method, path, params=params, payload=payload, headers=headers)
+                except Exception as error:
+                    self.recorder.record_failure(action, time.perf_counter() - started, error)
+                    continue
+                self.recorder.record(action, time.perf_counter() - started, status, body)
+                if action == 'list' and status == 200:
+                    cursors[telegram_id] = json.loads(body).get('next_cursor')
+                if self.think_ms:
+                    time.sleep(rng.expovariate(1000 / self.think_ms))
+        finally:
+            client.close()
+
+    def _build(self, action: str, telegram_id: int, rng: random.Random, cursors: Dict):
+        """Запрос для операции: (method, path, params, payload, headers)"""
+        if action == 'init':
+            return 'POST', '/api/init', None, {'telegram_id': telegram_id}, None
+        if action == 'list':
+            params = {'telegram_id': telegram_id, 'limit': 50}
+            # Часть запросов — прокрутка списка дальше первой страницы
+            cursor = cursors.pop(telegram_id, None)
+            if cursor and rng.random() < 0.3:
+                params['cursor'] = cursor
+            return 'GET', '/api/transactions', params, None, None
+        if action == 'add':
+            payload = {'telegram_id': telegram_id, 'amount': round(rng.uniform(50, 5000), 2),
+                       'category': rng.choice(CATEGORIES), 'type': 'expense', 'description': 'load test'}
+            return 'POST', '/api/transactions', None, payload, {'Idempotency-Key': uuid.uuid4().hex}
+        if action == 'report':
+            params = {'telegram_id': telegram_id, 'month': rng.choice(self.months)}
+            return 'GET', '/api/reports/monthly', params, None, None
+        if action == 'webhook':
+            headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else None
+            return 'POST', '/webhook', None, _telegram_update(next(self._update_ids), telegram_id, rng), headers
+        raise ValueError(f'Unknown action: {action}')
+
+    def run(self) -> Dict:
+        started = time.monotonic()
+        deadline = started + self.duration if self.duration else float('inf')
+        threads = []
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, args=(index, deadline), daemon=True,
+                                      name=f'load-{index}')
+            threads.append(thread)
+            thread.start()
+            if self.ramp and index < self.concurrency - 1:
+                time.sleep(self.ramp / self.concurrency)
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        return self.recorder.report(time.monotonic() - started)
+
+
+def _telegram_update(update_id: int, telegram_id: int, rng: random.Random) -> Dict:
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load_{telegram_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id % 2 ** 31,
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private', 'first_name': 'Load'},
+            'from': user,
+            'text': rng.choice(BOT_COMMANDS),
+        }
+    }
+
+
+def _recent_months(count: int) -> List[str]:
+    today = datetime.now()
+    months = []
+    year, month = today.year, today.month
+    for _ in range(count):
+        months.append(f'{year:04d}-{month:02d}')
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return months
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Смесь операций в виде "list=4,report=3,add=2" """
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}, expected one of: {", ".join(DEFAULT_MIX)}')
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight for {name}: {weight!r}')
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('mix must contain a positive weight')
+    return mix
+
+
+def print_report(report: Dict, log=print):
+    log(f"\n{'action':<10} {'requests':>9} {'rps':>8} {'errors':>7} {'err%':>6} {'locked':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for action, row in report['actions'].items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in row['statuses'].items())
+        transport = ' '.join(f'{name}:{count}' for name, count in row['transport_errors'].items())
+        log(f"{action:<10} {row['requests']:>9} {row['rps']:>8} {row['errors']:>7} {row['error_rate']:>6.1%} "
+            f"{row['database_locked']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+            f"{row['max_ms']:>8}  {statuses} {transport}".rstrip())
+    log(f"\n{report['requests']} requests in {report['elapsed']}s ({report['rps']} req/s), "
+        f"errors {report['errors']} ({report['error_rate']:.1%}), "
+        f"database is locked: {report['database_locked']}, pool exhausted: {report['pool_exhausted']}, "
+        f"p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, p99 {report['p99_ms']} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load',
+                                     description='Нагрузочный тест запущенного экземпляра (API мини-приложения и webhook)')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='адрес одноразового экземпляра (тест пишет в его базу)')
+    parser.add_argument('--concurrency', '-c', type=int, default=8, help='число одновременных клиентов')
+    parser.add_argument('--duration', '-d', type=float, default=30, help='длительность в секундах')
+    parser.add_argument('--requests', '-n', type=int, help='остановиться после N запросов')
+    parser.add_argument('--users', type=int, default=50, help='число виртуальных пользователей')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='веса операций init,list,add,report,webhook, например "list=4,add=1"')
+    parser.add_argument('--think-ms', type=float, default=0, help='средняя пауза клиента между запросами')
+    parser.add_argument('--ramp', type=float, default=0, help='секунд на запуск всех клиентов')
+    parser.add_argument('--timeout', type=float, default=30, help='таймаут запроса в секундах')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--seed-transactions', type=int, default=20,
+                        help='операций на пользователя перед замером (0 — не добавлять)')
+    parser.add_argument('--webhook-secret', help='значение TELEGRAM_WEBHOOK_SECRET сервера')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Optional[int]:
+    args = parse_args(argv)
+    test = LoadTest(args.url, users=args.users, concurrency=args.concurrency, mix=args.mix,
+                    duration=args.duration if args.requests is None else 0, requests=args.requests,
+                    think_ms=args.think_ms, ramp=args.ramp, timeout=args.timeout, seed=args.seed,
+                    webhook_secret=args.webhook_secret)
+
+    print(f'Preparing {args.users} users with negative telegram_id on {args.url} (written to its database)...')
+    try:
+        test.prepare(args.seed_transactions)
+    except (OSError, RuntimeError) as error:
+        print(f'Setup failed: {error}')
+        return 2
+
+    limit = f'{args.requests} requests' if args.requests else f'{args.duration:g}s'
+    print(f'Running {limit} with concurrency {args.concurrency}, mix {args.mix}')
+    report = test.run()
+    print_report(report)
+
+    if args.output:
+        meta = {'created': datetime.now().isoformat(timespec='seconds'), 'url': args.url,
+                'concurrency': args.concurrency, 'mix': args.mix, 'users': args.users}
+        save_results(args.output, report, meta)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from changes import OP_INSERT, record_changes
+from database import Database
+from money import to_minor
+
+# Фиксированная точка отсчета: одинаковые данные при каждом запуске, независимо от текущей даты
+ANCHOR = datetime(2025, 1, 1)
+
+# (категория, вес, минимальная сумма, максимальная сумма)
+EXPENSE_CATEGORIES = [
+    ('Еда', 30, 150, 3500),
+    ('Транспорт', 15, 50, 1500),
+    ('Коммуналка', 5, 3000, 9000),
+    ('Развлечения', 10, 300, 6000),
+    ('Покупки', 15, 500, 20000),
+    ('Здоровье', 5, 300, 8000),
+    ('Кафе', 12, 250, 4000),
+    ('Связь', 3, 300, 1200),
+    ('Образование', 5, 1000, 30000),
+]
+INCOME_CATEGORIES = [
+    ('Зарплата', 60, 40000, 150000),
+    ('Фриланс', 25, 3000, 50000),
+    ('Подарок', 10, 1000, 20000),
+    ('Инвестиции', 5, 500, 30000),
+]
+MERCHANTS = ['Пятерочка', 'Перекресток', 'Яндекс Такси', 'Метро', 'Ozon', 'Wildberries', 'Аптека', 'Кофейня', '']
+
+# Доля операций в иностранной валюте и курсы для них
+FOREIGN_CURRENCIES = {'USD': 92.5, 'EUR': 100.0}
+FOREIGN_SHARE = 0.05
+
+TELEGRAM_ID_BASE = 10_000_000
+
+
+class Dataset:
+    """Что сгенерировано: пользователи, семьи и границы периода"""
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.users: List[Dict] = []
+        self.families: List[int] = []
+        self.transactions = 0
+        self.start = ''
+        self.end = ''
+        self.months: List[str] = []
+
+    def describe(self) -> Dict:
+        return {
+            'seed': self.seed,
+            'users': len(self.users),
+            'families': len(self.families),
+            'transactions': self.transactions,
+            'period': [self.start, self.end],
+        }
+
+
+def _pick(rng: random.Random, categories):
+    return rng.choices(categories, weights=[item[1] for item in categories])[0]
+
+
+def generate(db: Database, users: int = 50, family_size: int = 4, transactions: int = 100_000,
+             years: int = 3, seed: int = 42, batch_size: int = 5000) -> Dataset:
+    """Детерминированное наполнение базы: пользователи, семьи и операции за несколько лет"""
+    rng = random.Random(seed)
+    dataset = Dataset(seed=seed)
+    start = ANCHOR - timedelta(days=365 * years)
+    dataset.start = start.strftime('%Y-%m-%d')
+    dataset.end = ANCHOR.strftime('%Y-%m-%d')
+
+    for index in range(users):
+        telegram_id = TELEGRAM_ID_BASE + index
+        db.add_user(telegram_id, f'bench_{index}', f'Участник {index}')
+        user = db.get_user_by_telegram_id(telegram_id)
+        if family_size and index % family_size == 0:
+            dataset.families.append(db.create_family(user['id'], f'Семья {index // family_size}'))
+        elif family_size:
+            db.join_family(user['id'], dataset.families[-1])
+        dataset.users.append(db.get_user_by_telegram_id(telegram_id))
+
+    for currency, rate in FOREIGN_CURRENCIES.items():
+        db.set_currency_rate(currency, rate)
+
+    span = int((ANCHOR - start).total_seconds())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+        first_id = cursor.fetchone()[0] + 1
+
+        batch = []
+        for _ in range(transactions):
+            user = rng.choice(dataset.users)
+            is_income = rng.random() < 0.12
+            category, _, low, high = _pick(rng, INCOME_CATEGORIES if is_income else EXPENSE_CATEGORIES)
+            currency = 'RUB'
+            if rng.random() < FOREIGN_SHARE:
+                currency = rng.choice(sorted(FOREIGN_CURRENCIES))
+            amount = round(rng.uniform(low, high), 2)
+            if currency != 'RUB':
+                amount = round(amount / FOREIGN_CURRENCIES[currency], 2)
+            date = start + timedelta(seconds=rng.randrange(span))
+            batch.append((
+                user['id'], user.get('family_id'), to_minor(amount, currency), currency, category,
+                'income' if is_income else 'expense', '' if is_income else rng.choice(MERCHANTS),
+                date.strftime('%Y-%m-%d %H:%M:%S')
+            ))
+            if len(batch) >= batch_size:
+                _insert(cursor, batch)
+                batch = []
+        if batch:
+            _insert(cursor, batch)
+
+        cursor.execute('SELECT id FROM transactions WHERE id >= ? ORDER BY id', (first_id,))
+        record_changes(cursor, OP_INSERT, [row[0] for row in cursor.fetchall()])
+        conn.commit()
+
+    db.rebuild_rollups()
+    dataset.transactions = transactions
+
+    month = datetime(start.year, start.month, 1)
+    while month < ANCHOR:
+        dataset.months.append(month.strftime('%Y-%m'))
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return dataset
+
+
+def _insert(cursor, batch):
+    cursor.executemany('''
+                       INSERT INTO transactions (user_id, family_id, amount, currency, category, type,
+                                                 description, date)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ''', batch)
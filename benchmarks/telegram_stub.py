@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+# Методы Bot API, которые считаются исходящими сообщениями
+SEND_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'sendDocument'}
+
+# Разброс времени прихода запросов относительно выдачи токенов (параллельные HTTP-запросы)
+DEFAULT_SLACK = 0.05
+
+_PATH = re.compile(r'^/bot(?P<token>[^/]+)/(?P<method>\w+)$')
+_MULTIPART_CHAT_ID = re.compile(rb'name="chat_id"\r\n\r\n(-?\d+)')
+
+
+class OutboundLog:
+    """Потокобезопасный журнал исходящих: (время прихода, chat_id, метод)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[tuple] = []
+        self.methods = Counter()
+
+    def record(self, chat_id: Optional[int], method: str):
+        with self._lock:
+            self.methods[method] += 1
+            if method in SEND_METHODS and chat_id is not None:
+                self.calls.append((time.monotonic(), chat_id, method))
+
+    def snapshot(self) -> List[tuple]:
+        with self._lock:
+            return sorted(self.calls)
+
+
+def conforms(times: List[float], rate: float, burst: float, slack: float = DEFAULT_SLACK) -> int:
+    """Число отправок сверх ведра токенов (rate в секунду, burst подряд); 0 — лимит соблюден"""
+    violations = 0
+    tokens = burst
+    previous = None
+    for moment in times:
+        if previous is not None:
+            tokens = min(burst, tokens + (moment - previous) * rate)
+        previous = moment
+        if tokens < 1 - rate * slack:
+            violations += 1
+        tokens -= 1
+    return violations
+
+
+def check(calls: List[tuple], global_rate: float, per_chat_rate: float, per_chat_burst: float,
+          slack: float = DEFAULT_SLACK) -> Dict:
+    """Проверка журнала на глобальный лимит и лимит на чат"""
+    by_chat: Dict[int, List[float]] = {}
+    for moment, chat_id, _ in calls:
+        by_chat.setdefault(chat_id, []).append(moment)
+
+    chat_violations = {chat_id: count for chat_id, times in by_chat.items()
+                       if (count := conforms(times, per_chat_rate, per_chat_burst, slack))}
+    elapsed = calls[-1][0] - calls[0][0] if len(calls) > 1 else 0.0
+    return {
+        'sent': len(calls),
+        'chats': len(by_chat),
+        'elapsed': round(elapsed, 3),
+        'rate': round(len(calls) / elapsed, 1) if elapsed > 0 else None,
+        'max_chat_messages': max((len(times) for times in by_chat.values()), default=0),
+        'global_violations': conforms([moment for moment, _, _ in calls], global_rate, global_rate, slack),
+        'chat_violations': sum(chat_violations.values()),
+        'violating_chats': sorted(chat_violations)[:10],
+    }
+
+
+def _message(message_id: int, chat_id: int, fields: Dict) -> Dict:
+    message = {'message_id': message_id, 'date': int(time.time()),
+               'chat': {'id': chat_id, 'type': 'private'}}
+    if 'text' in fields:
+        message['text'] = fields['text']
+    return message
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Ответы в формате Bot API: getMe, отправка и редактирование сообщений, остальное — true"""
+
+    protocol_version = 'HTTP/1.1'
+    outbound: OutboundLog = None
+    message_ids = itertools.count(1)
+
+    def do_POST(self):
+        match = _PATH.match(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if match is None:
+            return self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+        fields = self._fields(body)
+        method = match.group('method')
+        chat_id = fields.get('chat_id')
+        chat_id = int(chat_id) if chat_id is not None and str(chat_id).lstrip('-').isdigit() else None
+        self.outbound.record(chat_id, method)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot',
+                      'can_join_groups': False, 'can_read_all_group_messages': False,
+                      'supports_inline_queries': False}
+        elif method in SEND_METHODS:
+            result = _message(next(self.message_ids), chat_id or 0, fields)
+            if method == 'sendPhoto':
+                result['photo'] = [{'file_id': f'stub-{result["message_id"]}',
+                                    'file_unique_id': f'stub-{result["message_id"]}', 'width': 1, 'height': 1}]
+        else:
+            result = True
+        self._reply(200, {'ok': True, 'result': result})
+
+    do_GET = do_POST
+
+    def _fields(self, body: bytes) -> Dict:
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        if content_type.startswith('multipart/form-data'):
+            match = _MULTIPART_CHAT_ID.search(body)
+            return {'chat_id': match.group(1).decode()} if match else {}
+        return {key: values[-1] for key, values in parse_qs(body.decode('utf-8')).items()}
+
+    def _reply(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host: str = '127.0.0.1', port: int = 0):
+    """Запуск заглушки в фоновом потоке; возвращает (server, OutboundLog, base_url для TELEGRAM_API_URL)"""
+    outbound = OutboundLog()
+    handler = type('Handler', (StubHandler,), {'outbound': outbound})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='telegram-stub', daemon=True).start()
+    return server, outbound, f'http://{host}:{server.server_address[1]}/bot'
+
+
+async def drive(base_url: str, chats: int, interactive: int, global_rate: float, per_chat_rate: float,
+                per_chat_burst: float) -> Dict:
+    """Рассылка по chats чатам и серия ответов в один чат через OutboundScheduler и настоящий Bot"""
+    from telegram import Bot
+
+    from outbox import BULK, INTERACTIVE, OutboundScheduler
+
+    scheduler = OutboundScheduler(global_rate=global_rate, per_chat_rate=per_chat_rate,
+                                  per_chat_burst=per_chat_burst)
+    async with Bot('123456:stub', base_url=base_url) as bot:
+        broadcast = scheduler.broadcast(
+            range(1, chats + 1), lambda chat_id: (lambda: bot.send_message(chat_id, 'bulk')), priority=BULK
+        )
+        replies = [scheduler.send(chats + 1, lambda: bot.send_message(chats + 1, 'reply'), INTERACTIVE)
+                   for _ in range(interactive)]
+        results = await asyncio.gather(broadcast, *replies, return_exceptions=True)
+    errors = sum(1 for result in results[0] if isinstance(result, Exception))
+    errors += sum(1 for result in results[1:] if isinstance(result, Exception))
+    return {**scheduler.stats(), 'errors': errors}
+
+
+def print_check(report: Dict, log=print):
+    log(f"{report['sent']} messages to {report['chats']} chats in {report['elapsed']}s "
+        f"({report['rate']} msg/s), max per chat {report['max_chat_messages']}")
+    log(f"global limit violations: {report['global_violations']}, per-chat violations: "
+        f"{report['chat_violations']} {report['violating_chats'] or ''}".rstrip())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.telegram_stub',
+                                     description='Заглушка Bot API: проверка лимитов исходящих сообщений')
+    parser.add_argument('--serve', action='store_true',
+                        help='только заглушка для запущенного бота (TELEGRAM_API_URL), проверка по Ctrl+C')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--chats', type=int, default=100, help='чатов в массовой рассылке')
+    parser.add_argument('--interactive', type=int, default=10, help='ответов подряд в один чат')
+    parser.add_argument('--global-rate', type=float, default=float(os.getenv('TELEGRAM_GLOBAL_RATE', 25)))
+    parser.add_argument('--chat-rate', type=float, default=float(os.getenv('TELEGRAM_CHAT_RATE', 1)))
+    parser.add_argument('--chat-burst', type=float, default=float(os.getenv('TELEGRAM_CHAT_BURST', 3)))
+    parser.add_argument('--slack', type=float, default=DEFAULT_SLACK, help='допуск по времени прихода, с')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    server, outbound, base_url = start_stub(args.host, 0 if not args.serve else args.port)
+
+    if args.serve:
+        print(f'Bot API stub on {base_url} (TELEGRAM_API_URL={base_url}), Ctrl+C to check and exit')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(f'Sending {args.chats} bulk + {args.interactive} interactive messages through {base_url}...')
+        stats = asyncio.run(drive(base_url, args.chats, args.interactive, args.global_rate, args.chat_rate,
+                                  args.chat_burst))
+        print(f"outbox: sent {stats['sent']}, failed {stats['errors']}, retried {stats['retried']}, "
+              f"avg queue wait {stats['avg_queue_wait_ms']} ms")
+    server.shutdown()
+
+    report = check(outbound.snapshot(), args.global_rate, args.chat_rate, args.chat_burst, args.slack)
+    print_check(report)
+    return 1 if report['global_violations'] or report['chat_violations'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,20 @@
+import startup
 import os
 import logging
 import uuid
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from telegram.constants import ParseMode
-from database import Database
+
+with startup.step('import telegram'):
+    from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+    from telegram.constants import ParseMode
+with startup.step('import bot modules'):
+    from database import Database, LRUCache, parse_month
+    from async_database import AsyncDatabase
+    from charts import ChartCache, ChartsUnavailable
+    from outbox import OutboundScheduler, BULK
 from datetime import datetime
 import asyncio
+import functools
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,11 +25,79 @@ logger = logging.getLogger(__name__)
 
 
 class FamilyFinanceBot:
-    def __init__(self, token):
+    def __init__(self, token, db: Database = None, analytics: startup.Lazy = None, charts: ChartCache = None):
         self.token = token
-        self.db = Database()
+        self.db = AsyncDatabase(db or Database())
+        # pandas нужен только для /trends: загружается при первой команде
+        self.analytics = analytics or startup.Lazy('analytics', self._create_analytics)
+        # Графики в /report: файл с диска, а повторная отправка того же файла — по file_id без загрузки
+        self.charts = charts or ChartCache()
+        self.report_charts = os.getenv('BOT_REPORT_CHARTS', '1') == '1'
+        self.chart_file_ids = LRUCache(max_size=int(os.getenv('CHART_FILE_ID_CACHE', 1000)), ttl=7 * 24 * 3600)
+        # Исходящие сообщения идут через планировщик с лимитами Telegram
+        self.outbox = OutboundScheduler(
+            global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', 25)),
+            per_chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', 1)),
+            per_chat_burst=float(os.getenv('TELEGRAM_CHAT_BURST', 3))
+        )
+        self.family_notifications = os.getenv('FAMILY_NOTIFICATIONS', '0') == '1'
         self.web_app_url = os.getenv('WEB_APP_URL', 'https://family-finance-bot-ccdb.onrender.com')
 
+    def _create_analytics(self):
+        from analytics import AnalyticsEngine
+        return AnalyticsEngine(self.db.db)
+
+    async def reply(self, message, text, **kwargs):
+        """Ответ на сообщение через планировщик исходящих"""
+        return await self.outbox.send(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+    async def edit(self, query, text, **kwargs):
+        """Редактирование сообщения callback-запроса через планировщик исходящих"""
+        return await self.outbox.send(query.message.chat_id, lambda: query.edit_message_text(text, **kwargs))
+
+    async def send_chart(self, message, render, *args, caption: str = None, **kwargs):
+        """Отправка графика фотографией; рендер (или попадание в кэш) в пуле потоков"""
+        try:
+            path = await self.db.run(render, *args, **kwargs)
+        except ChartsUnavailable:
+            return None
+
+        file_id = self.chart_file_ids.get(path)
+        photo = file_id or await self.db.run(_read_bytes, path)
+        sent = await self.outbox.send(message.chat_id, lambda: message.reply_photo(photo=photo, caption=caption))
+        if file_id is None and sent is not None and sent.photo:
+            self.chart_file_ids.set(path, sent.photo[-1].file_id)
+        return sent
+
+    async def send_report_charts(self, message, db_user: dict, year: int = None, month: int = None):
+        """Категории расходов за месяц и динамика за полгода"""
+        report = await self.db.get_monthly_report(db_user['id'], year, month)
+        if report['categories']:
+            await self.send_chart(message, self.charts.category_donut, report['categories'], report['currency'],
+                                  caption="🏷️ Расходы по категориям")
+        totals = await self.db.get_monthly_totals(user_id=db_user['id'], months=6, year=year, month=month)
+        if any(item['income'] or item['expense'] for item in totals):
+            await self.send_chart(message, self.charts.monthly_trend, totals, report['currency'],
+                                  caption="📈 Доходы и расходы за 6 месяцев")
+
+    async def notify_family(self, bot, db_user: dict, text: str):
+        """Уведомление остальных членов семьи (низкий приоритет, не задерживает ответы)"""
+        if not self.family_notifications or not db_user.get('family_id'):
+            return
+        members = await self.db.get_family_members(db_user['family_id'])
+        chat_ids = [member['telegram_id'] for member in members if member['id'] != db_user['id']]
+        if not chat_ids:
+            return
+        # Уведомления одному участнику, накопившиеся за время ожидания его лимита, уходят одним сообщением
+        results = await asyncio.gather(
+            *(self.outbox.send_text(chat_id, text, functools.partial(bot.send_message, chat_id), priority=BULK)
+              for chat_id in chat_ids),
+            return_exceptions=True
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            logger.warning(f"Family notification failed for {failed} of {len(chat_ids)} members")
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start с красивым оформлением"""
         user = update.effective_user
@@ -31,8 +107,8 @@ class FamilyFinanceBot:
         telegram_id = user.id
         user_name = user.first_name or user.username or f"User_{telegram_id}"
 
-        if not self.db.user_exists(telegram_id):
-            self.db.add_user(telegram_id, user.username, user.first_name)
+        if not await self.db.user_exists(telegram_id):
+            await self.db.add_user(telegram_id, user.username, user.first_name)
             welcome_msg = f"👋 *Привет, {user_name}!*\n\n"
             welcome_msg += "Добро пожаловать в *Семейную Копилку* — ваш личный помощник для управления бюджетом! 🏠💰"
         else:
@@ -68,7 +144,8 @@ class FamilyFinanceBot:
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         # Отправляем сообщение с разметкой
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             welcome_msg,
             reply_markup=reply_markup,
             parse_mode=ParseMode.MARKDOWN,
@@ -84,7 +161,8 @@ class FamilyFinanceBot:
         help_text += "`/help` - справка по командам\n\n"
         help_text += "💡 *Совет:* Используйте кнопки ниже для быстрого доступа к функциям!"
 
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             help_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
@@ -99,7 +177,8 @@ class FamilyFinanceBot:
 `/start` - Начать работу с ботом
 `/help` - Показать эту справку
 `/add [сумма] [категория]` - Добавить транзакцию
-`/report` - Получить отчет за месяц
+`/report [ГГГГ-ММ]` - Получить отчет за месяц
+`/trends` - Динамика расходов
 `/balance` - Показать баланс
 `/family` - Управление семьей
 `/settings` - Настройки
@@ -128,7 +207,8 @@ class FamilyFinanceBot:
                                           web_app=WebAppInfo(
                                               url=f"{self.web_app_url}/?telegram_id={update.effective_user.id}"))]]
 
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             help_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup(keyboard),
@@ -141,7 +221,8 @@ class FamilyFinanceBot:
         args = context.args
 
         if not args or len(args) < 2:
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 "❌ *Использование:* `/add [сумма] [категория] [описание]`\n\n"
                 "*Примеры:*\n"
                 "`/add 5000 Зарплата` - доход\n"
@@ -159,18 +240,21 @@ class FamilyFinanceBot:
             amount_abs = abs(amount)
 
             # Получаем пользователя
-            db_user = self.db.get_user_by_telegram_id(user.id)
+            db_user = await self.db.get_user_by_telegram_id(user.id)
             if not db_user:
-                self.db.add_user(user.id, user.username, user.first_name)
-                db_user = self.db.get_user_by_telegram_id(user.id)
+                await self.db.add_user(user.id, user.username, user.first_name)
+                db_user = await self.db.get_user_by_telegram_id(user.id)
 
             # Добавляем транзакцию
-            transaction_id = self.db.add_transaction(
+            transaction_id = await self.db.add_transaction(
                 user_id=db_user['id'],
                 amount=amount_abs,
                 category=category,
                 type=transaction_type,
-                description=description
+                description=description,
+                family_id=db_user.get('family_id'),
+                # Повторная доставка того же сообщения не добавит операцию второй раз
+                idempotency_key=f"msg:{update.message.chat_id}:{update.message.message_id}"
             )
 
             # Формируем эмодзи для типа
@@ -191,34 +275,54 @@ class FamilyFinanceBot:
                 [InlineKeyboardButton("📊 Отчет", callback_data='report')]
             ]
 
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 response,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            context.application.create_task(self.notify_family(
+                context.bot, db_user,
+                f"{type_emoji} {user.first_name or user.username}: {'+' if transaction_type == 'income' else '-'}"
+                f"{amount_abs} ₽, {category}"
+            ))
 
         except ValueError:
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 "❌ Ошибка! Сумма должна быть числом.\n"
                 "Пример: `/add 1500 Еда` или `/add -500 Транспорт`",
                 parse_mode=ParseMode.MARKDOWN
             )
 
+    @staticmethod
+    def _parse_period(args):
+        """Месяц отчета из аргументов команды (YYYY-MM), по умолчанию текущий"""
+        if args:
+            try:
+                return parse_month(args[0])
+            except ValueError:
+                pass
+        now = datetime.utcnow()
+        return now.year, now.month
+
     async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /balance"""
         user = update.effective_user
 
-        db_user = self.db.get_user_by_telegram_id(user.id)
+        db_user = await self.db.get_user_by_telegram_id(user.id)
         if not db_user:
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 "❌ Вы не зарегистрированы. Используйте /start для начала работы."
             )
             return
 
-        report = self.db.get_monthly_report(db_user['id'])
+        year, month = self._parse_period(context.args)
+        report = await self.db.get_monthly_report(db_user['id'], year, month)
 
         balance_text = f"💰 *ВАШ БАЛАНС*\n\n"
-        balance_text += f"📅 *Период:* {datetime.now().strftime('%B %Y')}\n\n"
+        balance_text += f"📅 *Период:* {datetime(year, month, 1).strftime('%B %Y')}\n\n"
         balance_text += f"📈 *Доходы:* +{report['total_income']:,} ₽\n"
         balance_text += f"📉 *Расходы:* -{report['total_expense']:,} ₽\n"
         balance_text += f"━━━━━━━━━━━━━━━━━━\n"
@@ -236,7 +340,8 @@ class FamilyFinanceBot:
              InlineKeyboardButton("🛒 Добавить расход", callback_data='quick_expense')]
         ]
 
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             balance_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -246,17 +351,19 @@ class FamilyFinanceBot:
         """Команда /report"""
         user = update.effective_user
 
-        db_user = self.db.get_user_by_telegram_id(user.id)
+        db_user = await self.db.get_user_by_telegram_id(user.id)
         if not db_user:
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 "❌ Вы не зарегистрированы. Используйте /start для начала работы."
             )
             return
 
-        report = self.db.get_monthly_report(db_user['id'])
+        year, month = self._parse_period(context.args)
+        report = await self.db.get_monthly_report(db_user['id'], year, month)
 
         report_text = f"📊 *ОТЧЕТ ЗА МЕСЯЦ*\n\n"
-        report_text += f"📅 *Период:* {datetime.now().strftime('%B %Y')}\n\n"
+        report_text += f"📅 *Период:* {datetime(year, month, 1).strftime('%B %Y')}\n\n"
 
         # Статистика
         report_text += f"📈 *Общая статистика:*\n"
@@ -283,26 +390,79 @@ class FamilyFinanceBot:
              InlineKeyboardButton("📋 История", callback_data='history')]
         ]
 
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             report_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+        if self.report_charts and report['categories']:
+            await self.send_chart(update.message, self.charts.category_donut, report['categories'],
+                                  report['currency'], caption="🏷️ Расходы по категориям")
+
+    async def trends_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /trends"""
+        user = update.effective_user
+
+        db_user = await self.db.get_user_by_telegram_id(user.id)
+        if not db_user:
+            await self.reply(
+                update.message,
+                "❌ Вы не зарегистрированы. Используйте /start для начала работы."
+            )
+            return
+
+        # Первая загрузка аналитики (импорт pandas) не должна блокировать цикл событий
+        analytics = await self.db.run(self.analytics.get)
+        trends = await self.db.run(analytics.trends, user_id=db_user['id'], months=6)
+        merchants = await self.db.run(analytics.top_merchants, user_id=db_user['id'], limit=3)
+
+        if not trends['months']:
+            await self.reply(update.message, "📭 Пока нет операций для анализа. Добавьте их через /add")
+            return
+
+        trends_text = "📈 *ДИНАМИКА ЗА 6 МЕСЯЦЕВ*\n\n"
+        for month in trends['months']:
+            change = month['expense_change_pct']
+            arrow = "" if change is None else (f" 🔺{change:+.0f}%" if change > 0 else f" 🔻{change:+.0f}%")
+            trends_text += f"📅 *{month['month']}*: -{month['expense']:,} ₽{arrow}\n"
+
+        last = trends['months'][-1]
+        trends_text += f"\n📊 *Среднее за {trends['window']} мес.:* {last['expense_rolling_avg']:,} ₽\n"
+
+        if merchants:
+            trends_text += "\n🏪 *Крупнейшие расходы:*\n"
+            for merchant in merchants:
+                trends_text += f"• {merchant['merchant']}: {merchant['total']:,} ₽ ({merchant['share_pct']:.1f}%)\n"
+
+        keyboard = [
+            [InlineKeyboardButton("📱 Детальная аналитика",
+                                  web_app=WebAppInfo(url=f"{self.web_app_url}/reports?telegram_id={user.id}"))]
+        ]
+
+        await self.reply(
+            update.message,
+            trends_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
     async def family_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /family"""
         user = update.effective_user
 
-        db_user = self.db.get_user_by_telegram_id(user.id)
+        db_user = await self.db.get_user_by_telegram_id(user.id)
         if not db_user:
-            await update.message.reply_text(
+            await self.reply(
+                update.message,
                 "❌ Вы не зарегистрированы. Используйте /start для начала работы."
             )
             return
 
         if db_user.get('family_id'):
             # Пользователь в семье
-            members = self.db.get_family_members(db_user['family_id'])
+            members = await self.db.get_family_members(db_user['family_id'])
 
             family_text = f"👨‍👩‍👧‍👦 *ВАША СЕМЬЯ*\n\n"
             family_text += f"👥 *Участники ({len(members)}):*\n"
@@ -314,7 +474,7 @@ class FamilyFinanceBot:
 
             # Создаем инвайт-код
             invite_code = str(uuid.uuid4())[:8]
-            self.db.create_invite(db_user['id'], invite_code)
+            await self.db.create_invite(db_user['id'], invite_code)
 
             family_text += f"\n🔗 *Пригласительный код:*\n`{invite_code}`\n\n"
             family_text += "🎯 *Отправьте этот код другим участникам*"
@@ -339,7 +499,8 @@ class FamilyFinanceBot:
                 InlineKeyboardButton("🔗 Присоединиться", callback_data='join_family')
             ])
 
-        await update.message.reply_text(
+        await self.reply(
+            update.message,
             family_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -363,7 +524,8 @@ class FamilyFinanceBot:
                  InlineKeyboardButton("🛠️ Фриланс", callback_data='income_freelance_7000')],
                 [InlineKeyboardButton("📱 Ввести сумму", callback_data='custom_income')]
             ]
-            await query.edit_message_text(
+            await self.edit(
+                query,
                 "💰 *ДОБАВЛЕНИЕ ДОХОДА*\n\nВыберите категорию или укажите свою сумму:",
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
@@ -380,7 +542,8 @@ class FamilyFinanceBot:
                  InlineKeyboardButton("🏥 Здоровье", callback_data='expense_health_1500')],
                 [InlineKeyboardButton("📱 Ввести сумму", callback_data='custom_expense')]
             ]
-            await query.edit_message_text(
+            await self.edit(
+                query,
                 "🛒 *ДОБАВЛЕНИЕ РАСХОДА*\n\nВыберите категорию или укажите свою сумму:",
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
@@ -394,18 +557,22 @@ class FamilyFinanceBot:
                 category = parts[1]
                 amount = float(parts[2]) if len(parts) > 2 else 0
 
-                db_user = self.db.get_user_by_telegram_id(telegram_id)
+                db_user = await self.db.get_user_by_telegram_id(telegram_id)
                 if db_user:
-                    transaction_id = self.db.add_transaction(
+                    transaction_id = await self.db.add_transaction(
                         user_id=db_user['id'],
                         amount=amount,
                         category=category,
                         type=trans_type,
-                        description=f"Быстрая операция через бота"
+                        description=f"Быстрая операция через бота",
+                        family_id=db_user.get('family_id'),
+                        # Повторное нажатие кнопки того же меню возвращает уже созданную операцию
+                        idempotency_key=f"cb:{query.message.chat_id}:{query.message.message_id}:{data}"
                     )
 
                     emoji = "💰" if trans_type == 'income' else "🛒"
-                    await query.edit_message_text(
+                    await self.edit(
+                        query,
                         f"{emoji} *Операция добавлена!*\n\n"
                         f"💵 Сумма: {amount:,} ₽\n"
                         f"🏷️ Категория: {category}\n"
@@ -417,6 +584,11 @@ class FamilyFinanceBot:
         elif data == 'report':
             await self.report_command_for_callback(query, telegram_id)
 
+        elif data == 'charts':
+            db_user = await self.db.get_user_by_telegram_id(telegram_id)
+            if db_user:
+                await self.send_report_charts(query.message, db_user)
+
         elif data == 'family':
             await self.family_command_for_callback(query, telegram_id)
 
@@ -427,7 +599,8 @@ class FamilyFinanceBot:
             keyboard = [[InlineKeyboardButton("📱 Создать в приложении",
                                               web_app=WebAppInfo(
                                                   url=f"{self.web_app_url}/family/create?telegram_id={telegram_id}"))]]
-            await query.edit_message_text(
+            await self.edit(
+                query,
                 "🏠 *СОЗДАНИЕ СЕМЬИ*\n\n"
                 "Для создания семьи откройте веб-приложение.\n"
                 "Там вы сможете:\n"
@@ -441,9 +614,9 @@ class FamilyFinanceBot:
 
     async def report_command_for_callback(self, query, telegram_id):
         """Вспомогательный метод для callback"""
-        db_user = self.db.get_user_by_telegram_id(telegram_id)
+        db_user = await self.db.get_user_by_telegram_id(telegram_id)
         if db_user:
-            report = self.db.get_monthly_report(db_user['id'])
+            report = await self.db.get_monthly_report(db_user['id'])
 
             report_text = f"📊 *ОТЧЕТ*\n\n"
             report_text += f"💰 Баланс: {report['balance']:,} ₽\n"
@@ -461,7 +634,8 @@ class FamilyFinanceBot:
                 [InlineKeyboardButton("📈 Графики", callback_data='charts')]
             ]
 
-            await query.edit_message_text(
+            await self.edit(
+                query,
                 report_text,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
@@ -469,9 +643,9 @@ class FamilyFinanceBot:
 
     async def family_command_for_callback(self, query, telegram_id):
         """Вспомогательный метод для callback"""
-        db_user = self.db.get_user_by_telegram_id(telegram_id)
+        db_user = await self.db.get_user_by_telegram_id(telegram_id)
         if db_user and db_user.get('family_id'):
-            members = self.db.get_family_members(db_user['family_id'])
+            members = await self.db.get_family_members(db_user['family_id'])
 
             family_text = f"👨‍👩‍👧‍👦 *СЕМЬЯ*\n\n"
             family_text += f"👥 Участники: {len(members)}\n\n"
@@ -487,7 +661,8 @@ class FamilyFinanceBot:
                                               web_app=WebAppInfo(
                                                   url=f"{self.web_app_url}/family?telegram_id={telegram_id}"))]]
 
-            await query.edit_message_text(
+            await self.edit(
+                query,
                 family_text,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
@@ -511,7 +686,8 @@ class FamilyFinanceBot:
             ]
         ]
 
-        await query.edit_message_text(
+        await self.edit(
+            query,
             help_text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -529,14 +705,16 @@ class FamilyFinanceBot:
         # Приветствие на обычные сообщения
         greetings = ['привет', 'hello', 'hi', 'здравствуй', 'добрый день']
         if text.lower() in greetings:
-            await message.reply_text(
+            await self.reply(
+                message,
                 f"👋 Привет, {update.effective_user.first_name}!\n"
                 f"Используйте /start для начала работы или /help для справки."
             )
             return
 
         # Ответ на другие сообщения
-        await message.reply_text(
+        await self.reply(
+            message,
             "🤖 Я финансовый бот-помощник!\n\n"
             "Используйте команды:\n"
             "• /start - Начать работу\n"
@@ -546,9 +724,20 @@ class FamilyFinanceBot:
             "Или воспользуйтесь кнопками в меню!"
         )
 
-    def run(self):
-        """Запуск бота"""
-        application = Application.builder().token(self.token).build()
+    async def shutdown(self, application: Application):
+        """Остановка пула потоков БД при завершении бота"""
+        logger.info(f"DB executor stats: {self.db.stats()}")
+        logger.info(f"Outbox stats: {self.outbox.stats()}")
+        self.db.close()
+
+    def build_application(self) -> Application:
+        """Создание Application с зарегистрированными обработчиками"""
+        builder = Application.builder().token(self.token).post_shutdown(self.shutdown)
+        # Локальная заглушка Bot API для проверки лимитов (python -m benchmarks.telegram_stub --serve):
+        # TELEGRAM_API_URL=http://127.0.0.1:8081/bot
+        if os.getenv('TELEGRAM_API_URL'):
+            builder = builder.base_url(os.getenv('TELEGRAM_API_URL'))
+        application = builder.build()
 
         # Регистрация обработчиков команд
         application.add_handler(CommandHandler("start", self.start))
@@ -556,12 +745,19 @@ class FamilyFinanceBot:
         application.add_handler(CommandHandler("add", self.add_transaction))
         application.add_handler(CommandHandler("balance", self.balance_command))
         application.add_handler(CommandHandler("report", self.report_command))
+        application.add_handler(CommandHandler("trends", self.trends_command))
         application.add_handler(CommandHandler("family", self.family_command))
 
         # Обработчики callback и сообщений
         application.add_handler(CallbackQueryHandler(self.handle_callback))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
+        return application
+
+    def run(self):
+        """Запуск бота"""
+        application = self.build_application()
+
         # Запуск webhook для Render
         print(f"🤖 Бот запускается...")
         print(f"🌐 Webhook URL: {self.web_app_url}/webhook")
@@ -575,11 +771,18 @@ class FamilyFinanceBot:
         )
 
 
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+
 if __name__ == '__main__':
     token = os.getenv('TELEGRAM_BOT_TOKEN')
     if not token:
         print("❌ ОШИБКА: TELEGRAM_BOT_TOKEN не установлен!")
         exit(1)
 
-    bot = FamilyFinanceBot(token)
+    with startup.step('database'):
+        bot = FamilyFinanceBot(token)
+    startup.ready()
     bot.run()
\ No newline at end of file
@@ -0,0 +1,49 @@
+from typing import Iterable
+
+# Журнал изменений с монотонным seq: курсор синхронизации клиентов
+CREATE_CHANGE_LOG_SQL = '''
+                        CREATE TABLE IF NOT EXISTS change_log
+                        (
+                            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                            entity TEXT NOT NULL,
+                            entity_id INTEGER NOT NULL,
+                            op TEXT NOT NULL,
+                            user_id INTEGER NOT NULL,
+                            family_id INTEGER,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                        '''
+
+CHANGE_LOG_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log (user_id, seq)',
+    'CREATE INDEX IF NOT EXISTS idx_change_log_family_seq ON change_log (family_id, seq)',
+]
+
+OP_INSERT = 'insert'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+
+_CHUNK_SIZE = 500
+
+
+def record_changes(cursor, op: str, transaction_ids: Iterable[int]):
+    """Запись изменений транзакций в журнал (в той же транзакции, что и само изменение)"""
+    # Для удаления вызывается до DELETE, пока строки еще существуют
+    ids = list(transaction_ids)
+    for i in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[i:i + _CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+                       INSERT INTO change_log (entity, entity_id, op, user_id, family_id)
+                       SELECT 'transaction', id, ?, user_id, family_id
+                       FROM transactions
+                       WHERE id IN ({placeholders})
+                       ORDER BY id
+                       ''', [op] + chunk)
+
+
+def create_change_log(cursor):
+    """Миграция: таблица журнала изменений и ее индексы"""
+    cursor.execute(CREATE_CHANGE_LOG_SQL)
+    for statement in CHANGE_LOG_INDEXES:
+        cursor.execute(statement)
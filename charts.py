@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Меняется при изменении оформления: старые файлы кэша перестают совпадать по ключу
+CHART_STYLE_VERSION = 1
+
+# Палитра как в static/js/charts.js
+COLORS = ['#4cc9f0', '#7209b7', '#f8961e', '#f72585', '#38b000', '#4361ee', '#9c27b0', '#ff9800',
+          '#00bcd4', '#8bc34a', '#ff5722', '#673ab7']
+INCOME_COLOR = '#4cc9f0'
+EXPENSE_COLOR = '#f72585'
+
+# Мелкие категории на кольцевой диаграмме сворачиваются в «Другое»
+MAX_SLICES = 7
+
+CURRENCY_SIGNS = {'RUB': '₽', 'USD': '$', 'EUR': '€'}
+
+
+class ChartsUnavailable(RuntimeError):
+    """matplotlib не установлен"""
+
+
+def _matplotlib():
+    """Отложенный импорт matplotlib (несколько сотен мс) с безоконным бэкендом"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.figure import Figure
+    except ImportError as error:
+        raise ChartsUnavailable('matplotlib is not installed') from error
+    return Figure
+
+
+def _money(value: float, currency: str) -> str:
+    sign = CURRENCY_SIGNS.get(currency, currency)
+    return f'{value:,.0f} {sign}'.replace(',', ' ')
+
+
+class ChartCache:
+    """Рендер графиков отчетов с дисковым кэшем по хэшу агрегатов: повторный показ без отрисовки"""
+
+    def __init__(self, directory: str = None, max_files: int = None):
+        self.directory = directory or os.getenv('CHART_CACHE_DIR', 'chart_cache')
+        self.max_files = max_files or int(os.getenv('CHART_CACHE_MAX_FILES', 2000))
+        # matplotlib не потокобезопасен (кэш шрифтов, mathtext): рисуем по одному
+        self._render_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._files = None
+        self._stats = {'hits': 0, 'misses': 0, 'render_time': 0.0, 'evicted': 0}
+
+    def category_donut(self, categories: List[Dict], currency: str, title: str = '', fmt: str = 'png') -> str:
+        """Кольцевая диаграмма расходов по категориям; categories — [{'category', 'total'}]"""
+        slices = [(item['category'], round(item['total'], 2)) for item in categories if item['total'] > 0]
+        slices.sort(key=lambda item: (-item[1], item[0]))
+        if len(slices) > MAX_SLICES:
+            other = round(sum(total for _, total in slices[MAX_SLICES - 1:]), 2)
+            slices = slices[:MAX_SLICES - 1] + [('Другое', other)]
+        spec = {'kind': 'category_donut', 'title': title, 'currency': currency, 'slices': slices}
+        return self._get_or_render(spec, fmt, self._draw_donut)
+
+    def monthly_trend(self, months: List[Dict], currency: str, title: str = '', fmt: str = 'png') -> str:
+        """Доходы и расходы по месяцам; months — [{'month', 'income', 'expense'}]"""
+        points = [(item['month'], round(item['income'], 2), round(item['expense'], 2)) for item in months]
+        spec = {'kind': 'monthly_trend', 'title': title, 'currency': currency, 'points': points}
+        return self._get_or_render(spec, fmt, self._draw_trend)
+
+    def key(self, spec: Dict, fmt: str) -> str:
+        """Ключ кэша: SHA-256 от нормализованных агрегатов, формата и версии оформления"""
+        payload = json.dumps({**spec, 'format': fmt, 'style': CHART_STYLE_VERSION},
+                             ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def _get_or_render(self, spec: Dict, fmt: str, draw: Callable) -> str:
+        if fmt not in CHART_FORMATS:
+            raise ValueError(f'Unsupported chart format: {fmt}')
+        path = self._path(self.key(spec, fmt), fmt)
+        if self._hit(path):
+            return path
+
+        Figure = _matplotlib()
+        with self._render_lock:
+            # Пока ждали блокировку, такой же график мог отрисовать другой поток
+            if self._hit(path):
+                return path
+
+            started = time.perf_counter()
+            figure = draw(Figure, spec)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Запись во временный файл и атомарная замена: читатели не видят недописанный файл
+            descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=f'.{fmt}.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    figure.savefig(file, format=fmt, dpi=144, bbox_inches='tight', facecolor='white',
+                                   metadata={'Software': None} if fmt == 'png' else {'Date': None})
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['render_time'] += elapsed
+            if self._files is not None:
+                self._files += 1
+        self._prune()
+        return path
+
+    def _hit(self, path: str) -> bool:
+        """Попадание в кэш: обновляет mtime файла, чтобы _prune вытеснял давно не запрошенные графики"""
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        with self._lock:
+            self._stats['hits'] += 1
+        return True
+
+    def _prune(self):
+        """Удаление давно не запрошенных файлов (по mtime) при превышении max_files"""
+        with self._lock:
+            if self._files is not None and self._files <= self.max_files:
+                return
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        evicted = 0
+        if len(files) > self.max_files:
+            files.sort()
+            # Удаляем с запасом, чтобы не обходить каталог после каждого рендера
+            for _, path in files[:len(files) - int(self.max_files * 0.9)]:
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except OSError:
+                    pass
+        with self._lock:
+            self._files = len(files) - evicted
+            self._stats['evicted'] += evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, 'render_time': round(self._stats['render_time'], 3), 'files': self._files}
+
+    @staticmethod
+    def _draw_donut(Figure, spec: Dict):
+        figure = Figure(figsize=(6, 6))
+        axes = figure.subplots()
+        slices = spec['slices']
+        total = sum(value for _, value in slices)
+        if not slices:
+            axes.text(0, 0, 'Нет расходов', ha='center', va='center', fontsize=16, color='#888888')
+            axes.set_xlim(-1, 1)
+            axes.set_ylim(-1, 1)
+        else:
+            wedges, _ = axes.pie(
+                [value for _, value in slices],
+                colors=[COLORS[index % len(COLORS)] for index in range(len(slices))],
+                startangle=90, counterclock=False,
+                wedgeprops={'width': 0.4, 'edgecolor': 'white', 'linewidth': 2}
+            )
+            axes.text(0, 0, _money(total, spec['currency']), ha='center', va='center', fontsize=16,
+                      fontweight='bold')
+            axes.legend(wedges, [f'{name} — {value / total * 100:.0f}%' for name, value in slices],
+                        loc='upper center', bbox_to_anchor=(0.5, 0.02), ncol=2, frameon=False, fontsize=10)
+        axes.set_aspect('equal')
+        axes.axis('off')
+        if spec['title']:
+            axes.set_title(spec['title'], fontsize=14)
+        return figure
+
+    @staticmethod
+    def _draw_trend(Figure, spec: Dict):
+        figure = Figure(figsize=(8, 4.5))
+        axes = figure.subplots()
+        labels = [month for month, _, _ in spec['points']]
+        positions = range(len(labels))
+        axes.plot(positions, [income for _, income, _ in spec['points']], color=INCOME_COLOR, marker='o',
+                  linewidth=2, label='Доходы')
+        axes.plot(positions, [expense for _, _, expense in spec['points']], color=EXPENSE_COLOR, marker='o',
+                  linewidth=2, label='Расходы')
+        axes.fill_between(positions, [income for _, income, _ in spec['points']], color=INCOME_COLOR, alpha=0.1)
+        axes.fill_between(positions, [expense for _, _, expense in spec['points']], color=EXPENSE_COLOR, alpha=0.1)
+        axes.set_xticks(list(positions))
+        axes.set_xticklabels(labels, rotation=45, ha='right', fontsize=9)
+        axes.yaxis.set_major_formatter(lambda value, _: _money(value, spec['currency']))
+        axes.set_ylim(bottom=0)
+        axes.grid(axis='y', color='#000000', alpha=0.05)
+        for side in ('top', 'right'):
+            axes.spines[side].set_visible(False)
+        axes.legend(frameon=False)
+        if spec['title']:
+            axes.set_title(spec['title'], fontsize=14)
+        return figure
@@ -1,384 +1,1370 @@
+import base64
+import binascii
 import sqlite3
 import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import os
 
+from migrations import apply_migrations, check_index_coverage, latest_version, read_schema_version
+from rollups import apply_rollups, rebuild_rollups
+from changes import OP_DELETE, OP_INSERT, OP_UPDATE, record_changes
+from importer import TRANSACTION_TYPES, ImportRowError, normalize_row, parse_date
+from money import DEFAULT_CURRENCY, REFERENCE_CURRENCY, convert_rows, from_minor, normalize_currency, to_minor
 
-class Database:
-    def __init__(self, db_path: str = "family_finance.db"):
+logger = logging.getLogger(__name__)
+
+
+def month_bounds(year: int = None, month: int = None) -> Tuple[str, str]:
+    """Границы месяца [начало, начало следующего) в формате колонки date"""
+    now = datetime.utcnow()
+    year = year or now.year
+    month = month or now.month
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+
+def parse_month(value: str) -> Tuple[int, int]:
+    """Разбор месяца в формате YYYY-MM"""
+    parsed = datetime.strptime(value, '%Y-%m')
+    return parsed.year, parsed.month
+
+
+def build_report(rows, start: str, end: str, currency: str = DEFAULT_CURRENCY,
+                 rates: Dict[str, float] = None) -> Dict:
+    """Сборка отчета из строк (type, category, currency, total, count) в валюте currency"""
+    return _build_report(convert_rows(rows, currency, rates or {}), start, end, currency)
+
+
+def _build_report(rows, start: str, end: str, currency: str) -> Dict:
+    """Отчет из строк (type, category, total, count), суммы в минимальных единицах currency"""
+    total_income = 0
+    total_expense = 0
+    categories = []
+    income_categories = []
+    count = 0
+
+    for row in rows:
+        item = {'category': row['category'], 'total': from_minor(row['total'], currency)}
+        count += row['count']
+        if row['type'] == 'income':
+            total_income += row['total']
+            income_categories.append(item)
+        else:
+            total_expense += row['total']
+            categories.append(item)
+
+    categories.sort(key=lambda item: item['total'], reverse=True)
+    income_categories.sort(key=lambda item: item['total'], reverse=True)
+
+    return {
+        'total_income': from_minor(total_income, currency),
+        'total_expense': from_minor(total_expense, currency),
+        'balance': from_minor(total_income - total_expense, currency),
+        'currency': currency,
+        'categories': categories,
+        'income_categories': income_categories,
+        'transactions_count': count,
+        'period': {'start': start, 'end': end}
+    }
+
+
+def build_family_report(rows, members: List[Dict], start: str, end: str, currency: str = DEFAULT_CURRENCY,
+                        rates: Dict[str, float] = None) -> Dict:
+    """Семейный отчет из строк (member_id, type, category, currency, total, count)"""
+    rows = convert_rows(rows, currency, rates or {}, keys=('member_id', 'type', 'category'))
+    report = _build_report(_merge_members(rows), start, end, currency)
+    total_expense = sum(row['total'] for row in rows if row['type'] != 'income')
+
+    by_member = {
+        member['id']: {
+            'user_id': member['id'],
+            'name': member.get('first_name') or member.get('username') or f"Участник {member['id']}",
+            'income': 0,
+            'expense': 0,
+            'count': 0
+        }
+        for member in members
+    }
+    for row in rows:
+        # Бывшие участники остаются в отчете за период, когда они были в семье
+        member = by_member.setdefault(row['member_id'], {
+            'user_id': row['member_id'], 'name': f"Участник {row['member_id']}",
+            'income': 0, 'expense': 0, 'count': 0
+        })
+        member['income' if row['type'] == 'income' else 'expense'] += row['total']
+        member['count'] += row['count']
+
+    for member in by_member.values():
+        member['expense_share_pct'] = round(member['expense'] / total_expense * 100, 1) if total_expense else 0.0
+        member['balance'] = from_minor(member['income'] - member['expense'], currency)
+        member['income'] = from_minor(member['income'], currency)
+        member['expense'] = from_minor(member['expense'], currency)
+
+    report['members'] = sorted(by_member.values(), key=lambda item: item['expense'], reverse=True)
+    return report
+
+
+def _merge_members(rows) -> List[Dict]:
+    """Свертка строк по участникам до (type, category)"""
+    merged = {}
+    for row in rows:
+        key = (row['type'], row['category'])
+        item = merged.setdefault(key, {'type': row['type'], 'category': row['category'], 'total': 0, 'count': 0})
+        item['total'] += row['total']
+        item['count'] += row['count']
+    return list(merged.values())
+
+
+def transaction_row(row) -> Dict:
+    """Строка transactions для API: сумма в основных единицах своей валюты"""
+    item = dict(row)
+    item['amount'] = from_minor(item['amount'], item['currency'])
+    return item
+
+
+def encode_cursor(date: str, transaction_id: int) -> str:
+    """Непрозрачный курсор пагинации из (date, id)"""
+    raw = json.dumps([date, transaction_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Разбор курсора пагинации; ValueError при некорректном значении"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(date), int(transaction_id)
+    except (TypeError, binascii.Error, json.JSONDecodeError, UnicodeDecodeError) as error:
+        raise ValueError(f'Invalid cursor: {cursor}') from error
+
+
+class PoolTimeoutError(RuntimeError):
+    """Не удалось получить подключение из пула за отведенное время"""
+
+
+class IdempotencyKeyConflict(ValueError):
+    """Ключ идемпотентности уже использован для другой операции"""
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, сообщающий наблюдателям подключения время выполнения запросов"""
+
+    def _timed(self, method, statement, *args):
+        observers = self.connection.observers
+        if not observers:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            for observer in observers:
+                observer(statement, elapsed)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, sql, seq_of_parameters)
+
+    # Основная работа SQLite при чтении идет во время выборки строк; statement=None — не новый запрос
+    def fetchall(self):
+        return self._timed(super().fetchall, None)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, None, size if size is not None else self.arraysize)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Подключение, все курсоры которого — TimedCursor"""
+    observers = ()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class PooledConnection:
+    """Обертка над sqlite3.Connection, возвращающая подключение в пул при закрытии"""
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection.')
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Возврат подключения в пул вместо закрытия"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self._conn is not None:
+            self._conn.rollback()
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+
+class ConnectionPool:
+    """Потокобезопасный пул подключений к SQLite"""
+
+    def __init__(self, db_path: str, size: int = 5, timeout: float = 10.0,
+                 health_check_interval: float = 30.0, pragmas: Dict = None, observers: List = None):
         self.db_path = db_path
-        self.init_db()
+        # Общий список наблюдателей запросов: добавленные позже получают и уже открытые подключения
+        self.observers = observers if observers is not None else []
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = pragmas or {}
+
+        self._idle = deque()
+        self._lock = threading.Condition(threading.Lock())
+        self._last_used = {}
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'acquired': 0,
+            'released': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time': 0.0,
+            'health_checks': 0,
+        }
 
-    def get_connection(self):
-        """Создание подключения к БД"""
-        conn = sqlite3.connect(self.db_path)
+    def _connect(self) -> sqlite3.Connection:
+        """Создание нового подключения с применением PRAGMA"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               factory=TimedConnection)
+        conn.observers = self.observers
         conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
         return conn
 
-    def init_db(self):
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        """Проверка работоспособности подключения"""
+        self._stats['health_checks'] += 1
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        self._last_used.pop(id(conn), None)
+        self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self) -> PooledConnection:
+        """Получение подключения из пула"""
+        deadline = time.monotonic() + self.timeout
+        started = time.monotonic()
+        waited = False
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError('Connection pool is closed')
+
+                if self._idle:
+                    conn = self._idle.pop()
+                    idle_for = time.monotonic() - self._last_used.get(id(conn), 0)
+                    if idle_for > self.health_check_interval and not self._is_healthy(conn):
+                        self._discard(conn)
+                        continue
+                    break
+
+                if self._in_use < self.size:
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'No free connection in pool after {self.timeout}s (size={self.size})'
+                    )
+                waited = True
+                self._lock.wait(remaining)
+
+            self._in_use += 1
+            self._stats['acquired'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - started
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats['created'] += 1
+
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        """Возврат подключения в пул"""
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            self._stats['released'] += 1
+            if self._closed or not healthy or len(self._idle) >= self.size:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            self._lock.notify()
+
+    def health_check(self) -> bool:
+        """Проверка доступности базы через подключение из пула"""
+        try:
+            with self.acquire() as conn:
+                return self._is_healthy(conn)
+        except (sqlite3.Error, PoolTimeoutError):
+            return False
+
+    def stats(self) -> Dict:
+        """Статистика пула для мониторинга"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'avg_wait_ms': round(stats['wait_time'] / stats['waits'] * 1000, 3) if stats['waits'] else 0.0,
+            })
+            stats['wait_time'] = round(stats['wait_time'], 6)
+        return stats
+
+    def close(self):
+        """Закрытие всех свободных подключений"""
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._lock.notify_all()
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с TTL и счетчиками попаданий"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self._stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def invalidate_where(self, predicate):
+        """Удаление записей, для значений которых predicate возвращает True"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            self._stats['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+            stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class Database:
+    def __init__(self, db_path: str = None, pool_size: int = None,
+                 pool_timeout: float = None):
+        self.db_path = db_path or os.getenv('DATABASE_PATH', 'family_finance.db')
+        self.listeners = []
+        self.query_observers = []
+        # Кэш пользователей по telegram_id: запрос есть почти в каждом обработчике
+        self.user_cache = LRUCache(
+            max_size=int(os.getenv('USER_CACHE_SIZE', 1024)),
+            ttl=float(os.getenv('USER_CACHE_TTL', 60))
+        )
+        # Сколько хранится ключ идемпотентности и как часто чистить устаревшие
+        self.idempotency_ttl = float(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+        self.idempotency_purge_every = int(os.getenv('IDEMPOTENCY_PURGE_EVERY', 500))
+        self._idempotency_writes = 0
+        # Курсы меняются редко: читаем таблицу не чаще раза в CURRENCY_RATES_TTL
+        self.rates_cache = LRUCache(max_size=1, ttl=float(os.getenv('CURRENCY_RATES_TTL', 300)))
+        self.writer = None
+        self.pool = ConnectionPool(
+            self.db_path,
+            size=pool_size or int(os.getenv('DB_POOL_SIZE', 5)),
+            timeout=pool_timeout or float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            pragmas={
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'cache_size': -int(os.getenv('DB_CACHE_SIZE_KB', 8192)),
+                'mmap_size': int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024)),
+                'busy_timeout': int(float(os.getenv('DB_POOL_TIMEOUT', 10)) * 1000),
+                'temp_store': 'MEMORY',
+            },
+            observers=self.query_observers
+        )
+        self.init_db()
+        if os.getenv('DB_GROUP_COMMIT', '0') == '1':
+            self.enable_group_commit()
+
+    def enable_group_commit(self, max_batch: int = None, max_delay: float = None):
+        """Включение группового коммита: add_transaction уходит в поток-писатель"""
+        from group_commit import GroupCommitWriter
+
+        if self.writer is None:
+            self.writer = GroupCommitWriter(
+                self,
+                max_batch=max_batch or int(os.getenv('DB_GROUP_COMMIT_ROWS', 256)),
+                max_delay=max_delay if max_delay is not None
+                else float(os.getenv('DB_GROUP_COMMIT_DELAY_MS', 0)) / 1000
+            )
+        return self.writer
+
+    def get_connection(self) -> PooledConnection:
+        """Получение подключения из пула"""
+        return self.pool.acquire()
+
+    def add_query_observer(self, callback):
+        """Наблюдатель SQL-запросов: callback(statement, seconds); statement=None — время выборки строк"""
+        self.query_observers.append(callback)
+
+    def add_listener(self, callback):
+        """Подписка на изменения транзакций (вызывается после коммита)"""
+        self.listeners.append(callback)
+
+    def _notify(self, op: str, transaction_id: int, user_id: int, family_id: int = None):
+        change = {
+            'op': op,
+            'transaction_id': transaction_id,
+            'user_id': user_id,
+            'family_id': family_id
+        }
+        for callback in self.listeners:
+            try:
+                callback(change)
+            except Exception:
+                logger.exception("Change listener failed")
+
+    def pool_stats(self) -> Dict:
+        """Статистика пула подключений"""
+        return self.pool.stats()
+
+    def close(self):
+        """Закрытие пула подключений (ожидающие записи фиксируются до закрытия)"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.pool.close()
+
+    def init_db(self, force: bool = False):
         """Инициализация базы данных"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            # Схема актуальна: холодный старт обходится одним SELECT вместо DDL и проверки индексов
+            if not force and read_schema_version(conn) >= latest_version():
+                return
 
-        # Таблица пользователей
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS users
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           telegram_id
-                           INTEGER
-                           UNIQUE
-                           NOT
-                           NULL,
-                           username
-                           TEXT,
-                           first_name
-                           TEXT,
-                           created_at
-                           TIMESTAMP
-                           DEFAULT
-                           CURRENT_TIMESTAMP,
-                           family_id
-                           INTEGER
-                       )
-                       ''')
-
-        # Таблица семей
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS families
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           name
-                           TEXT
-                           NOT
-                           NULL,
-                           created_by
-                           INTEGER
-                           NOT
-                           NULL,
-                           created_at
-                           TIMESTAMP
-                           DEFAULT
-                           CURRENT_TIMESTAMP
-                       )
-                       ''')
-
-        # Таблица транзакций
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS transactions
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           user_id
-                           INTEGER
-                           NOT
-                           NULL,
-                           family_id
-                           INTEGER,
-                           amount
-                           REAL
-                           NOT
-                           NULL,
-                           currency
-                           TEXT
-                           DEFAULT
-                           'RUB',
-                           category
-                           TEXT
-                           NOT
-                           NULL,
-                           type
-                           TEXT
-                           NOT
-                           NULL,
-                           description
-                           TEXT,
-                           date
-                           TIMESTAMP
-                           DEFAULT
-                           CURRENT_TIMESTAMP
-                       )
-                       ''')
-
-        # Таблица приглашений
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS invites
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           code
-                           TEXT
-                           UNIQUE
-                           NOT
-                           NULL,
-                           created_by
-                           INTEGER
-                           NOT
-                           NULL,
-                           expires_at
-                           TIMESTAMP
-                           NOT
-                           NULL,
-                           used
-                           BOOLEAN
-                           DEFAULT
-                           FALSE
-                       )
-                       ''')
+            cursor = conn.cursor()
 
-        conn.commit()
-        conn.close()
+            # Таблица пользователей
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS users
+                           (
+                               id
+                               INTEGER
+                               PRIMARY
+                               KEY
+                               AUTOINCREMENT,
+                               telegram_id
+                               INTEGER
+                               UNIQUE
+                               NOT
+                               NULL,
+                               username
+                               TEXT,
+                               first_name
+                               TEXT,
+                               created_at
+                               TIMESTAMP
+                               DEFAULT
+                               CURRENT_TIMESTAMP,
+                               family_id
+                               INTEGER
+                           )
+                           ''')
+
+            # Таблица семей
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS families
+                           (
+                               id
+                               INTEGER
+                               PRIMARY
+                               KEY
+                               AUTOINCREMENT,
+                               name
+                               TEXT
+                               NOT
+                               NULL,
+                               created_by
+                               INTEGER
+                               NOT
+                               NULL,
+                               created_at
+                               TIMESTAMP
+                               DEFAULT
+                               CURRENT_TIMESTAMP
+                           )
+                           ''')
+
+            # Таблица транзакций
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS transactions
+                           (
+                               id
+                               INTEGER
+                               PRIMARY
+                               KEY
+                               AUTOINCREMENT,
+                               user_id
+                               INTEGER
+                               NOT
+                               NULL,
+                               family_id
+                               INTEGER,
+                               amount
+                               INTEGER
+                               NOT
+                               NULL,
+                               currency
+                               TEXT
+                               DEFAULT
+                               'RUB',
+                               category
+                               TEXT
+                               NOT
+                               NULL,
+                               type
+                               TEXT
+                               NOT
+                               NULL,
+                               description
+                               TEXT,
+                               date
+                               TIMESTAMP
+                               DEFAULT
+                               CURRENT_TIMESTAMP
+                           )
+                           ''')
+
+            # Таблица приглашений
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS invites
+                           (
+                               id
+                               INTEGER
+                               PRIMARY
+                               KEY
+                               AUTOINCREMENT,
+                               code
+                               TEXT
+                               UNIQUE
+                               NOT
+                               NULL,
+                               created_by
+                               INTEGER
+                               NOT
+                               NULL,
+                               expires_at
+                               TIMESTAMP
+                               NOT
+                               NULL,
+                               used
+                               BOOLEAN
+                               DEFAULT
+                               FALSE
+                           )
+                           ''')
+
+            conn.commit()
+
+            # Версионированные миграции (индексы и новые таблицы)
+            apply_migrations(conn)
+            check_index_coverage(conn)
 
     def add_user(self, telegram_id: int, username: str, first_name: str = None):
         """Добавление нового пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-                       INSERT
-                       OR IGNORE INTO users (telegram_id, username, first_name)
-            VALUES (?, ?, ?)
-                       ''', (telegram_id, username, first_name))
+            cursor.execute('''
+                           INSERT
+                           OR IGNORE INTO users (telegram_id, username, first_name)
+                VALUES (?, ?, ?)
+                           ''', (telegram_id, username, first_name))
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+
+        self.user_cache.invalidate(telegram_id)
 
     def user_exists(self, telegram_id: int) -> bool:
         """Проверка существования пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT 1 FROM users WHERE telegram_id = ?', (telegram_id,))
-        exists = cursor.fetchone() is not None
-
-        conn.close()
-        return exists
+        return self.get_user_by_telegram_id(telegram_id) is not None
 
     def get_user_by_telegram_id(self, telegram_id: int) -> Dict:
         """Получение пользователя по Telegram ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        user = self.user_cache.get(telegram_id)
+        if user is not None:
+            return dict(user)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
-        user = cursor.fetchone()
-        conn.close()
+            cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
+            user = cursor.fetchone()
 
-        return dict(user) if user else None
+        if not user:
+            return None
+
+        user = dict(user)
+        self.user_cache.set(telegram_id, user)
+        return dict(user)
+
+    def invalidate_user(self, user_id: int):
+        """Сброс кэша пользователя по внутреннему ID"""
+        self.user_cache.invalidate_where(lambda user: user['id'] == user_id)
 
     def add_transaction(self, user_id: int, amount: float, category: str,
-                        type: str, description: str = '', family_id: int = None) -> int:
-        """Добавление транзакции"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+                        type: str, description: str = '', family_id: int = None,
+                        idempotency_key: str = None, currency: str = None) -> int:
+        """Добавление транзакции; повтор с тем же idempotency_key возвращает исходный ID"""
+        if self.writer is not None:
+            return self.writer.submit(user_id=user_id, amount=amount, category=category, type=type,
+                                      description=description, family_id=family_id,
+                                      idempotency_key=idempotency_key, currency=currency).result()
 
-        cursor.execute('''
-                       INSERT INTO transactions (user_id, family_id, amount, category, type, description)
-                       VALUES (?, ?, ?, ?, ?, ?)
-                       ''', (user_id, family_id, amount, category, type, description))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if idempotency_key:
+                # Проверка ключа и вставка под одной блокировкой записи: параллельный повтор ждет
+                cursor.execute('BEGIN IMMEDIATE')
 
-        transaction_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+            transaction_id, created = self._insert_transaction(cursor, user_id, amount, category, type,
+                                                               description, family_id, idempotency_key,
+                                                               currency)
+            if not created:
+                conn.rollback()
+                return transaction_id
+
+            apply_rollups(cursor, [transaction_id])
+            record_changes(cursor, OP_INSERT, [transaction_id])
+            conn.commit()
 
+        self._notify(OP_INSERT, transaction_id, user_id, family_id)
         return transaction_id
 
-    def get_user_transactions(self, user_id: int, limit: int = 50) -> List[Dict]:
-        """Получение транзакций пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _insert_transaction(self, cursor, user_id: int, amount: float, category: str, type: str,
+                            description: str = '', family_id: int = None,
+                            idempotency_key: str = None, currency: str = None) -> Tuple[int, bool]:
+        """Вставка строки без COMMIT и агрегатов; возвращает (ID, создана ли новая строка)"""
+        currency = normalize_currency(currency)
+        amount = to_minor(amount, currency)
+        fingerprint = json.dumps([amount, currency, category, type, description or ''], ensure_ascii=False)
+        if idempotency_key:
+            existing = self._find_idempotency_key(cursor, user_id, idempotency_key)
+            if existing is not None:
+                if existing['fingerprint'] != fingerprint:
+                    raise IdempotencyKeyConflict(idempotency_key)
+                return existing['transaction_id'], False
 
         cursor.execute('''
-                       SELECT t.*, u.username
-                       FROM transactions t
-                                LEFT JOIN users u ON t.user_id = u.id
-                       WHERE t.user_id = ?
-                       ORDER BY t.date DESC LIMIT ?
-                       ''', (user_id, limit))
+                       INSERT INTO transactions (user_id, family_id, amount, currency, category, type, description)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                       ''', (user_id, family_id, amount, currency, category, type, description))
 
-        transactions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        return transactions
-
-    def get_monthly_report(self, user_id: int) -> Dict:
-        """Получение месячного отчета"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        transaction_id = cursor.lastrowid
+        if idempotency_key:
+            self._store_idempotency_key(cursor, user_id, idempotency_key, fingerprint, transaction_id)
+        return transaction_id, True
 
-        # Доходы за текущий месяц
+    def _find_idempotency_key(self, cursor, user_id: int, key: str) -> Optional[Dict]:
         cursor.execute('''
-                       SELECT COALESCE(SUM(amount), 0) as total_income
-                       FROM transactions
+                       SELECT transaction_id, fingerprint
+                       FROM idempotency_keys
                        WHERE user_id = ?
-                         AND type = 'income'
-                         AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                       ''', (user_id,))
-        total_income = cursor.fetchone()[0]
+                         AND key = ?
+                         AND created_at >= ?
+                       ''', (user_id, key, time.time() - self.idempotency_ttl))
+        row = cursor.fetchone()
+        return dict(row) if row else None
 
-        # Расходы за текущий месяц
+    def _store_idempotency_key(self, cursor, user_id: int, key: str, fingerprint: str, transaction_id: int):
+        # REPLACE перезаписывает просроченный ключ, который еще не успели удалить
         cursor.execute('''
-                       SELECT COALESCE(SUM(amount), 0) as total_expense
-                       FROM transactions
-                       WHERE user_id = ?
-                         AND type = 'expense'
-                         AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                       ''', (user_id,))
-        total_expense = cursor.fetchone()[0]
+                       INSERT OR REPLACE INTO idempotency_keys (user_id, key, fingerprint, transaction_id, created_at)
+                       VALUES (?, ?, ?, ?, ?)
+                       ''', (user_id, key, fingerprint, transaction_id, time.time()))
+
+        self._idempotency_writes += 1
+        if self._idempotency_writes % self.idempotency_purge_every == 0:
+            self._purge_idempotency_keys(cursor)
+
+    def _purge_idempotency_keys(self, cursor) -> int:
+        cursor.execute('DELETE FROM idempotency_keys WHERE created_at < ?',
+                       (time.time() - self.idempotency_ttl,))
+        return cursor.rowcount
+
+    def purge_idempotency_keys(self) -> int:
+        """Удаление ключей идемпотентности старше IDEMPOTENCY_TTL"""
+        with self.get_connection() as conn:
+            removed = self._purge_idempotency_keys(conn.cursor())
+            conn.commit()
+        return removed
+
+    def add_transactions_bulk(self, user_id: int, rows: Iterable[Dict], family_id: int = None,
+                              batch_size: int = 500, max_errors: int = 50) -> Dict:
+        """Массовый импорт: проверка, дедупликация и вставка пачками executemany.
+
+        Одинаковые строки файла — разные операции (две поездки в метро за день в выписке без времени),
+        поэтому дублями считаются только совпадения со строками, сохраненными до импорта, с учетом
+        их числа. Блокировка записи берется только на вставку готовой пачки: пока rows читаются из
+        медленной загрузки, другие писатели не ждут. Каждая пачка фиксируется отдельно; при сбое
+        посередине повторный импорт того же файла пропустит уже сохраненные строки как дубли.
+        """
+        started = time.monotonic()
+        stats = {'received': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+        last_id = None
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # С базой сравниваем только строки до импорта, вставленные этим импортом не в счет
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+            import_floor = cursor.fetchone()[0]
+
+            batch = []
+            # Сколько раз каждая строка базы уже зачтена как дубль (растет только с числом совпадений)
+            matched = Counter()
+            for number, row in enumerate(rows, 1):
+                stats['received'] += 1
+                try:
+                    item = normalize_row(row)
+                except ImportRowError as error:
+                    stats['invalid'] += 1
+                    if len(stats['errors']) < max_errors:
+                        stats['errors'].append({'row': number, 'error': str(error)})
+                    continue
 
-        # Расходы по категориям
+                key = (item['date'], to_minor(item['amount'], item['currency']), item['currency'],
+                       item['category'], item['type'], item['description'])
+                batch.append(key)
+
+                if len(batch) >= batch_size:
+                    last_id = self._write_batch(conn, user_id, family_id, batch, import_floor, matched,
+                                                stats) or last_id
+                    batch = []
+
+            if batch:
+                last_id = self._write_batch(conn, user_id, family_id, batch, import_floor, matched, stats) or last_id
+
+        elapsed = time.monotonic() - started
+        stats['elapsed_ms'] = round(elapsed * 1000, 1)
+        stats['rows_per_second'] = round(stats['received'] / elapsed, 1) if elapsed > 0 else 0.0
+
+        if last_id is not None:
+            # Одно уведомление на импорт: клиенты досинхронизируются по курсору
+            self._notify(OP_INSERT, last_id, user_id, family_id)
+        return stats
+
+    def _write_batch(self, conn, user_id: int, family_id: int, batch: List[Tuple],
+                     import_floor: int, matched: Counter, stats: Dict) -> Optional[int]:
+        """Вставка подготовленной пачки в отдельной короткой транзакции записи"""
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = self._insert_batch(cursor, user_id, family_id, batch, import_floor, matched, stats)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return last_id
+
+    @staticmethod
+    def _insert_batch(cursor, user_id: int, family_id: int, batch: List[Tuple],
+                      import_floor: int, matched: Counter, stats: Dict) -> Optional[int]:
+        """Вставка пачки без дублей уже сохраненных операций; возвращает последний ID"""
+        dates = [key[0] for key in batch]
         cursor.execute('''
-                       SELECT category, SUM(amount) as total
+                       SELECT date, amount, currency, category, type, COALESCE(description, '')
                        FROM transactions
                        WHERE user_id = ?
-                         AND type = 'expense'
-                         AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                       GROUP BY category
-                       ORDER BY total DESC
-                       ''', (user_id,))
-        categories = [dict(row) for row in cursor.fetchall()]
+                         AND date >= ?
+                         AND date <= ?
+                         AND id <= ?
+                       ''', (user_id, min(dates), max(dates), import_floor))
+        existing = Counter(tuple(row) for row in cursor.fetchall())
 
-        conn.close()
+        # Каждая сохраненная строка отсекает не больше одной строки файла
+        new_rows = []
+        for key in batch:
+            if matched[key] < existing[key]:
+                matched[key] += 1
+            else:
+                new_rows.append(key)
+        stats['duplicates'] += len(batch) - len(new_rows)
+        if not new_rows:
+            return None
 
-        return {
-            'total_income': total_income,
-            'total_expense': total_expense,
-            'balance': total_income - total_expense,
-            'categories': categories
-        }
+        # Внутри BEGIN IMMEDIATE других писателей нет: новые ID идут подряд после текущего максимума
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+        first_id = cursor.fetchone()[0] + 1
+        cursor.executemany('''
+                           INSERT INTO transactions (user_id, family_id, date, amount, currency, category, type,
+                                                     description)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                           ''', [(user_id, family_id) + key for key in new_rows])
+        cursor.execute('SELECT id FROM transactions WHERE id >= ? ORDER BY id', (first_id,))
+        ids = [row[0] for row in cursor.fetchall()]
 
-    def get_category_report(self, user_id: int, start_date=None, end_date=None) -> Dict:
-        """Получение отчета по категориям"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        apply_rollups(cursor, ids)
+        record_changes(cursor, OP_INSERT, ids)
+        stats['inserted'] += len(ids)
+        return ids[-1]
+
+    def update_transaction(self, user_id: int, transaction_id: int, **fields) -> bool:
+        """Изменение транзакции пользователя"""
+        allowed = {'amount', 'currency', 'category', 'type', 'description', 'date'}
+        updates = {key: value for key, value in fields.items() if key in allowed}
+        if not updates:
+            return False
+
+        # Те же правила, что при импорте: иначе агрегат получит NULL-месяц или неизвестный тип
+        if 'type' in updates and updates['type'] not in TRANSACTION_TYPES:
+            raise ValueError(f"Invalid type: {updates['type']!r}")
+        if 'category' in updates:
+            if not isinstance(updates['category'], str) or not updates['category'].strip():
+                raise ValueError('Category is required')
+            updates['category'] = updates['category'].strip()
+        if 'date' in updates:
+            updates['date'] = parse_date(updates['date'])
+        if 'description' in updates:
+            updates['description'] = str(updates['description'] or '').strip()
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT family_id, amount, currency FROM transactions WHERE id = ? AND user_id = ?',
+                           (transaction_id, user_id))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+
+            if 'amount' in updates or 'currency' in updates:
+                # При смене только валюты сохраняется сумма в основных единицах
+                currency = normalize_currency(updates.get('currency', row['currency']))
+                amount = updates.get('amount', from_minor(row['amount'], row['currency']))
+                updates['amount'] = to_minor(amount, currency)
+                updates['currency'] = currency
+
+            # Агрегаты: вычитаем старую версию строки и добавляем новую
+            apply_rollups(cursor, [transaction_id], sign=-1)
+            assignments = ', '.join(f'{key} = ?' for key in updates)
+            cursor.execute(f'UPDATE transactions SET {assignments} WHERE id = ?',
+                           list(updates.values()) + [transaction_id])
+            apply_rollups(cursor, [transaction_id])
+            record_changes(cursor, OP_UPDATE, [transaction_id])
+            conn.commit()
+
+        self._notify(OP_UPDATE, transaction_id, user_id, row['family_id'])
+        return True
+
+    def delete_transaction(self, user_id: int, transaction_id: int) -> bool:
+        """Удаление транзакции пользователя"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT family_id FROM transactions WHERE id = ? AND user_id = ?',
+                           (transaction_id, user_id))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+
+            apply_rollups(cursor, [transaction_id], sign=-1)
+            record_changes(cursor, OP_DELETE, [transaction_id])
+            cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+            conn.commit()
+
+        self._notify(OP_DELETE, transaction_id, user_id, row['family_id'])
+        return True
+
+    def get_user_transactions(self, user_id: int, limit: int = 50) -> List[Dict]:
+        """Получение транзакций пользователя"""
+        return self.get_transactions_page(user_id, limit=limit)['transactions']
 
+    def get_transactions_page(self, user_id: int, limit: int = 50, type: str = None,
+                              category: str = None, date: str = None, search: str = None,
+                              cursor: str = None) -> Dict:
+        """Страница транзакций с фильтрами и keyset-пагинацией по (date, id)"""
         query = '''
-                SELECT category, type, SUM(amount) as total
-                FROM transactions
-                WHERE user_id = ? \
+                SELECT t.*, u.username
+                FROM transactions t
+                         LEFT JOIN users u ON t.user_id = u.id
+                WHERE t.user_id = ? \
                 '''
         params = [user_id]
 
-        if start_date:
+        if type:
+            query += " AND t.type = ?"
+            params.append(type)
+        if category:
+            query += " AND t.category = ?"
+            params.append(category)
+        if date:
+            # Фильтр по дню как полуоткрытый диапазон, чтобы работал индекс (user_id, date)
+            day = datetime.strptime(date, '%Y-%m-%d')
+            query += " AND t.date >= ? AND t.date < ?"
+            params.extend([day.strftime('%Y-%m-%d'), (day + timedelta(days=1)).strftime('%Y-%m-%d')])
+        if search:
+            query += " AND t.description LIKE ?"
+            params.append(f'%{search}%')
+        if cursor:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            # Сравнение кортежей SQLite сводит к диапазону date < ? по индексу (user_id, date);
+            # id в индексе уже есть как rowid, поэтому глубокие страницы не сканируют начало истории
+            query += " AND (t.date, t.id) < (?, ?)"
+            params.extend([cursor_date, cursor_id])
+
+        # limit + 1, чтобы узнать, есть ли следующая страница
+        query += " ORDER BY t.date DESC, t.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self.get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        transactions = [transaction_row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = transactions[-1]
+            next_cursor = encode_cursor(last['date'], last['id'])
+
+        return {
+            'transactions': transactions,
+            'next_cursor': next_cursor
+        }
+
+    def iter_transactions(self, user_id: int = None, family_id: int = None, start: str = None,
+                          end: str = None, batch_size: int = 500) -> Iterator[Dict]:
+        """Потоковое чтение транзакций пользователя или семьи за период [start, end)"""
+        if family_id is not None:
+            query = 'SELECT * FROM transactions WHERE family_id = ?'
+            params = [family_id]
+        else:
+            query = 'SELECT * FROM transactions WHERE user_id = ?'
+            params = [user_id]
+
+        if start:
             query += " AND date >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND date <= ?"
-            params.append(end_date)
+            params.append(start)
+        if end:
+            query += " AND date < ?"
+            params.append(end)
+
+        # Чтение порциями по ключу (date, id): подключение возвращается в пул между порциями, и медленный
+        # клиент выгрузки не держит его до конца скачивания. Записи, сделанные во время выгрузки,
+        # попадают в нее, если их (date, id) еще впереди курсора
+        after = None
+        while True:
+            chunk_query, chunk_params = query, list(params)
+            if after is not None:
+                chunk_query += " AND (date, id) > (?, ?)"
+                chunk_params.extend(after)
+            chunk_query += " ORDER BY date, id LIMIT ?"
+            chunk_params.append(batch_size)
+
+            with self.get_connection() as conn:
+                rows = conn.execute(chunk_query, chunk_params).fetchall()
+            for row in rows:
+                yield transaction_row(row)
+            if len(rows) < batch_size:
+                break
+            after = (rows[-1]['date'], rows[-1]['id'])
+
+    def get_monthly_report(self, user_id: int, year: int = None, month: int = None,
+                           currency: str = None) -> Dict:
+        """Получение месячного отчета (по умолчанию за текущий месяц) в валюте currency"""
+        start, end = month_bounds(year, month)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Готовые агрегаты из monthly_rollups вместо скана транзакций
+            cursor.execute('''
+                           SELECT type, category, currency, total, count
+                           FROM monthly_rollups
+                           WHERE scope = 'user'
+                             AND owner_id = ?
+                             AND month = ?
+                           ''', (user_id, start[:7]))
+            rows = cursor.fetchall()
+
+        return self._build_report(rows, start, end, currency)
+
+    def get_family_report(self, family_id: int, year: int = None, month: int = None,
+                          currency: str = None) -> Dict:
+        """Семейный отчет за месяц из готовых агрегатов monthly_rollups"""
+        start, end = month_bounds(year, month)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Одно чтение диапазона первичного ключа дает итоги, категории и участников
+            cursor.execute('''
+                           SELECT member_id, type, category, currency, total, count
+                           FROM monthly_rollups
+                           WHERE scope = 'family'
+                             AND owner_id = ?
+                             AND month = ?
+                           ''', (family_id, start[:7]))
+            rows = cursor.fetchall()
+            members = self._family_members(cursor, family_id)
+
+        currency = normalize_currency(currency)
+        return build_family_report(rows, members, start, end, currency, self._rates_for(rows, currency))
+
+    def get_family_period_report(self, family_id: int, start: str, end: str, currency: str = None) -> Dict:
+        """Семейный отчет за произвольный период [start, end) одним проходом по индексу (family_id, date)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                           SELECT user_id AS member_id, type, category, currency,
+                                  SUM(amount) as total, COUNT(*) as count
+                           FROM transactions
+                           WHERE family_id = ?
+                             AND date >= ?
+                             AND date < ?
+                           GROUP BY user_id, type, category, currency
+                           ''', (family_id, start, end))
+            rows = cursor.fetchall()
+            members = self._family_members(cursor, family_id)
+
+        currency = normalize_currency(currency)
+        return build_family_report(rows, members, start, end, currency, self._rates_for(rows, currency))
+
+    def get_monthly_totals(self, user_id: int = None, family_id: int = None, months: int = 12,
+                           year: int = None, month: int = None, currency: str = None) -> List[Dict]:
+        """Доходы и расходы по месяцам из monthly_rollups: months месяцев, заканчивая year-month"""
+        start, _ = month_bounds(year, month)
+        year, month = parse_month(start[:7])
+        labels = []
+        for _ in range(max(months, 1)):
+            labels.append(f'{year:04d}-{month:02d}')
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        labels.reverse()
+
+        scope, owner_id = ('family', family_id) if family_id else ('user', user_id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                           SELECT month, type, currency, SUM(total) AS total, SUM(count) AS count
+                           FROM monthly_rollups
+                           WHERE scope = ?
+                             AND owner_id = ?
+                             AND month >= ?
+                             AND month <= ?
+                           GROUP BY month, type, currency
+                           ''', (scope, owner_id, labels[0], labels[-1]))
+            rows = cursor.fetchall()
+
+        currency = normalize_currency(currency)
+        totals = {label: {'income': 0, 'expense': 0} for label in labels}
+        for row in convert_rows(rows, currency, self._rates_for(rows, currency), keys=('month', 'type')):
+            totals[row['month']]['income' if row['type'] == 'income' else 'expense'] += row['total']
+
+        return [
+            {
+                'month': label,
+                'income': from_minor(item['income'], currency),
+                'expense': from_minor(item['expense'], currency),
+                'balance': from_minor(item['income'] - item['expense'], currency),
+            }
+            for label, item in totals.items()
+        ]
+
+    def rebuild_rollups(self):
+        """Пересчет таблицы monthly_rollups по всем транзакциям"""
+        with self.get_connection() as conn:
+            rebuild_rollups(conn.cursor())
+            conn.commit()
+
+    def get_period_report(self, user_id: int, start: str, end: str, currency: str = None) -> Dict:
+        """Отчет за полуоткрытый период [start, end) за один проход по индексу"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Диапазон по date вместо strftime() позволяет использовать индекс (user_id, date)
+            cursor.execute('''
+                           SELECT type, category, currency, SUM(amount) as total, COUNT(*) as count
+                           FROM transactions
+                           WHERE user_id = ?
+                             AND date >= ?
+                             AND date < ?
+                           GROUP BY type, category, currency
+                           ''', (user_id, start, end))
+            rows = cursor.fetchall()
 
-        query += " GROUP BY category, type"
+        return self._build_report(rows, start, end, currency)
 
-        cursor.execute(query, params)
-        results = [dict(row) for row in cursor.fetchall()]
+    def _build_report(self, rows, start: str, end: str, currency: str = None) -> Dict:
+        currency = normalize_currency(currency)
+        return build_report(rows, start, end, currency, self._rates_for(rows, currency))
 
-        report = {'categories': {}}
+    def _rates_for(self, rows, currency: str) -> Dict[str, float]:
+        """Курсы нужны, только если в агрегатах есть другая валюта"""
+        if all(row['currency'] == currency for row in rows):
+            return {}
+        return self.get_currency_rates()
+
+    def get_currency_rates(self) -> Dict[str, float]:
+        """Курсы валют к опорной (REFERENCE_CURRENCY), с кэшем"""
+        rates = self.rates_cache.get('rates')
+        if rates is None:
+            with self.get_connection() as conn:
+                rows = conn.execute('SELECT currency, rate FROM currency_rates').fetchall()
+            rates = {row['currency']: row['rate'] for row in rows}
+            rates[REFERENCE_CURRENCY] = 1.0
+            self.rates_cache.set('rates', rates)
+        return rates
+
+    def set_currency_rate(self, currency: str, rate: float):
+        """Курс: цена одной единицы currency в опорной валюте"""
+        currency = normalize_currency(currency)
+        if currency == REFERENCE_CURRENCY or not rate or rate <= 0:
+            raise ValueError(f'Invalid rate for {currency}: {rate!r}')
+        with self.get_connection() as conn:
+            conn.execute('''
+                         INSERT INTO currency_rates (currency, rate, updated_at)
+                         VALUES (?, ?, CURRENT_TIMESTAMP)
+                         ON CONFLICT (currency) DO UPDATE SET rate = excluded.rate, updated_at = excluded.updated_at
+                         ''', (currency, float(rate)))
+            conn.commit()
+        self.rates_cache.clear()
+
+    def get_category_report(self, user_id: int, start_date=None, end_date=None, currency: str = None) -> Dict:
+        """Получение отчета по категориям"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            query = '''
+                    SELECT category, type, currency, SUM(amount) as total, COUNT(*) as count
+                    FROM transactions
+                    WHERE user_id = ? \
+                    '''
+            params = [user_id]
+
+            if start_date:
+                query += " AND date >= ?"
+                params.append(start_date)
+            if end_date:
+                query += " AND date <= ?"
+                params.append(end_date)
+
+            query += " GROUP BY category, type, currency"
+
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        currency = normalize_currency(currency)
+        results = convert_rows(rows, currency, self._rates_for(rows, currency))
+
+        report = {'categories': {}, 'currency': currency}
         for item in results:
             category = item['category']
             if category not in report['categories']:
                 report['categories'][category] = {'income': 0, 'expense': 0}
 
             if item['type'] == 'income':
-                report['categories'][category]['income'] = item['total']
+                report['categories'][category]['income'] = from_minor(item['total'], currency)
             else:
-                report['categories'][category]['expense'] = item['total']
+                report['categories'][category]['expense'] = from_minor(item['total'], currency)
 
-        conn.close()
         return report
 
-    def get_updates_since(self, user_id: int, last_sync: str = None) -> Dict:
-        """Получение обновлений после указанного времени"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def get_sync_cursor(self) -> int:
+        """Текущая позиция журнала изменений"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        if not last_sync:
-            last_sync = '1970-01-01'
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log')
+            return cursor.fetchone()[0]
 
-        cursor.execute('''
-                       SELECT *
-                       FROM transactions
-                       WHERE user_id = ? AND date > ?
-                       ORDER BY date DESC
-                       ''', (user_id, last_sync))
+    def get_data_version(self, user_id: int = None, family_id: int = None) -> int:
+        """Версия данных пользователя (или семьи): последний seq журнала изменений, поиск по индексу"""
+        column, owner_id = ('family_id', family_id) if family_id else ('user_id', user_id)
+        with self.get_connection() as conn:
+            row = conn.execute(f'SELECT MAX(seq) FROM change_log WHERE {column} = ?', (owner_id,)).fetchone()
+        return row[0] or 0
+
+    def get_updates_since(self, user_id: int, since_seq: int = 0, limit: int = 200,
+                          family_id: int = None) -> Dict:
+        """Изменения транзакций пользователя (и его семьи) после курсора since_seq"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        transactions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+            # limit + 1, чтобы узнать, есть ли следующая страница
+            cursor.execute('''
+                           SELECT c.seq, c.op, c.entity_id, t.*
+                           FROM change_log c
+                                    LEFT JOIN transactions t ON t.id = c.entity_id
+                           WHERE c.seq > ?
+                             AND (c.user_id = ? OR c.family_id = ?)
+                           ORDER BY c.seq
+                           LIMIT ?
+                           ''', (since_seq, user_id, family_id, limit + 1))
+            rows = cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        transactions = []
+        deleted = []
+        for row in rows:
+            if row['op'] == OP_DELETE or row['id'] is None:
+                deleted.append(row['entity_id'])
+            else:
+                transaction = transaction_row(row)
+                transaction.pop('entity_id')
+                transactions.append(transaction)
 
         return {
             'transactions': transactions,
-            'count': len(transactions)
+            'deleted': deleted,
+            'count': len(rows),
+            'cursor': rows[-1]['seq'] if rows else since_seq,
+            'has_more': has_more
         }
 
     def create_family(self, user_id: int, family_name: str) -> int:
         """Создание новой семьи"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('INSERT INTO families (name, created_by) VALUES (?, ?)',
-                       (family_name, user_id))
-        family_id = cursor.lastrowid
+            cursor.execute('INSERT INTO families (name, created_by) VALUES (?, ?)',
+                           (family_name, user_id))
+            family_id = cursor.lastrowid
 
-        cursor.execute('UPDATE users SET family_id = ? WHERE id = ?',
-                       (family_id, user_id))
+            cursor.execute('UPDATE users SET family_id = ? WHERE id = ?',
+                           (family_id, user_id))
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+
+        self.invalidate_user(user_id)
         return family_id
 
     def create_invite(self, user_id: int, code: str, expires_hours: int = 24):
         """Создание приглашения"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        expires_at = datetime.now() + timedelta(hours=expires_hours)
+            expires_at = datetime.now() + timedelta(hours=expires_hours)
 
-        cursor.execute('''
-                       INSERT INTO invites (code, created_by, expires_at)
-                       VALUES (?, ?, ?)
-                       ''', (code, user_id, expires_at))
+            cursor.execute('''
+                           INSERT INTO invites (code, created_by, expires_at)
+                           VALUES (?, ?, ?)
+                           ''', (code, user_id, expires_at))
 
-        conn.commit()
-        conn.close()
+            conn.commit()
 
     def join_family(self, user_id: int, family_id: int) -> bool:
         """Присоединение к семье"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('UPDATE users SET family_id = ? WHERE id = ?',
-                       (family_id, user_id))
+            cursor.execute('UPDATE users SET family_id = ? WHERE id = ?',
+                           (family_id, user_id))
 
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+            success = cursor.rowcount > 0
+            conn.commit()
 
+        self.invalidate_user(user_id)
         return success
 
     def get_family_members(self, family_id: int) -> List[Dict]:
         """Получение членов семьи"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            return self._family_members(conn.cursor(), family_id)
 
+    @staticmethod
+    def _family_members(cursor, family_id: int) -> List[Dict]:
         cursor.execute('''
-                       SELECT id, username, first_name
+                       SELECT id, telegram_id, username, first_name
                        FROM users
                        WHERE family_id = ?
                        ''', (family_id,))
 
-        members = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        return members
\ No newline at end of file
+        return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,114 @@
+import json
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class TooManySubscribers(RuntimeError):
+    """Превышен лимит одновременных подписок"""
+
+
+class Subscription:
+    """Подписка на события по набору ключей (user:<id>, family:<id>)"""
+
+    def __init__(self, broker: 'EventBroker', keys: Iterable[str], max_queue: int):
+        self.broker = broker
+        self.keys = set(keys)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, event: Dict):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Медленный клиент: пропускаем событие, клиент все равно досинхронизируется по курсору
+            self.dropped += 1
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Освобождение слота; повторный вызов ничего не делает"""
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Внутрипроцессный pub/sub для уведомления клиентов об изменениях"""
+
+    def __init__(self, max_subscribers: int = 2, max_queue: int = 100):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._count = 0
+        self._stats = {'published': 0, 'delivered': 0, 'rejected': 0}
+
+    def subscribe(self, keys: Iterable[str]) -> Subscription:
+        """Создание подписки; при превышении лимита — TooManySubscribers"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                raise TooManySubscribers(f'Subscriber limit reached ({self.max_subscribers})')
+
+            subscription = Subscription(self, keys, self.max_queue)
+            for key in subscription.keys:
+                self._subscribers.setdefault(key, []).append(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            removed = False
+            for key in subscription.keys:
+                subscribers = self._subscribers.get(key, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                    removed = True
+                if not subscribers:
+                    self._subscribers.pop(key, None)
+            if removed:
+                self._count -= 1
+
+    def publish(self, keys: Iterable[str], event: Dict):
+        """Рассылка события всем подписчикам указанных ключей (каждому не более одного раза)"""
+        with self._lock:
+            targets = {id(s): s for key in keys for s in self._subscribers.get(key, [])}
+            self._stats['published'] += 1
+            self._stats['delivered'] += len(targets)
+
+        for subscription in targets.values():
+            subscription.put(event)
+
+    def publish_change(self, change: Dict):
+        """Слушатель Database: публикация изменения транзакции пользователю и его семье"""
+        keys = [f"user:{change['user_id']}"]
+        if change.get('family_id'):
+            keys.append(f"family:{change['family_id']}")
+        self.publish(keys, change)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = self._count
+            stats['max_subscribers'] = self.max_subscribers
+        return stats
+
+
+def sse_stream(subscription: Subscription, heartbeat: float = 15.0,
+               max_duration: float = 300.0) -> Iterator[str]:
+    """Поток Server-Sent Events с heartbeat; по истечении max_duration клиент переподключается"""
+    deadline = time.monotonic() + max_duration
+    try:
+        yield 'retry: 5000\n\n'
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.1)))
+            if event is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
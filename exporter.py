@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+from typing import Dict, Iterable, Iterator
+
+EXPORT_FIELDS = ['id', 'date', 'type', 'category', 'amount', 'currency', 'description', 'user_id', 'family_id']
+
+# Сколько строк собирать в один блок ответа
+_ROWS_PER_CHUNK = 500
+
+
+def csv_chunks(rows: Iterable[Dict]) -> Iterator[str]:
+    """CSV-экспорт блоками по _ROWS_PER_CHUNK строк"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % _ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows: Iterable[Dict]) -> Iterator[str]:
+    """Экспорт в JSON Lines блоками по _ROWS_PER_CHUNK строк"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({field: row.get(field) for field in EXPORT_FIELDS}, ensure_ascii=False))
+        if len(lines) >= _ROWS_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+}
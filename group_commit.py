@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, List
+
+from changes import OP_INSERT, record_changes
+from rollups import apply_rollups
+
+if TYPE_CHECKING:
+    # database.py импортирует этот модуль: только для аннотаций
+    from database import Database
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _PendingInsert:
+    __slots__ = ('fields', 'future', 'transaction_id', 'created')
+
+    def __init__(self, fields: Dict):
+        self.fields = fields
+        self.future = Future()
+        self.transaction_id = None
+        self.created = False
+
+
+class GroupCommitWriter:
+    """Поток-писатель: вставки из очереди фиксируются пачками, один COMMIT на пачку"""
+
+    def __init__(self, db: 'Database', max_batch: int = 256, max_delay: float = 0.0):
+        self.db = db
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'commit_time': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, **fields) -> Future:
+        """Постановка вставки в очередь; Future получит ID транзакции после COMMIT"""
+        item = _PendingInsert(fields)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Group commit writer is closed')
+            self._stats['submitted'] += 1
+            self._queue.put(item)
+        return item.future
+
+    def _collect(self, first) -> List[_PendingInsert]:
+        """Пачка: первый элемент и все, что успело прийти за max_delay (не больше max_batch)"""
+        # При max_delay=0 пачку составляет все, что накопилось за время предыдущего COMMIT;
+        # ожидание имеет смысл только при дорогом fsync (synchronous=FULL)
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            try:
+                self._commit(batch)
+            except Exception as error:
+                logger.exception(f"Group commit of {len(batch)} rows failed")
+                with self._lock:
+                    self._stats['failed'] += len(batch)
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(error)
+
+    def _commit(self, batch: List[_PendingInsert]):
+        started = time.monotonic()
+        failed = 0
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            for item in batch:
+                # Ошибка одной строки (например, конфликт ключа идемпотентности) не отменяет пачку
+                cursor.execute('SAVEPOINT pending_insert')
+                try:
+                    item.transaction_id, item.created = self.db._insert_transaction(cursor, **item.fields)
+                except Exception as error:
+                    cursor.execute('ROLLBACK TO pending_insert')
+                    item.future.set_exception(error)
+                    failed += 1
+                finally:
+                    cursor.execute('RELEASE pending_insert')
+
+            created = [item.transaction_id for item in batch if item.created]
+            if created:
+                apply_rollups(cursor, created)
+                record_changes(cursor, OP_INSERT, created)
+            conn.commit()
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['committed'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            self._stats['commit_time'] += time.monotonic() - started
+
+        for item in batch:
+            if item.future.done():
+                continue
+            # Слушатели (кэши, SSE) узнают о записи раньше, чем вызывающий получит ID
+            if item.created:
+                self.db._notify(OP_INSERT, item.transaction_id, item.fields['user_id'],
+                                item.fields.get('family_id'))
+            item.future.set_result(item.transaction_id)
+
+    def close(self, timeout: float = 10.0):
+        """Фиксация оставшихся вставок и остановка потока"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats['batches'] or 1
+        stats['pending'] = self._queue.qsize()
+        stats['avg_batch'] = round(stats['committed'] / batches, 1)
+        stats['avg_commit_ms'] = round(stats.pop('commit_time') / batches * 1000, 3)
+        return stats
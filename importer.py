@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import math
+import re
+from datetime import datetime
+from typing import Dict, IO, Iterator, Tuple
+
+from money import normalize_currency
+
+TRANSACTION_TYPES = ('income', 'expense')
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%d.%m.%Y')
+
+# Размер блока при потоковом чтении тела запроса
+_CHUNK_SIZE = 64 * 1024
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class ImportRowError(ValueError):
+    """Строка импорта не прошла проверку"""
+
+
+def parse_date(value) -> str:
+    """Дата в одном из DATE_FORMATS, приведенная к формату колонки date"""
+    if isinstance(value, str):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip(), date_format).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                continue
+    raise ImportRowError(f"Invalid date: {value!r}")
+
+
+def normalize_row(row: Dict) -> Dict:
+    """Проверка и приведение строки импорта к полям таблицы transactions"""
+    if not isinstance(row, dict):
+        raise ImportRowError('Row must be an object')
+
+    try:
+        amount = float(str(row.get('amount', '')).replace(',', '.').replace(' ', ''))
+    except ValueError:
+        raise ImportRowError(f"Invalid amount: {row.get('amount')!r}")
+    if not math.isfinite(amount):
+        raise ImportRowError(f"Invalid amount: {row.get('amount')!r}")
+
+    transaction_type = (row.get('type') or '').strip().lower()
+    if not transaction_type:
+        # Как в /add: знак суммы задает тип операции
+        transaction_type = 'income' if amount > 0 else 'expense'
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ImportRowError(f"Invalid type: {transaction_type!r}")
+
+    amount = abs(amount)
+    if amount == 0:
+        raise ImportRowError('Amount must be non-zero')
+
+    category = (row.get('category') or '').strip()
+    if not category:
+        raise ImportRowError('Category is required')
+
+    try:
+        currency = normalize_currency(row.get('currency'))
+    except ValueError:
+        raise ImportRowError(f"Invalid currency: {row.get('currency')!r}")
+
+    date = (row.get('date') or '').strip()
+    date = parse_date(date) if date else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    return {
+        'amount': amount,
+        'currency': currency,
+        'category': category,
+        'type': transaction_type,
+        'description': (row.get('description') or '').strip(),
+        'date': date
+    }
+
+
+def iter_csv_rows(stream: IO[bytes], encoding: str = 'utf-8-sig') -> Iterator[Dict]:
+    """Построчное чтение CSV с заголовком (date, amount, category, type, description[, currency])"""
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    sample = text.readline()
+    if not sample:
+        return
+    dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    header = next(csv.reader([sample], dialect))
+    fields = [name.strip().lower() for name in header]
+    for values in csv.reader(text, dialect):
+        if values:
+            yield dict(zip(fields, values))
+
+
+def iter_json_rows(stream: IO[bytes]) -> Iterator[Dict]:
+    """Потоковый разбор JSON-массива объектов или NDJSON без загрузки тела целиком"""
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(stream, encoding='utf-8')
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Пропускаем пробелы и разделители элементов массива
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer):
+            if not started:
+                started = True
+                if buffer[pos] == '[':
+                    pos += 1
+                    continue
+            if buffer[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Элемент в самом конце буфера мог быть обрезан границей блока
+                if end < len(buffer) or eof:
+                    pos = end
+                    yield item
+                    continue
+
+        if eof:
+            return
+        chunk = reader.read(_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_import_rows(stream: IO[bytes], content_type: str) -> Iterator[Tuple[int, Dict]]:
+    """Нумерованные строки импорта в зависимости от формата"""
+    if 'csv' in content_type:
+        rows = iter_csv_rows(stream)
+    else:
+        rows = iter_json_rows(stream)
+    return enumerate(rows, 1)
@@ -0,0 +1,81 @@
+import argparse
+import os
+
+from database import Database
+from money import REFERENCE_CURRENCY
+
+
+def rebuild_rollups(db: Database, args):
+    """Пересчет месячных агрегатов"""
+    db.rebuild_rollups()
+    print("✅ monthly_rollups пересчитаны")
+
+
+def snapshot(db: Database, args):
+    """Снимок транзакций пользователя или семьи для офлайн-аналитики"""
+    from snapshots import write_snapshot
+
+    user_id = None
+    if args.telegram_id:
+        user = db.get_user_by_telegram_id(args.telegram_id)
+        if not user:
+            raise SystemExit(f"❌ Пользователь {args.telegram_id} не найден")
+        user_id = user['id']
+
+    result = write_snapshot(db, path=args.output, user_id=user_id, family_id=args.family_id,
+                            fmt=args.format, start=args.start_date, end=args.end_date)
+    print(f"✅ {result['rows']} строк записано в {result['path']} ({result['bytes']} байт)")
+
+
+def purge_idempotency_keys(db: Database, args):
+    """Удаление просроченных ключей идемпотентности"""
+    removed = db.purge_idempotency_keys()
+    print(f"✅ Удалено ключей идемпотентности: {removed}")
+
+
+def set_rate(db: Database, args):
+    """Курс валюты к опорной для пересчета отчетов"""
+    db.set_currency_rate(args.currency, args.rate)
+    print(f"✅ 1 {args.currency.upper()} = {args.rate} {REFERENCE_CURRENCY}")
+
+
+COMMANDS = {
+    'rebuild-rollups': rebuild_rollups,
+    'snapshot': snapshot,
+    'purge-idempotency-keys': purge_idempotency_keys,
+    'set-rate': set_rate,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Служебные команды Family Finance')
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', 'family_finance.db'),
+                        help='Путь к файлу базы данных (по умолчанию DATABASE_PATH, как у приложения)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild-rollups', help='Пересчитать таблицу monthly_rollups')
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='Снимок транзакций в Parquet/Arrow')
+    owner = snapshot_parser.add_mutually_exclusive_group(required=True)
+    owner.add_argument('--telegram-id', type=int, help='Telegram ID пользователя')
+    owner.add_argument('--family-id', type=int, help='ID семьи')
+    snapshot_parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    snapshot_parser.add_argument('--output', help='Путь к файлу (по умолчанию в SNAPSHOT_DIR)')
+    snapshot_parser.add_argument('--start-date', help='Начало периода (YYYY-MM-DD)')
+    snapshot_parser.add_argument('--end-date', help='Конец периода, не включая (YYYY-MM-DD)')
+
+    subparsers.add_parser('purge-idempotency-keys', help='Удалить ключи старше IDEMPOTENCY_TTL')
+
+    rate_parser = subparsers.add_parser('set-rate', help=f'Курс валюты в {REFERENCE_CURRENCY}')
+    rate_parser.add_argument('currency', help='Код валюты ISO 4217, например USD')
+    rate_parser.add_argument('rate', type=float, help=f'Цена одной единицы валюты в {REFERENCE_CURRENCY}')
+
+    args = parser.parse_args()
+    db = Database(args.db)
+    try:
+        COMMANDS[args.command](db, args)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
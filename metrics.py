@@ -0,0 +1,277 @@
+import cProfile
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+from flask import Flask, request
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм (секунды и число запросов к БД)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+PREFIX = 'family_finance'
+
+
+class Histogram:
+    """Кумулятивная гистограмма в духе Prometheus"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        # Квантиль за последней корзиной: оценка снизу, inf в /health дал бы невалидный JSON (Infinity)
+        return self.buckets[-1]
+
+    def lines(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class _RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.profiler = None
+
+
+class _RouteMetrics:
+    __slots__ = ('latency', 'db_time', 'db_queries', 'statuses', 'queries_total')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.db_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+        self.queries_total = 0
+
+
+class RequestMetrics:
+    """Метрики Flask-приложения: задержка по маршрутам, запросы к БД на запрос, выборочный cProfile"""
+
+    def __init__(self, app: Flask = None, db=None, profile_sample_rate: float = None,
+                 profile_slow_ms: float = None, profile_dir: str = None):
+        self.profile_sample_rate = profile_sample_rate if profile_sample_rate is not None \
+            else float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        self.profile_slow_ms = profile_slow_ms if profile_slow_ms is not None \
+            else float(os.getenv('PROFILE_SLOW_MS', 500))
+        self.profile_dir = profile_dir or os.getenv('PROFILE_DIR', 'profiles')
+        self._routes: Dict[tuple, _RouteMetrics] = {}
+        self._lock = threading.Lock()
+        # cProfile нельзя запускать параллельно в нескольких потоках: профилируем по одному запросу
+        self._profile_lock = threading.Lock()
+        self._current = contextvars.ContextVar('request_metrics', default=None)
+        self._background_queries = 0
+        self._background_db_time = 0.0
+        self.started = time.time()
+
+        if db is not None:
+            db.add_query_observer(self.observe_query)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def observe_query(self, statement: Optional[str], seconds: float):
+        """Наблюдатель Database: запрос относится к текущему HTTP-запросу потока"""
+        stats = self._current.get()
+        if stats is None:
+            with self._lock:
+                self._background_queries += statement is not None
+                self._background_db_time += seconds
+            return
+        if statement is not None:
+            stats.queries += 1
+        stats.db_time += seconds
+
+    def _before_request(self):
+        stats = _RequestStats()
+        request.environ['metrics.token'] = self._current.set(stats)
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate \
+                and self._profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Уже работает другой профилировщик (например, отладчик)
+                self._profile_lock.release()
+            else:
+                stats.profiler = profiler
+
+    def _after_request(self, response):
+        stats = self._current.get()
+        if stats is None:
+            return response
+
+        elapsed = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        key = (request.method, route)
+        with self._lock:
+            metrics = self._routes.get(key)
+            if metrics is None:
+                metrics = self._routes[key] = _RouteMetrics()
+            metrics.latency.observe(elapsed)
+            metrics.db_time.observe(stats.db_time)
+            metrics.db_queries.observe(stats.queries)
+            metrics.queries_total += stats.queries
+            metrics.statuses[response.status_code] = metrics.statuses.get(response.status_code, 0) + 1
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'app;dur={elapsed * 1000:.1f}'
+        )
+
+        if stats.profiler is not None:
+            stats.profiler.disable()
+            self._profile_lock.release()
+            if elapsed * 1000 >= self.profile_slow_ms:
+                self._dump_profile(stats.profiler, route, elapsed)
+            stats.profiler = None
+        return response
+
+    def _teardown_request(self, error=None):
+        token = request.environ.pop('metrics.token', None)
+        stats = self._current.get()
+        if stats is not None and stats.profiler is not None:
+            # after_request не вызывался (обрыв запроса): профилировщик нужно остановить
+            stats.profiler.disable()
+            self._profile_lock.release()
+        if token is not None:
+            self._current.reset(token)
+
+    def _dump_profile(self, profiler: cProfile.Profile, route: str, elapsed: float):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(time.time() * 1000) % 1000:03d}'
+        path = os.path.join(self.profile_dir, f'{stamp}_{name}_{elapsed * 1000:.0f}ms.prof')
+        profiler.dump_stats(path)
+        logger.warning(f"Slow request {request.method} {route} took {elapsed * 1000:.0f} ms, profile: {path}")
+
+    def summary(self) -> Dict:
+        """Краткая сводка по маршрутам (p50/p95/p99 — по границам корзин)"""
+        with self._lock:
+            return {
+                f'{method} {route}': {
+                    'requests': metrics.latency.count,
+                    'avg_ms': round(metrics.latency.sum / metrics.latency.count * 1000, 2),
+                    'p50_ms': _ms(metrics.latency.quantile(0.5)),
+                    'p95_ms': _ms(metrics.latency.quantile(0.95)),
+                    'p99_ms': _ms(metrics.latency.quantile(0.99)),
+                    'avg_db_queries': round(metrics.queries_total / metrics.latency.count, 2),
+                }
+                for (method, route), metrics in self._routes.items()
+                if metrics.latency.count
+            }
+
+    def render(self, gauges: Dict[str, float] = None) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            routes = sorted(self._routes.items())
+
+            lines.append(f'# HELP {PREFIX}_http_request_duration_seconds Request latency by route')
+            lines.append(f'# TYPE {PREFIX}_http_request_duration_seconds histogram')
+            for (method, route), metrics in routes:
+                lines.extend(metrics.latency.lines(f'{PREFIX}_http_request_duration_seconds',
+                                                   _labels(method=method, route=route)))
+
+            lines.append(f'# HELP {PREFIX}_http_requests_total Requests by route and status')
+            lines.append(f'# TYPE {PREFIX}_http_requests_total counter')
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(f'{PREFIX}_http_requests_total{{{_labels(method=method, route=route, status=status)}}} '
+                                 f'{count}')
+
+            lines.append(f'# HELP {PREFIX}_db_time_per_request_seconds Database time spent per request')
+            lines.append(f'# TYPE {PREFIX}_db_time_per_request_seconds histogram')
+            for (method, route), metrics in routes:
+                lines.extend(metrics.db_time.lines(f'{PREFIX}_db_time_per_request_seconds',
+                                                   _labels(method=method, route=route)))
+
+            lines.append(f'# HELP {PREFIX}_db_queries_per_request Database queries per request')
+            lines.append(f'# TYPE {PREFIX}_db_queries_per_request histogram')
+            for (method, route), metrics in routes:
+                lines.extend(metrics.db_queries.lines(f'{PREFIX}_db_queries_per_request',
+                                                      _labels(method=method, route=route)))
+
+            lines.append(f'# HELP {PREFIX}_db_background_queries_total Queries outside HTTP requests')
+            lines.append(f'# TYPE {PREFIX}_db_background_queries_total counter')
+            lines.append(f'{PREFIX}_db_background_queries_total {self._background_queries}')
+            lines.append(f'# HELP {PREFIX}_db_background_seconds_total Time in queries outside HTTP requests')
+            lines.append(f'# TYPE {PREFIX}_db_background_seconds_total counter')
+            lines.append(f'{PREFIX}_db_background_seconds_total {self._background_db_time:.6f}')
+
+        lines.append(f'# HELP {PREFIX}_process_start_time_seconds Start time of the process since unix epoch')
+        lines.append(f'# TYPE {PREFIX}_process_start_time_seconds gauge')
+        lines.append(f'{PREFIX}_process_start_time_seconds {self.started:.0f}')
+        for name, value in sorted((gauges or {}).items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f'# TYPE {PREFIX}_{name} gauge')
+            lines.append(f'{PREFIX}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    if value is None:
+        return value
+    return round(value * 1000, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def flatten_gauges(prefix: str, stats: Dict) -> Dict[str, float]:
+    """Плоские числовые показатели из вложенных stats() для render()"""
+    gauges = {}
+    for key, value in (stats or {}).items():
+        name = re.sub(r'[^a-zA-Z0-9_]', '_', f'{prefix}_{key}')
+        if isinstance(value, dict):
+            gauges.update(flatten_gauges(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauges[name] = value
+    return gauges
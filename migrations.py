@@ -0,0 +1,191 @@
+import logging
+import sqlite3
+from typing import Callable, Dict, List, Tuple, Union
+
+from changes import create_change_log
+from money import DEFAULT_CURRENCY, minor_units_sql
+from rollups import rebuild_rollups, recreate_rollups
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_family_date ON transactions (family_id, date)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_type_date ON transactions (user_id, type, date)',
+]
+
+
+def convert_to_minor_units(cursor):
+    """Миграция: amount REAL -> INTEGER в минимальных единицах, курсы валют, агрегаты по валютам"""
+    # Тип колонки в SQLite меняется только пересозданием таблицы; ID сохраняются
+    cursor.execute(f'''
+                   CREATE TABLE transactions_minor
+                   (
+                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       user_id INTEGER NOT NULL,
+                       family_id INTEGER,
+                       amount INTEGER NOT NULL,
+                       currency TEXT NOT NULL DEFAULT '{DEFAULT_CURRENCY}',
+                       category TEXT NOT NULL,
+                       type TEXT NOT NULL,
+                       description TEXT,
+                       date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                   )
+                   ''')
+    cursor.execute(f'''
+                   INSERT INTO transactions_minor (id, user_id, family_id, amount, currency, category, type,
+                                                   description, date)
+                   SELECT id, user_id, family_id, {minor_units_sql('amount', "COALESCE(currency, 'RUB')")},
+                          COALESCE(currency, 'RUB'), category, type, description, date
+                   FROM transactions
+                   ''')
+    cursor.execute('DROP TABLE transactions')
+    cursor.execute('ALTER TABLE transactions_minor RENAME TO transactions')
+    for statement in TRANSACTION_INDEXES:
+        cursor.execute(statement)
+
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS currency_rates
+                   (
+                       currency TEXT PRIMARY KEY,
+                       rate REAL NOT NULL,
+                       updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                   )
+                   ''')
+    recreate_rollups(cursor)
+
+
+# Миграции схемы: (версия, название, список SQL-выражений или функция от курсора).
+# Новые миграции добавляются только в конец списка с увеличением версии.
+MIGRATIONS: List[Tuple[int, str, Union[List[str], Callable]]] = [
+    (1, 'transactions_indexes', TRANSACTION_INDEXES),
+    (2, 'users_family_index', [
+        'CREATE INDEX IF NOT EXISTS idx_users_family_id ON users (family_id)',
+    ]),
+    (3, 'monthly_rollups', rebuild_rollups),
+    (4, 'change_log', create_change_log),
+    (5, 'monthly_rollups_members', recreate_rollups),
+    (6, 'webhook_spool', [
+        '''
+        CREATE TABLE IF NOT EXISTS webhook_spool
+        (
+            update_id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            received_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (7, 'idempotency_keys', [
+        '''
+        CREATE TABLE IF NOT EXISTS idempotency_keys
+        (
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, key)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)',
+    ]),
+    (8, 'money_minor_units', convert_to_minor_units),
+]
+
+# Горячие запросы, которые обязаны использовать индекс
+COVERAGE_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    'transactions_by_user': (
+        'SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC LIMIT 50', (1,)
+    ),
+    'transactions_by_user_type': (
+        "SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'expense' AND date >= ?",
+        (1, '1970-01-01')
+    ),
+    'transactions_by_family': (
+        'SELECT * FROM transactions WHERE family_id = ? AND date >= ?', (1, '1970-01-01')
+    ),
+    'users_by_family': ('SELECT id FROM users WHERE family_id = ?', (1,)),
+    'invites_by_code': ('SELECT * FROM invites WHERE code = ?', ('code',)),
+}
+
+
+def get_schema_version(conn) -> int:
+    """Текущая версия схемы"""
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS schema_version
+                 (
+                     version INTEGER PRIMARY KEY,
+                     name TEXT NOT NULL,
+                     applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                 )
+                 ''')
+    row = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()
+    return row[0]
+
+
+def read_schema_version(conn) -> int:
+    """Версия схемы без DDL (0, если таблицы версий еще нет)"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def latest_version() -> int:
+    """Последняя известная версия схемы"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def apply_migrations(conn) -> List[int]:
+    """Применение недостающих миграций по порядку, каждая в своей транзакции"""
+    applied = []
+    get_schema_version(conn)
+    conn.commit()
+
+    for version, name, migration in MIGRATIONS:
+        # BEGIN IMMEDIATE сериализует миграции между процессами (app и bot)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            cursor = conn.cursor()
+            if callable(migration):
+                migration(cursor)
+            else:
+                for statement in migration:
+                    cursor.execute(statement)
+
+            cursor.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                           (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Migration {version} ({name}) failed")
+            raise
+
+        logger.info(f"Applied migration {version}: {name}")
+        applied.append(version)
+
+    return applied
+
+
+def check_index_coverage(conn) -> Dict[str, bool]:
+    """Проверка, что горячие запросы используют индексы, а не полный скан"""
+    coverage = {}
+    for name, (query, params) in COVERAGE_QUERIES.items():
+        try:
+            plan = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+        except sqlite3.OperationalError:
+            coverage[name] = False
+            continue
+        details = [row[-1] for row in plan]
+        coverage[name] = any('USING' in detail for detail in details) and \
+            not any(detail.startswith('SCAN') and 'USING' not in detail for detail in details)
+
+    for name, covered in coverage.items():
+        if not covered:
+            logger.warning(f"Query '{name}' is not covered by an index")
+    return coverage
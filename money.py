@@ -0,0 +1,91 @@
+import os
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Sequence
+
+# Суммы хранятся в минимальных единицах валюты (копейки, центы) целыми числами
+DEFAULT_CURRENCY = os.getenv('DEFAULT_CURRENCY', 'RUB')
+
+# Курсы в currency_rates задаются как цена одной единицы валюты в опорной валюте
+REFERENCE_CURRENCY = 'RUB'
+
+# Число знаков после запятой по ISO 4217; для остальных валют — 2
+CURRENCY_EXPONENTS = {
+    'JPY': 0, 'KRW': 0, 'VND': 0, 'CLP': 0, 'ISK': 0,
+    'BHD': 3, 'KWD': 3, 'OMR': 3, 'JOD': 3, 'TND': 3,
+}
+
+_CURRENCY_CODE = re.compile(r'^[A-Z]{3}$')
+
+
+class UnknownCurrencyError(ValueError):
+    """Нет курса для пересчета валюты"""
+
+
+def normalize_currency(currency: str = None) -> str:
+    """Код валюты ISO 4217 в верхнем регистре; ValueError при неверном коде"""
+    code = (currency or DEFAULT_CURRENCY).strip().upper()
+    if not _CURRENCY_CODE.match(code):
+        raise ValueError(f'Invalid currency: {currency!r}')
+    return code
+
+
+def exponent(currency: str) -> int:
+    return CURRENCY_EXPONENTS.get(currency, 2)
+
+
+def to_minor(amount, currency: str = DEFAULT_CURRENCY) -> int:
+    """Сумма в минимальных единицах валюты (с округлением половины вверх)"""
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation as error:
+        raise ValueError(f'Invalid amount: {amount!r}') from error
+    if not value.is_finite():
+        raise ValueError(f'Invalid amount: {amount!r}')
+    return int(value.scaleb(exponent(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(amount: int, currency: str = DEFAULT_CURRENCY) -> float:
+    """Сумма в основных единицах для JSON и вывода"""
+    if amount is None:
+        return None
+    places = exponent(currency)
+    return round(amount / 10 ** places, places) if places else float(amount)
+
+
+def convert_minor(amount: int, source: str, target: str, rates: Dict[str, float]) -> int:
+    """Пересчет суммы в минимальных единицах из source в target по курсам к опорной валюте"""
+    if source == target or not amount:
+        return amount
+    try:
+        source_rate = Decimal(str(rates[source]))
+        target_rate = Decimal(str(rates[target]))
+    except KeyError as error:
+        raise UnknownCurrencyError(f'No rate for {error.args[0]}') from error
+
+    value = Decimal(amount).scaleb(-exponent(source)) * source_rate / target_rate
+    return int(value.scaleb(exponent(target)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def convert_rows(rows: Iterable, currency: str, rates: Dict[str, float],
+                 keys: Sequence[str] = ('type', 'category')) -> List[Dict]:
+    """Свертка агрегатов (keys..., currency, total, count) в одну валюту: пересчет один раз на строку агрегата"""
+    merged = {}
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        item = merged.get(key)
+        if item is None:
+            item = merged[key] = {**{name: row[name] for name in keys}, 'total': 0, 'count': 0}
+        item['total'] += convert_minor(row['total'], row['currency'], currency, rates)
+        item['count'] += row['count']
+    return list(merged.values())
+
+
+def minor_units_sql(column: str = 'amount', currency_column: str = 'currency') -> str:
+    """SQL-выражение перевода суммы в основных единицах в минимальные (для миграции)"""
+    cases = ' '.join(
+        f"WHEN '{code}' THEN {10 ** places}"
+        for code, places in sorted(CURRENCY_EXPONENTS.items())
+        if places != 2
+    )
+    return f"CAST(ROUND({column} * CASE {currency_column} {cases} ELSE 100 END) AS INTEGER)"
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: ответы пользователю всегда раньше массовых уведомлений
+INTERACTIVE = 0
+BULK = 1
+
+# Сколько элементов полосы просматривать в поисках чата, готового к отправке
+_SCAN_LIMIT = 64
+_MAX_CHAT_BUCKETS = 10000
+
+# Склеенные уведомления не длиннее лимита текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+BATCH_SEPARATOR = '\n\n'
+
+# 429 сразу в нескольких чатах — общий лимит бота, а не лимит одного чата
+_GLOBAL_FLOOD_CHATS = 3
+_GLOBAL_FLOOD_WINDOW = 1.0
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — доступен сейчас)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        """Пауза после ответа 429 (retry_after)"""
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class _Outgoing:
+    __slots__ = ('chat_id', 'operation', 'future', 'priority', 'attempts', 'enqueued', 'texts')
+
+    def __init__(self, chat_id, operation, future, priority, texts: List[str] = None):
+        self.chat_id = chat_id
+        self.operation = operation
+        self.future = future
+        self.priority = priority
+        self.attempts = 0
+        self.enqueued = time.monotonic()
+        # Тексты, склеиваемые в одно сообщение (send_text); None — обычная отправка
+        self.texts = texts
+
+
+class OutboundScheduler:
+    """Планировщик исходящих сообщений с лимитами Telegram (глобально и на чат)"""
+
+    def __init__(self, global_rate: float = 25.0, per_chat_rate: float = 1.0, per_chat_burst: float = 3.0,
+                 max_concurrency: int = 8, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._lanes = {INTERACTIVE: deque(), BULK: deque()}
+        # Ожидающие в очереди текстовые сообщения по (полоса, чат): к ним дописываются новые тексты
+        self._batches: Dict[tuple, _Outgoing] = {}
+        self._flood_chats: Dict[int, float] = {}
+        self._semaphore = None
+        self._max_concurrency = max_concurrency
+        self._wakeup = None
+        self._task = None
+        self._stats = {
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'rate_limited': 0,
+            'global_flood': 0,
+            'batched': 0,
+            'queue_wait_total': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _MAX_CHAT_BUCKETS:
+                self._prune_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _prune_buckets(self):
+        """Удаление ведер простаивающих чатов (полные ведра ничего не ограничивают)"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if bucket.wait_time(now) == 0 and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    async def send(self, chat_id, operation: Callable[[], Awaitable], priority: int = INTERACTIVE):
+        """Постановка отправки в очередь и ожидание результата"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(_Outgoing(chat_id, operation, future, priority))
+        self._wakeup.set()
+        return await future
+
+    async def send_text(self, chat_id, text: str, send: Callable[[str], Awaitable], priority: int = BULK):
+        """Текст в чат; пока чат ждет токена, новые тексты дописываются в то же сообщение.
+
+        Уведомления, накопившиеся за время ожидания лимита чата, уходят одним sendMessage вместо
+        нескольких: send получает склеенный текст, все вызывающие получают один результат.
+        """
+        self._ensure_started()
+        pending = self._batches.get((priority, chat_id))
+        if pending is not None and len(BATCH_SEPARATOR.join(pending.texts + [text])) <= MAX_MESSAGE_LENGTH:
+            pending.texts.append(text)
+            self._stats['batched'] += 1
+            return await asyncio.shield(pending.future)
+
+        future = asyncio.get_running_loop().create_future()
+        texts = [text]
+        item = _Outgoing(chat_id, lambda: send(BATCH_SEPARATOR.join(texts)), future, priority, texts)
+        self._batches[(priority, chat_id)] = item
+        self._lanes[priority].append(item)
+        self._wakeup.set()
+        return await asyncio.shield(future)
+
+    async def broadcast(self, chat_ids: Iterable, operation_factory: Callable[[int], Callable[[], Awaitable]],
+                        priority: int = BULK) -> List:
+        """Массовая рассылка: результаты или исключения по каждому чату"""
+        return await asyncio.gather(
+            *(self.send(chat_id, operation_factory(chat_id), priority) for chat_id in chat_ids),
+            return_exceptions=True
+        )
+
+    def _next_ready(self, now: float):
+        """Первый элемент по приоритету, чат которого готов; иначе время ожидания"""
+        earliest = None
+        for priority in (INTERACTIVE, BULK):
+            lane = self._lanes[priority]
+            for index, item in enumerate(lane):
+                if index >= _SCAN_LIMIT:
+                    break
+                wait = self._chat_bucket(item.chat_id).wait_time(now)
+                if wait == 0:
+                    del lane[index]
+                    if item.texts is not None and self._batches.get((priority, item.chat_id)) is item:
+                        # Сообщение уходит: следующие тексты собираются в новое
+                        del self._batches[(priority, item.chat_id)]
+                    return item, 0.0
+                earliest = wait if earliest is None else min(earliest, wait)
+        return None, earliest
+
+    async def _dispatch(self):
+        while True:
+            if not any(self._lanes.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+
+            item, wait = self._next_ready(now)
+            if item is None:
+                # Все чаты в очереди ждут своих токенов; новый интерактивный ответ разбудит раньше
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.take(now)
+            self._chat_bucket(item.chat_id).take(now)
+            await self._semaphore.acquire()
+            asyncio.get_running_loop().create_task(self._execute(item))
+
+    async def _execute(self, item: _Outgoing):
+        try:
+            item.attempts += 1
+            self._stats['queue_wait_total'] += time.monotonic() - item.enqueued
+            result = await item.operation()
+        except Exception as error:
+            retry_after = getattr(error, 'retry_after', None)
+            if retry_after is not None and item.attempts <= self.max_retries:
+                # 429: приостанавливаем чат, сообщение возвращается в начало своей полосы.
+                # Общий поток — только при общем флуд-лимите, иначе один чат остановил бы все остальные
+                self._stats['rate_limited'] += 1
+                self._stats['retried'] += 1
+                now = time.monotonic()
+                until = now + float(retry_after)
+                self._chat_bucket(item.chat_id).block(until)
+                if self._is_global_flood(item.chat_id, now):
+                    self._stats['global_flood'] += 1
+                    self.global_bucket.block(until)
+                self._lanes[item.priority].appendleft(item)
+                self._wakeup.set()
+            else:
+                self._stats['failed'] += 1
+                if not item.future.done():
+                    item.future.set_exception(error)
+        else:
+            self._stats['sent'] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._semaphore.release()
+
+    def _is_global_flood(self, chat_id, now: float) -> bool:
+        """429 в нескольких разных чатах за короткое окно означает общий лимит бота"""
+        self._flood_chats[chat_id] = now
+        for other, moment in list(self._flood_chats.items()):
+            if now - moment > _GLOBAL_FLOOD_WINDOW:
+                del self._flood_chats[other]
+        return len(self._flood_chats) >= _GLOBAL_FLOOD_CHATS
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        handled = stats['sent'] + stats['failed'] + stats['retried'] or 1
+        stats['avg_queue_wait_ms'] = round(stats.pop('queue_wait_total') / handled * 1000, 1)
+        stats['queued_interactive'] = len(self._lanes[INTERACTIVE])
+        stats['queued_bulk'] = len(self._lanes[BULK])
+        stats['chats'] = len(self._chat_buckets)
+        return stats
@@ -0,0 +1,89 @@
+from typing import Iterable
+
+# Агрегаты по месяцам для пользователя и для семьи.
+# Строки вида (scope, owner_id, month, type, category, member_id, currency) -> (total, count),
+# где member_id — автор операций (для scope='user' совпадает с owner_id),
+# а total — точная сумма в минимальных единицах валюты.
+CREATE_ROLLUPS_SQL = '''
+                     CREATE TABLE IF NOT EXISTS monthly_rollups
+                     (
+                         scope TEXT NOT NULL,
+                         owner_id INTEGER NOT NULL,
+                         month TEXT NOT NULL,
+                         type TEXT NOT NULL,
+                         category TEXT NOT NULL,
+                         member_id INTEGER NOT NULL,
+                         currency TEXT NOT NULL,
+                         total INTEGER NOT NULL DEFAULT 0,
+                         count INTEGER NOT NULL DEFAULT 0,
+                         PRIMARY KEY (scope, owner_id, month, type, category, member_id, currency)
+                     ) WITHOUT ROWID
+                     '''
+
+_UPSERT_SQL = '''
+              INSERT INTO monthly_rollups (scope, owner_id, month, type, category, member_id, currency, total, count)
+              SELECT scope, owner_id, month, type, category, member_id, currency, ? * SUM(amount), ? * COUNT(*)
+              FROM (SELECT 'user' AS scope, user_id AS owner_id, strftime('%Y-%m', date) AS month,
+                           type, category, user_id AS member_id, COALESCE(currency, 'RUB') AS currency, amount
+                    FROM transactions
+                    WHERE {where}
+                    UNION ALL
+                    SELECT 'family', family_id, strftime('%Y-%m', date), type, category, user_id,
+                           COALESCE(currency, 'RUB'), amount
+                    FROM transactions
+                    WHERE family_id IS NOT NULL AND {where})
+              WHERE 1
+              GROUP BY scope, owner_id, month, type, category, member_id, currency
+              ON CONFLICT (scope, owner_id, month, type, category, member_id, currency) DO UPDATE
+                  SET total = total + excluded.total,
+                      count = count + excluded.count
+              '''
+
+# Ключи агрегатов, которые затрагивают транзакции (те же, что в _UPSERT_SQL)
+_KEYS_SQL = '''
+            SELECT 'user', user_id, strftime('%Y-%m', date), type, category, user_id, COALESCE(currency, 'RUB')
+            FROM transactions
+            WHERE {where}
+            UNION
+            SELECT 'family', family_id, strftime('%Y-%m', date), type, category, user_id, COALESCE(currency, 'RUB')
+            FROM transactions
+            WHERE family_id IS NOT NULL AND {where}
+            '''
+
+_DELETE_EMPTY_SQL = '''
+                    DELETE FROM monthly_rollups
+                    WHERE scope = ? AND owner_id = ? AND month = ? AND type = ? AND category = ?
+                      AND member_id = ? AND currency = ? AND count <= 0
+                    '''
+
+# Ограничение SQLite на число параметров в одном запросе
+_CHUNK_SIZE = 400
+
+
+def apply_rollups(cursor, transaction_ids: Iterable[int], sign: int = 1):
+    """Инкрементальное обновление агрегатов для транзакций"""
+    # Вызывается в той же транзакции, что и запись: sign=1 после вставки,
+    # sign=-1 перед удалением (при изменении: -1 до UPDATE и 1 после)
+    ids = list(transaction_ids)
+    for i in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[i:i + _CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        where = f'id IN ({placeholders})'
+        cursor.execute(_UPSERT_SQL.format(where=where), [sign, sign] + chunk + chunk)
+        if sign < 0:
+            # Обнуленные строки удаляем по первичному ключу, а не сканом всей таблицы агрегатов
+            cursor.execute(_KEYS_SQL.format(where=where), chunk + chunk)
+            cursor.executemany(_DELETE_EMPTY_SQL, [tuple(row) for row in cursor.fetchall()])
+
+
+def recreate_rollups(cursor):
+    """Миграция: пересоздание таблицы агрегатов с колонкой member_id"""
+    cursor.execute('DROP TABLE IF EXISTS monthly_rollups')
+    rebuild_rollups(cursor)
+
+
+def rebuild_rollups(cursor):
+    """Полный пересчет агрегатов по всей таблице транзакций"""
+    cursor.execute(CREATE_ROLLUPS_SQL)
+    cursor.execute('DELETE FROM monthly_rollups')
+    cursor.execute(_UPSERT_SQL.format(where='1'), [1, 1])
@@ -0,0 +1,131 @@
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+from database import Database
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+
+# Колонки с небольшим числом различных значений хранятся словарем
+DICTIONARY_COLUMNS = ['type', 'category', 'currency']
+
+# Строк в одном RecordBatch / row group
+BATCH_SIZE = 10000
+
+
+def _pyarrow():
+    """Ленивый импорт pyarrow: нужен только для снимков"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise RuntimeError('pyarrow is required for snapshots: pip install pyarrow') from error
+    return pyarrow
+
+
+def snapshot_schema():
+    """Типизированная схема снимка транзакций"""
+    pa = _pyarrow()
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.timestamp('s')),
+        ('type', pa.dictionary(pa.int8(), pa.string())),
+        ('category', pa.dictionary(pa.int32(), pa.string())),
+        ('amount', pa.float64()),
+        ('currency', pa.dictionary(pa.int8(), pa.string())),
+        ('description', pa.string()),
+        ('user_id', pa.int64()),
+        ('family_id', pa.int64()),
+    ])
+
+
+def iter_record_batches(rows: Iterable[Dict], batch_size: int = BATCH_SIZE) -> Iterator:
+    """Преобразование потока строк в RecordBatch'и фиксированного размера"""
+    pa = _pyarrow()
+    schema = snapshot_schema()
+    columns: Dict[str, List] = {field.name: [] for field in schema}
+
+    def flush():
+        arrays = []
+        for field in schema:
+            values = columns[field.name]
+            if pa.types.is_dictionary(field.type):
+                array = pa.array(values, type=pa.string()).dictionary_encode()
+                arrays.append(array.cast(field.type))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+            values.clear()
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    count = 0
+    for row in rows:
+        for field in schema:
+            value = row.get(field.name)
+            if field.name == 'date' and value is not None:
+                value = datetime.fromisoformat(value)
+            columns[field.name].append(value)
+        count += 1
+        if count % batch_size == 0:
+            yield flush()
+
+    if count % batch_size or count == 0:
+        yield flush()
+
+
+def snapshot_path(scope: str, owner_id: int, fmt: str) -> str:
+    """Путь к файлу снимка в SNAPSHOT_DIR"""
+    extension = 'parquet' if fmt == 'parquet' else 'arrow'
+    return os.path.join(SNAPSHOT_DIR, f'{scope}_{owner_id}.{extension}')
+
+
+def write_snapshot(db: Database, path: str = None, user_id: int = None, family_id: int = None,
+                   fmt: str = 'parquet', start: str = None, end: str = None) -> Dict:
+    """Снимок транзакций пользователя или семьи в Parquet или Arrow IPC"""
+    pa = _pyarrow()
+    scope, owner_id = ('family', family_id) if family_id is not None else ('user', user_id)
+    path = path or snapshot_path(scope, owner_id, fmt)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    rows = db.iter_transactions(user_id=user_id, family_id=family_id, start=start, end=end)
+    batches = iter_record_batches(rows)
+    tmp_path = f'{path}.tmp'
+    count = 0
+
+    if fmt == 'parquet':
+        # Parquet пишется потоково по row group; словарное кодирование делает сам формат
+        with pa.parquet.ParquetWriter(tmp_path, snapshot_schema(), compression='zstd',
+                                      use_dictionary=DICTIONARY_COLUMNS) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                count += batch.num_rows
+    else:
+        # В IPC-файле словарь один на весь файл, поэтому батчи объединяются перед записью
+        table = pa.Table.from_batches(list(batches), schema=snapshot_schema()).unify_dictionaries()
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=BATCH_SIZE)
+        count = table.num_rows
+
+    os.replace(tmp_path, path)
+    return {
+        'path': path,
+        'format': fmt,
+        'rows': count,
+        'bytes': os.path.getsize(path)
+    }
+
+
+def load_snapshot(path: str):
+    """Загрузка снимка через memory map: Arrow IPC читается без копирования"""
+    pa = _pyarrow()
+    if path.endswith('.parquet'):
+        return pa.parquet.read_table(path, memory_map=True, read_dictionary=DICTIONARY_COLUMNS)
+
+    source = pa.memory_map(path, 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def load_snapshot_frame(path: str):
+    """Снимок в виде pandas.DataFrame (словарные колонки становятся category)"""
+    return load_snapshot(path).to_pandas()
@@ -0,0 +1,89 @@
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Отсчет от импорта этого модуля: он импортируется первым в app.py и bot.py
+BOOT_STARTED = time.perf_counter()
+
+_steps: List[Dict] = []
+_lazy: Dict[str, Dict] = {}
+_ready_at = None
+_lock = threading.Lock()
+
+
+@contextmanager
+def step(name: str):
+    """Замер этапа запуска: время и число загруженных модулей"""
+    modules = len(sys.modules)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _steps.append({
+                'name': name,
+                'ms': round((time.perf_counter() - started) * 1000, 1),
+                'modules': len(sys.modules) - modules,
+            })
+
+
+def ready(log: bool = True):
+    """Отметка о готовности процесса принимать запросы"""
+    global _ready_at
+    _ready_at = time.perf_counter()
+    if log:
+        breakdown = ', '.join(f"{item['name']} {item['ms']:.0f} ms" for item in _steps)
+        logger.info(f"Started in {(_ready_at - BOOT_STARTED) * 1000:.0f} ms ({breakdown})")
+
+
+def report() -> Dict:
+    """Разбивка времени запуска и отложенных загрузок для /health"""
+    with _lock:
+        return {
+            'boot_ms': round((_ready_at - BOOT_STARTED) * 1000, 1) if _ready_at else None,
+            'steps': list(_steps),
+            'lazy': {name: dict(item) for name, item in _lazy.items()},
+        }
+
+
+class Lazy:
+    """Объект, который создается при первом обращении (тяжелые модули грузятся не при старте)"""
+
+    def __init__(self, name: str, factory: Callable):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        with _lock:
+            _lazy[name] = {'loaded': False, 'ms': None, 'modules': None}
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    modules = len(sys.modules)
+                    started = time.perf_counter()
+                    value = self._factory()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with _lock:
+                        _lazy[self.name] = {'loaded': True, 'ms': round(elapsed, 1),
+                                            'modules': len(sys.modules) - modules}
+                    logger.info(f"Loaded {self.name} on first use in {elapsed:.0f} ms")
+                    self._value = value
+        return self._value
+
+    def preload(self):
+        """Фоновая загрузка после старта: первый запрос не ждет импорта"""
+        threading.Thread(target=self.get, name=f'preload-{self.name}', daemon=True).start()
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
@@ -3,10 +3,15 @@ class FinanceAPI {
     constructor(baseURL = '') {
         this.baseURL = baseURL;
         this.userId = localStorage.getItem('user_id');
+        // Последние ответы GET с ETag: при 304 сервер не пересчитывает отчет, тело берем отсюда
+        this.etagCache = new Map();
+        this.etagCacheSize = 50;
     }
 
     async request(endpoint, options = {}) {
         const url = `${this.baseURL}${endpoint}`;
+        const method = (options.method || 'GET').toUpperCase();
+        const cached = method === 'GET' ? this.etagCache.get(url) : undefined;
 
         const defaultOptions = {
             headers: {
@@ -20,18 +25,32 @@ class FinanceAPI {
             ...options,
             headers: {
                 ...defaultOptions.headers,
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
                 ...options.headers
             }
         };
+        if (method === 'GET') {
+            // Условный запрос делаем сами: 304 должен дойти до кода, а не подмениться HTTP-кэшем браузера
+            config.cache = 'no-store';
+        }
 
         try {
             const response = await fetch(url, config);
 
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
 
-            return await response.json();
+            const data = await response.json();
+            const etag = response.headers.get('ETag');
+            if (method === 'GET' && etag) {
+                this.rememberResponse(url, etag, data);
+            }
+            return data;
 
         } catch (error) {
             console.error(`API Error (${endpoint}):`, error);
@@ -39,32 +58,54 @@ class FinanceAPI {
         }
     }
 
+    rememberResponse(url, etag, data) {
+        this.etagCache.delete(url);
+        this.etagCache.set(url, { etag, data });
+        if (this.etagCache.size > this.etagCacheSize) {
+            this.etagCache.delete(this.etagCache.keys().next().value);
+        }
+    }
+
     // Транзакции
     async getTransactions(params = {}) {
         const query = new URLSearchParams({
-            user_id: this.userId,
+            telegram_id: this.userId,
             ...params
         }).toString();
 
         return this.request(`/api/transactions?${query}`);
     }
 
-    async addTransaction(transactionData) {
+    // Один ключ на операцию: повторная отправка после таймаута вернет уже созданную транзакцию
+    async addTransaction(transactionData, idempotencyKey = FinanceAPI.newIdempotencyKey()) {
         return this.request('/api/transactions', {
             method: 'POST',
+            headers: { 'Idempotency-Key': idempotencyKey },
             body: JSON.stringify(transactionData)
         });
     }
 
+    static newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
     async deleteTransaction(transactionId) {
-        return this.request(`/api/transactions/${transactionId}`, {
+        return this.request(`/api/transactions/${transactionId}?telegram_id=${this.userId}`, {
             method: 'DELETE'
         });
     }
 
     // Отчеты
-    async getMonthlyReport() {
-        return this.request(`/api/reports/monthly?user_id=${this.userId}`);
+    async getMonthlyReport(params = {}) {
+        const query = new URLSearchParams({
+            telegram_id: this.userId,
+            ...params
+        }).toString();
+
+        return this.request(`/api/reports/monthly?${query}`);
     }
 
     async getCategoryReport(startDate, endDate) {
@@ -111,12 +152,12 @@ class FinanceAPI {
     }
 
     // Синхронизация
-    async sync(lastSync) {
+    async sync(cursor = null) {
         return this.request('/api/sync', {
             method: 'POST',
             body: JSON.stringify({
-                user_id: this.userId,
-                last_sync: lastSync
+                telegram_id: this.userId,
+                cursor: cursor
             })
         });
     }
@@ -99,8 +99,8 @@ class FamilyFinanceApp {
     async loadBalance() {
         try {
             // Запрос к API для получения баланса
-            const response = await fetch(`/api/reports/monthly?user_id=${this.userId}`);
-            const data = await response.json();
+            // Без изменений сервер отвечает 304, financeAPI возвращает прошлый ответ
+            const data = await window.financeAPI.getMonthlyReport({ telegram_id: this.userId });
 
             // Обновление UI
             document.getElementById('totalBalance').textContent = `${data.balance.toLocaleString('ru-RU')} ₽`;
@@ -120,8 +120,8 @@ class FamilyFinanceApp {
 
     async loadRecentTransactions(limit = 10) {
         try {
-            const response = await fetch(`/api/transactions?user_id=${this.userId}&limit=${limit}`);
-            this.transactions = await response.json();
+            const page = await window.financeAPI.getTransactions({ telegram_id: this.userId, limit });
+            this.transactions = page.transactions;
 
             this.renderTransactions(this.transactions, 'recentTransactions');
         } catch (error) {
@@ -321,6 +321,7 @@ class FamilyFinanceApp {
     showTransactionModal(type = 'income') {
         const modal = document.getElementById('transactionModal');
         modal.classList.add('active');
+        this.pendingTransactionKey = null;
 
         // Устанавливаем тип
         this.setTransactionType(type);
@@ -395,11 +396,15 @@ class FamilyFinanceApp {
                 throw new Error('Выберите категорию');
             }
 
+            // Ключ живет до успешного сохранения: повторное нажатие после ошибки сети не создаст дубль
+            this.pendingTransactionKey = this.pendingTransactionKey || FinanceAPI.newIdempotencyKey();
+
             // Отправка на сервер
             const response = await fetch('/api/transactions', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': this.pendingTransactionKey
                 },
                 body: JSON.stringify(transactionData)
             });
@@ -407,6 +412,7 @@ class FamilyFinanceApp {
             const result = await response.json();
 
             if (result.success) {
+                this.pendingTransactionKey = null;
                 this.showNotification('Транзакция сохранена!', 'success');
                 this.hideTransactionModal();
 
@@ -440,18 +446,36 @@ class FamilyFinanceApp {
         const type = document.getElementById('filterType').value;
         const category = document.getElementById('filterCategory').value;
         const date = document.getElementById('filterDate').value;
+        const search = document.getElementById('filterSearch')?.value;
+
+        // Фильтры применяются на сервере, дальнейшие страницы — по курсору
+        const params = new URLSearchParams({ telegram_id: this.userId, limit: 50 });
+        if (type !== 'all') params.append('type', type);
+        if (category !== 'all') params.append('category', category);
+        if (date) params.append('date', date);
+        if (search) params.append('search', search);
 
+        this.transactionFilters = params;
+        this.filteredTransactions = [];
+        await this.loadMoreTransactions();
+    }
+
+    async loadMoreTransactions(cursor = null) {
         try {
-            let url = `/api/transactions?user_id=${this.userId}`;
+            const params = new URLSearchParams(this.transactionFilters);
+            if (cursor) params.append('cursor', cursor);
 
-            if (type !== 'all') url += `&type=${type}`;
-            if (category !== 'all') url += `&category=${category}`;
-            if (date) url += `&date=${date}`;
+            const response = await fetch(`/api/transactions?${params}`);
+            const page = await response.json();
 
-            const response = await fetch(url);
-            const transactions = await response.json();
+            this.filteredTransactions = this.filteredTransactions.concat(page.transactions);
+            this.nextTransactionsCursor = page.next_cursor;
+            this.renderTransactions(this.filteredTransactions, 'transactionsList');
 
-            this.renderTransactions(transactions, 'transactionsList');
+            const loadMoreButton = document.getElementById('loadMoreTransactions');
+            if (loadMoreButton) {
+                loadMoreButton.style.display = page.next_cursor ? '' : 'none';
+            }
 
         } catch (error) {
             console.error('Ошибка фильтрации:', error);
@@ -494,48 +518,93 @@ class FamilyFinanceApp {
     }
 
     startSync() {
-        // Периодическая синхронизация каждые 30 секунд
-        setInterval(() => {
-            this.syncData();
-        }, 30000);
-
         // Первая синхронизация
         this.syncData();
+
+        // Push-канал: сервер сообщает об изменениях, опрос остается редким запасным вариантом
+        if (window.EventSource) {
+            this.startEventStream();
+        } else {
+            this.startPolling(30000);
+        }
     }
 
-    async syncData() {
-        try {
-            // Обновляем статус синхронизации
-            this.updateSyncStatus('syncing');
+    startPolling(interval) {
+        if (this.syncTimer) {
+            clearInterval(this.syncTimer);
+        }
+        this.syncTimer = setInterval(() => {
+            this.syncData();
+        }, interval);
+    }
 
-            const lastSync = localStorage.getItem('last_sync') || new Date().toISOString();
+    startEventStream() {
+        const source = new EventSource(`/api/events?telegram_id=${this.userId}`);
 
-            const response = await fetch('/api/sync', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    user_id: this.userId,
-                    last_sync: lastSync
-                })
-            });
+        source.addEventListener('change', () => {
+            this.syncData();
+        });
 
-            const data = await response.json();
+        source.onopen = () => {
+            // Изменения из других процессов (бот) подхватываются редким опросом
+            this.startPolling(120000);
+        };
 
-            if (data.success && data.updates) {
-                // Обрабатываем обновления
-                this.processUpdates(data.updates);
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                // Сервер отказал (лимит подключений) — возвращаемся к опросу
+                this.startPolling(30000);
+            }
+        };
 
-                // Обновляем время последней синхронизации
-                localStorage.setItem('last_sync', data.server_time);
+        this.eventSource = source;
+    }
 
-                // Обновляем статус
-                this.updateSyncStatus('synced');
+    async syncData() {
+        try {
+            // Обновляем статус синхронизации
+            this.updateSyncStatus('syncing');
 
-                console.log('Синхронизация завершена');
+            // Курсор журнала изменений на сервере (null при первом запуске)
+            let cursor = localStorage.getItem('sync_cursor');
+            const updates = { transactions: [], deleted: [] };
+            let hasMore = true;
+
+            while (hasMore) {
+                const response = await fetch('/api/sync', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({
+                        telegram_id: this.userId,
+                        cursor: cursor === null ? null : parseInt(cursor)
+                    })
+                });
+
+                const data = await response.json();
+                if (!data.success) {
+                    throw new Error(data.error || 'Ошибка синхронизации');
+                }
+
+                updates.transactions.push(...data.updates.transactions);
+                updates.deleted.push(...data.updates.deleted);
+                cursor = String(data.cursor);
+                hasMore = data.has_more;
+
+                // Сохраняем позицию после каждой страницы
+                localStorage.setItem('sync_cursor', cursor);
+                localStorage.setItem('last_sync', data.server_time);
             }
 
+            // Обрабатываем обновления
+            this.processUpdates(updates);
+
+            // Обновляем статус
+            this.updateSyncStatus('synced');
+
+            console.log('Синхронизация завершена');
+
         } catch (error) {
             console.error('Ошибка синхронизации:', error);
             this.updateSyncStatus('error');
@@ -564,6 +633,8 @@ class FamilyFinanceApp {
         if (updates.transactions && updates.transactions.length > 0) {
             this.showNotification(`Получено ${updates.transactions.length} новых транзакций`, 'info');
             this.loadDashboardData();
+        } else if (updates.deleted && updates.deleted.length > 0) {
+            this.loadDashboardData();
         }
 
         if (updates.family_changes) {
@@ -581,7 +652,11 @@ class FamilyFinanceApp {
 
     async loadCharts() {
         // Этот метод будет реализован в charts.js
-        if (window.FinanceCharts) {
+        if (window.FinanceCharts && window.FinanceCharts.preferServerImages()) {
+            const params = new URLSearchParams({ telegram_id: this.userId, format: 'svg' });
+            window.FinanceCharts.showServerChart('expenseChart', `/api/charts/categories?${params}`);
+            window.FinanceCharts.showServerChart('balanceChart', `/api/charts/trend?${params}`);
+        } else if (window.FinanceCharts) {
             const chartData = await this.loadChartData();
             window.FinanceCharts.initExpenseChart(chartData);
         }
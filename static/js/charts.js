@@ -187,6 +187,34 @@ class FinanceCharts {
         });
     }
 
+    // Без Chart.js (CDN недоступен) или на слабом устройстве графики рисует сервер
+    static preferServerImages() {
+        if (typeof Chart === 'undefined') return true;
+        const memory = navigator.deviceMemory;
+        const cores = navigator.hardwareConcurrency;
+        return Boolean((memory && memory <= 2) || (cores && cores <= 2));
+    }
+
+    static showServerChart(elementId, url) {
+        const element = document.getElementById(elementId);
+        if (!element) return;
+
+        if (element.tagName === 'IMG') {
+            element.src = url;
+            return;
+        }
+
+        const image = document.createElement('img');
+        image.id = elementId;
+        image.src = url;
+        image.alt = '';
+        image.loading = 'lazy';
+        image.style.width = '100%';
+        image.style.height = '100%';
+        image.style.objectFit = 'contain';
+        element.replaceWith(image);
+    }
+
     static generateColors(count) {
         const baseColors = [
             '#4cc9f0', '#7209b7', '#f8961e', '#f72585',
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+INVALID = 'invalid'
+
+
+class UpdateQueue:
+    """Ограниченная очередь входящих обновлений Telegram с дедупликацией по update_id"""
+
+    def __init__(self, max_size: int = 1000, dedupe_size: int = 10000, db: Database = None):
+        self._queue = queue.Queue(maxsize=max_size)
+        self._recent = OrderedDict()
+        # update_id, взятые обработчиками через get и еще не отмеченные done
+        self._in_flight = set()
+        self._dedupe_size = dedupe_size
+        self._lock = threading.Lock()
+        # Необязательный журнал в SQLite: необработанные обновления переживают перезапуск
+        self.db = db
+        self._stats = {
+            'received': 0,
+            'queued': 0,
+            'duplicates': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0,
+            'lag_total': 0.0,
+            'lag_max': 0.0,
+            'lag_last': 0.0,
+        }
+
+    def _remember(self, update_id: int) -> bool:
+        """Запоминание update_id; False, если он уже встречался"""
+        if update_id in self._recent:
+            return False
+        self._recent[update_id] = True
+        while len(self._recent) > self._dedupe_size:
+            self._recent.popitem(last=False)
+        return True
+
+    def put(self, update: Dict) -> str:
+        """Постановка обновления в очередь; возвращает QUEUED, DUPLICATE, FULL или INVALID"""
+        update_id = update.get('update_id') if isinstance(update, dict) else None
+        if not isinstance(update_id, int):
+            return INVALID
+
+        with self._lock:
+            self._stats['received'] += 1
+            if not self._remember(update_id):
+                self._stats['duplicates'] += 1
+                return DUPLICATE
+            if self._queue.full():
+                # Telegram повторит доставку позже, поэтому id забываем
+                self._recent.pop(update_id, None)
+                self._stats['rejected'] += 1
+                return FULL
+
+        received_at = time.time()
+        if self.db is not None and not self._spool(update_id, update, received_at):
+            with self._lock:
+                self._stats['duplicates'] += 1
+            return DUPLICATE
+
+        try:
+            self._queue.put_nowait((update_id, update, received_at))
+        except queue.Full:
+            with self._lock:
+                self._recent.pop(update_id, None)
+                self._stats['rejected'] += 1
+            self._unspool(update_id)
+            return FULL
+
+        with self._lock:
+            self._stats['queued'] += 1
+        return QUEUED
+
+    def get(self, timeout: float = 1.0):
+        """Следующее обновление (update_id, update, received_at) или None по таймауту"""
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        lag = time.time() - item[2]
+        with self._lock:
+            self._in_flight.add(item[0])
+            self._stats['lag_total'] += lag
+            self._stats['lag_max'] = max(self._stats['lag_max'], lag)
+            self._stats['lag_last'] = lag
+        return item
+
+    def done(self, update_id: int, success: bool = True):
+        """Отметка об обработке обновления"""
+        with self._lock:
+            self._in_flight.discard(update_id)
+            self._stats['processed' if success else 'failed'] += 1
+        self._unspool(update_id)
+
+    def _spool(self, update_id: int, update: Dict, received_at: float) -> bool:
+        with self.db.get_connection() as conn:
+            cursor = conn.execute('''
+                                  INSERT OR IGNORE INTO webhook_spool (update_id, payload, received_at)
+                                  VALUES (?, ?, ?)
+                                  ''', (update_id, json.dumps(update), received_at))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def _unspool(self, update_id: int):
+        if self.db is None:
+            return
+        with self.db.get_connection() as conn:
+            conn.execute('DELETE FROM webhook_spool WHERE update_id = ?', (update_id,))
+            conn.commit()
+
+    def restore(self) -> int:
+        """Возврат в очередь обновлений, не обработанных до перезапуска"""
+        # Обработчики прежнего запуска диспетчера остановлены: взятое ими уже не будет отмечено done
+        with self._lock:
+            in_flight, self._in_flight = self._in_flight, set()
+        if self.db is None:
+            return 0
+
+        with self.db.get_connection() as conn:
+            rows = conn.execute('''
+                                SELECT update_id, payload, received_at
+                                FROM webhook_spool
+                                ORDER BY update_id
+                                ''').fetchall()
+
+        restored = 0
+        for row in rows:
+            with self._lock:
+                # Известный id пропускается, только если обновление еще ждет в очереди
+                if not self._remember(row['update_id']) and row['update_id'] not in in_flight:
+                    continue
+            try:
+                self._queue.put_nowait((row['update_id'], json.loads(row['payload']), row['received_at']))
+            except queue.Full:
+                break
+            restored += 1
+        return restored
+
+    def stats(self) -> Dict:
+        """Глубина очереди и задержка обработки"""
+        with self._lock:
+            stats = dict(self._stats)
+        handled = stats['processed'] + stats['failed'] or 1
+        stats['depth'] = self._queue.qsize()
+        stats['max_size'] = self._queue.maxsize
+        stats['avg_lag_ms'] = round(stats.pop('lag_total') / handled * 1000, 1)
+        stats['max_lag_ms'] = round(stats.pop('lag_max') * 1000, 1)
+        stats['last_lag_ms'] = round(stats.pop('lag_last') * 1000, 1)
+        stats['durable'] = self.db is not None
+        return stats
+
+
+class WebhookDispatcher:
+    """Пул обработчиков: фоновый поток с event loop передает обновления в Application бота"""
+
+    def __init__(self, updates: UpdateQueue, application_factory: Callable, workers: int = 4,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.updates = updates
+        self.application_factory = application_factory
+        self.workers = workers
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.application = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._state = 'stopped'
+        self._restarts = 0
+        self._last_error = None
+
+    def start(self):
+        """Запуск фонового потока обработки"""
+        if self._thread is not None:
+            return
+        self._set_state('starting')
+        self._thread = threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def alive(self) -> bool:
+        """Поток работает и не ждет повторного запуска после сбоя"""
+        return self._thread is not None and self._thread.is_alive() and self._state != 'failed'
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self._state,
+                'alive': self.alive,
+                'restarts': self._restarts,
+                'last_error': self._last_error,
+            }
+
+    def _set_state(self, state: str, error: str = None):
+        with self._lock:
+            self._state = state
+            if error is not None:
+                self._last_error = error
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        delay = self.retry_delay
+        try:
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                try:
+                    self._loop.run_until_complete(self._main())
+                except Exception as error:
+                    self._set_state('failed', f'{type(error).__name__}: {error}')
+                    # Долго проработавший диспетчер перезапускается быстро, повторные сбои — с растущей паузой
+                    if time.monotonic() - started > self.max_retry_delay:
+                        delay = self.retry_delay
+                    logger.exception(f"Webhook dispatcher failed, restarting in {delay:.0f}s")
+                    if self._stopping.wait(delay):
+                        break
+                    delay = min(delay * 2, self.max_retry_delay)
+                    with self._lock:
+                        self._restarts += 1
+                        self._state = 'starting'
+        finally:
+            self._set_state('stopped')
+            self._loop.close()
+
+    async def _main(self):
+        from telegram import Update
+
+        self.application = self.application_factory()
+        await self.application.initialize()
+
+        async def worker():
+            loop = asyncio.get_running_loop()
+            while not self._stopping.is_set():
+                item = await loop.run_in_executor(None, self.updates.get, 1.0)
+                if item is None:
+                    continue
+
+                update_id, payload, _ = item
+                try:
+                    update = Update.de_json(payload, self.application.bot)
+                    await self.application.process_update(update)
+                except Exception:
+                    logger.exception(f"Failed to process update {update_id}")
+                    self.updates.done(update_id, success=False)
+                else:
+                    self.updates.done(update_id)
+
+        workers = []
+        try:
+            restored = self.updates.restore()
+            if restored:
+                logger.info(f"Restored {restored} spooled webhook updates")
+            self._set_state('running')
+            workers = [asyncio.ensure_future(worker()) for _ in range(self.workers)]
+            await asyncio.gather(*workers)
+        finally:
+            # При сбое одного обработчика остальные не должны продолжить работу в следующем запуске
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.application.shutdown()